@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g
 from flask_cors import CORS
 import os
 from config.settings import Config
@@ -6,13 +6,21 @@ from routes.upload_routes import upload_bp
 from routes.processing_routes import processing_bp
 from routes.advanced_routes import advanced_bp
 from routes.download import download_bp
+from routes.metrics_routes import metrics_bp
+from routes.admin_routes import admin_bp
+from routes.stats_routes import stats_bp
+from routes.similarity_routes import similarity_bp
+from services.lineage_service import LineageService
+from services.admission_service import AdmissionService
+from utils.lifecycle import on_shutdown
+from utils import metrics, profiling
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
     # CORS pour ton frontend
-    CORS(app, resources={r"/api/*": {"origins": "http://localhost:5173"}})
+    CORS(app, resources={r"/api/*": {"origins": Config.CORS_ORIGINS}})
 
     os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(Config.PROCESSED_FOLDER, exist_ok=True)
@@ -22,12 +30,48 @@ def create_app():
     app.register_blueprint(processing_bp, url_prefix='/api')
     app.register_blueprint(advanced_bp, url_prefix='/api')
     app.register_blueprint(download_bp, url_prefix='/api')
+    app.register_blueprint(metrics_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
+    app.register_blueprint(stats_bp, url_prefix='/api')
+    app.register_blueprint(similarity_bp, url_prefix='/api')
+
+    # Latence par route (gabarit de l'URL, pas le chemin : cardinalité bornée)
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = metrics.request_started()
+        # Profilage : ?profile=1 (administration) ou échantillonnage
+        g.profile = profiling.begin(request, app.debug)
+
+    @app.after_request
+    def record_response_status(response):
+        g.metrics_status = response.status_code
+        profile = g.pop('profile', None)
+        if profile is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            response.headers.update(profile.finish(route, request.method))
+        return response
+
+    @app.teardown_request
+    def record_request_metrics(exc):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.finish(request.path, request.method)  # réponse non produite
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.request_finished(start, route, request.method, g.pop('metrics_status', 500))
+
+    # Quota des images traitées (éviction LRU en arrière-plan)
+    LineageService.start_collector()
+    on_shutdown(LineageService.stop_collector)
 
     # Endpoint test/health
     @app.route('/api/health')
     def health_check():
         return jsonify({
             'status': 'healthy',
+            'storage_backend': Config.STORAGE_BACKEND,
+            'admission': AdmissionService.snapshot(),
             'upload_folder': os.path.exists(Config.UPLOAD_FOLDER),
             'processed_folder': os.path.exists(Config.PROCESSED_FOLDER)
         })
@@ -0,0 +1,46 @@
+"""Variante ASGI de l'API : routes asynchrones + application Flask pour le reste.
+
+Usage (depuis backend/) : python asgi_app.py
+ou : uvicorn asgi_app:app --workers 4
+
+Les routes de transfert et de traitement (routes/async_routes.py) tournent
+sur la boucle d'événements et déportent le travail bloquant dans des pools
+partagés ; les autres endpoints sont servis par create_app() via a2wsgi.
+"""
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount
+from config.settings import Config
+from app import create_app
+from routes.async_routes import routes
+from utils import lifecycle
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Attendre les traitements et ingestions en cours avant de quitter
+    lifecycle.shutdown()
+
+
+def create_asgi_app():
+    flask_app = create_app()
+    # Serveur de production : sans ADMIN_TOKEN, le mode debug ouvrirait l'administration
+    flask_app.config['DEBUG'] = False
+    return Starlette(
+        routes=routes + [Mount('/', app=WSGIMiddleware(flask_app, workers=Config.SERVER_THREADS))],
+        middleware=[Middleware(CORSMiddleware, allow_origins=Config.CORS_ORIGINS,
+                               allow_methods=['*'], allow_headers=['*'])],
+        lifespan=lifespan
+    )
+
+
+app = create_asgi_app()
+
+if __name__ == '__main__':
+    import uvicorn
+    host, port = Config.SERVER_BIND.rsplit(':', 1)
+    uvicorn.run('asgi_app:app', host=host, port=int(port), workers=Config.SERVER_WORKERS)
@@ -0,0 +1,132 @@
+"""Traitement par lot (BatchService) contre traitement image par image.
+
+Usage (depuis backend/) :
+
+    python -m benchmarks.batch                              # 512 images 256x256, 3 canaux
+    python -m benchmarks.batch --shape 64x64 --count 4096   # petites images : surcoût par image dominant
+    python -m benchmarks.batch --only grayscale,flip,blur_gaussian --repeat 5
+
+Pour chaque opération de BatchService (paramètres par défaut du registre),
+mesure le temps par image de ``apply_file_operation`` appelé en boucle, puis
+de ``BatchService.apply`` sur le lot déjà empilé, et l'empilement lui-même
+(``group``). Vérifie aussi que les deux résultats sont identiques.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+from config.settings import Config
+from services.batch_service import BatchService
+from services.operations_service import OperationsService
+from services.processing_service import ProcessingService
+from benchmarks.operations import default_params, synthetic_image
+
+DEFAULT_OUTPUT = os.path.join(Config.CACHE_FOLDER, 'benchmarks', 'batch.json')
+
+
+def _timed(func, repeat):
+    func()  # chauffe
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _single(operation):
+    if operation == 'contrast_brightness':
+        return ProcessingService.apply_contrast_brightness
+    return lambda img, params: ProcessingService.apply_file_operation(img, operation, params)
+
+
+def run(shape=(256, 256), count=512, channels=3, repeat=3, only=None, log=print):
+    height, width = shape
+    # Images synthétiques 4:3 assez grandes pour y découper height x width
+    megapixels = max(height ** 2 / 0.75, width ** 2 * 0.75) * 1.01 / 1e6
+    # Quelques images distinctes répétées : assez pour ne pas tout servir depuis le cache CPU
+    sources = [synthetic_image(megapixels, channels, 'uint8', seed=i)[:height, :width] for i in range(8)]
+    images = [np.ascontiguousarray(sources[i % len(sources)]) for i in range(count)]
+    registry = OperationsService.get_available_operations()
+
+    results = []
+    for operation in sorted(BatchService.OPERATIONS):
+        if only and operation not in only:
+            continue
+        params = default_params(operation) if operation in registry else {'contrast': 1.2, 'brightness': 10}
+        single = _single(operation)
+        batch = BatchService.group(images)[0][1]
+        entry = {'operation': operation, 'params': params}
+        try:
+            per_image = _timed(lambda: [single(img, params) for img in images], repeat)
+            batched = _timed(lambda: BatchService.apply(batch, operation, params), repeat)
+        except Exception as e:
+            entry.update(status='unsupported', reason=str(e)[:200])
+            results.append(entry)
+            continue
+        stacking = _timed(lambda: BatchService.group(images), repeat)
+        expected = [single(img, params) for img in images[:len(sources)]]
+        actual = BatchService.apply(batch[:len(sources)], operation, params)
+        identical = all(np.array_equal(a, b) for a, b in zip(expected, actual))
+        entry.update(status='ok', us_per_image=round(per_image / count * 1e6, 2),
+                     us_per_image_batch=round(batched / count * 1e6, 2),
+                     us_per_image_stack=round(stacking / count * 1e6, 2),
+                     speedup=round(per_image / batched, 2) if batched else None, identical=identical)
+        log(f"{operation:20s} {entry['us_per_image']:9.1f} us/image -> {entry['us_per_image_batch']:9.1f} us/image "
+            f"(x{entry['speedup']:<5}) empilement {entry['us_per_image_stack']:6.1f} us/image"
+            f"{'' if identical else '  *** RÉSULTATS DIFFÉRENTS ***'}")
+        results.append(entry)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'shape': [height, width, channels],
+            'count': count,
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'opencv_threads': cv2.getNumThreads(),
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--shape', default='256x256', help='HxW des images')
+    parser.add_argument('--count', type=int, default=512, help="nombre d'images du lot")
+    parser.add_argument('--channels', type=int, default=3, choices=(1, 3))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', type=lambda v: {part for part in v.split(',') if part})
+    parser.add_argument('--threads', type=int, help='cv2.setNumThreads (défaut : OpenCV)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+
+    try:
+        shape = tuple(int(part) for part in args.shape.lower().split('x'))
+    except ValueError:
+        shape = ()
+    if len(shape) != 2:
+        parser.error(f"--shape invalide: {args.shape} (attendu HxW)")
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    report = run(shape, args.count, args.channels, args.repeat, args.only)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n{len(report['results'])} opérations mesurées, résultats dans {args.output}")
+    different = [r['operation'] for r in report['results'] if r['status'] == 'ok' and not r['identical']]
+    if different:
+        print(f"Résultats différents du traitement image par image : {', '.join(different)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""Tests différentiels : un moteur candidat doit reproduire le moteur de référence.
+
+Usage (depuis backend/) :
+
+    python -m benchmarks.differential                           # chemin fichier contre calcul en mémoire
+    python -m benchmarks.differential --only blur_gaussian,edge_canny
+    python -m benchmarks.differential --reference process_file --candidate mon_moteur
+
+Un moteur est une fonction ``(image, opération, paramètres) -> image``.
+Intégrés :
+
+- ``process_file`` : ProcessingService._apply_operation (PNG sans perte, chemin de /api/process)
+- ``process``      : le même calcul sur une image en mémoire (trames des animations)
+- ``preview``      : ProcessingService.apply_operation (aperçus, presets)
+
+Un chemin optimisé (fusion de LUT, tuilage, filtres séparables, décodage
+réduit) s'enregistre avec ``register_engine`` puis est comparé à la
+référence. Il n'est activé qu'une fois la série sans échec.
+
+Deux séries :
+
+- chaque opération du registre (paramètres par défaut et variantes) :
+  référence contre candidat, égalité exacte sauf tolérance déclarée ;
+- ``EQUIVALENTS`` : les opérations de l'aperçu contre leur équivalent de
+  /api/process. Les divergences connues (``known``) sont signalées sans
+  faire échouer la série.
+
+Le corpus est généré (graine fixe) : plusieurs formes, dont des dimensions
+impaires et dégénérées, en 1, 3 et 4 canaux.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+import cv2
+import numpy as np
+from config.settings import Config
+from services.operations_service import OperationsService
+from services.batch_service import BatchService
+from services.processing_service import ProcessingService
+from benchmarks.operations import default_params
+
+DEFAULT_OUTPUT = os.path.join(Config.CACHE_FOLDER, 'benchmarks', 'differential.json')
+DEFAULT_SHAPES = ((64, 48), (131, 257), (1, 7), (480, 640))
+DEFAULT_CHANNELS = (1, 3, 4)
+EXACT = {'max_abs': 0}
+
+# Variantes de paramètres en plus des valeurs par défaut du registre
+PARAM_VARIANTS = {
+    'threshold': [{'type': 'adaptive'}, {'threshold': 0}],
+    'blur_gaussian': [{'kernel_size': 3}, {'kernel_size': 15}],
+    'blur_median': [{'kernel_size': 3}, {'kernel_size': 7}],
+    'blur_average': [{'kernel_size': 3}, {'kernel_size': 9}],
+    'edge_sobel': [{'kernel_size': 5}, {'kernel_size': 7}],
+    'edge_prewitt': [{'kernel_size': 5}, {'kernel_size': 7}],
+    'edge_laplacian': [{'kernel_size': 5}, {'kernel_size': 7}],
+    'resize': [{'width': 37, 'height': 91}],
+    'rotate': [{'angle': 45}, {'angle': 180}],
+    'flip': [{'direction': 'vertical'}, {'direction': 'both'}],
+    'extract_channel': [{'channel': 'green'}, {'channel': 'blue'}],
+}
+
+# Tolérances par opération (chemin de référence contre candidat), égalité exacte sinon
+TOLERANCES = {}
+
+# Opérations qui décodent la source en niveaux de gris : sur fichier, libpng
+# (cv2.IMREAD_GRAYSCALE) arrondit la luminance autrement que cv2.cvtColor sur
+# une image en mémoire (écart de 1 sur environ la moitié des pixels couleur)
+GRAYSCALE_DECODE = {'threshold', 'edge_canny', 'edge_sobel', 'edge_prewitt', 'edge_laplacian'}
+GRAYSCALE_DECODE_REASON = "niveaux de gris décodés par libpng sur fichier, par cv2.cvtColor en mémoire"
+
+# (nom, opération et paramètres de /api/process, opération et paramètres de l'aperçu, tolérance, divergence connue)
+EQUIVALENTS = [
+    ('grayscale', ('grayscale', {}), ('grayscale', {}), EXACT, None),
+    ('gaussian k5', ('blur_gaussian', {'kernel_size': 5}), ('gaussian_blur', {'kernel': 5}), EXACT, None),
+    ('median k5', ('blur_median', {'kernel_size': 5}), ('median_blur', {'kernel': 5}), EXACT, None),
+    # Le noyau float32 de la première définition de apply_operation est masqué par la seconde
+    ('sharpen', ('sharpen_kernel', {}), ('sharpen', {}), EXACT, None),
+    ('canny défauts', ('edge_canny', {}), ('canny', {}), EXACT,
+     "seuils par défaut 50/150 pour /api/process, 100/200 pour l'aperçu"),
+    ('canny 100/200', ('edge_canny', {'low': 100, 'high': 200}), ('canny', {'threshold1': 100, 'threshold2': 200}),
+     EXACT, None),
+    ('égalisation', ('histogram_eq', {}), ('histogram_equalization', {}), EXACT, None),
+    ('rotate 90', ('rotate', {'angle': 90}), ('rotate', {'angle': 90}), EXACT,
+     "rotation affine recadrée pour /api/process, rotation exacte (et absente de la seconde "
+     "définition de apply_operation) pour l'aperçu"),
+    ('flip horizontal', ('flip', {'direction': 'horizontal'}), ('flip', {'direction': 'horizontal'}), EXACT,
+     "flip absent de la seconde définition de apply_operation"),
+]
+
+
+def corpus(shapes=DEFAULT_SHAPES, channels=DEFAULT_CHANNELS, seed=0):
+    """Images uint8 reproductibles : dégradé, aplats (contours nets) et bruit"""
+    rng = np.random.default_rng(seed)
+    for height, width in shapes:
+        for channel_count in channels:
+            gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :] + np.zeros((height, 1), np.float32)
+            planes = []
+            for c in range(channel_count):
+                plane = np.roll(gradient, c * max(1, width // 5), axis=1) + rng.normal(0, 12, (height, width))
+                for _ in range(3):  # aplats rectangulaires
+                    y, x = rng.integers(0, height), rng.integers(0, width)
+                    plane[y:y + max(1, height // 4), x:x + max(1, width // 4)] = rng.integers(0, 256)
+                planes.append(plane)
+            img = np.clip(planes[0] if channel_count == 1 else np.dstack(planes), 0, 255).astype(np.uint8)
+            yield f"{height}x{width}x{channel_count}", img
+
+
+def as_decoded(img):
+    """Image telle que /api/process la décode (cv2.IMREAD_COLOR d'un PNG) : BGR 3 canaux"""
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
+def _process_file(img, operation, params):
+    tmp_dir = tempfile.mkdtemp(prefix='diff_')
+    try:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        output_path = os.path.join(tmp_dir, 'output.png')
+        cv2.imwrite(input_path, img)
+        if not ProcessingService._apply_operation(input_path, output_path, operation, params):
+            raise ValueError(f"Erreur lors du traitement {operation}")
+        return cv2.imread(output_path, cv2.IMREAD_UNCHANGED)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+ENGINES = {
+    'process_file': _process_file,
+    'process': lambda img, operation, params: ProcessingService.apply_file_operation(
+        as_decoded(img), operation, params),
+    'preview': lambda img, operation, params: ProcessingService.apply_operation(
+        as_decoded(img), operation, params),
+    # Lot d'une image : mêmes chemins de code que les lots de N images de même forme
+    'batch': lambda img, operation, params: BatchService.apply(
+        as_decoded(img)[None], operation, params)[0],
+}
+
+
+def register_engine(name, engine):
+    """Ajoute un moteur candidat : fonction (image, opération, paramètres) -> image"""
+    ENGINES[name] = engine
+    return engine
+
+
+def difference(reference, candidate):
+    """max |écart|, PSNR (dB, inf si identiques) et part des pixels différents"""
+    if reference.ndim != candidate.ndim:
+        # Niveaux de gris sur 1 canal contre 3 canaux identiques : mêmes pixels
+        gray, color = (reference, candidate) if reference.ndim == 2 else (candidate, reference)
+        if color.ndim == 3 and np.array_equal(color, np.repeat(color[:, :, :1], color.shape[2], axis=2)):
+            reference, candidate = gray, color[:, :, 0]
+    if reference.shape != candidate.shape:
+        return {'shape': [list(reference.shape), list(candidate.shape)]}
+    diff = np.abs(reference.astype(np.float64) - candidate.astype(np.float64))
+    max_abs = float(diff.max()) if diff.size else 0.0
+    mse = float(np.mean(diff ** 2)) if diff.size else 0.0
+    return {
+        'max_abs': max_abs,
+        'psnr': math.inf if mse == 0 else round(10 * math.log10(255.0 ** 2 / mse), 2),
+        'mismatch': round(float(np.count_nonzero(diff)) / diff.size, 6) if diff.size else 0.0,
+    }
+
+
+def within(diff, tolerance):
+    """True si l'écart respecte toutes les bornes de la tolérance (max_abs, psnr)"""
+    if 'shape' in diff:
+        return False
+    if 'max_abs' in tolerance and diff['max_abs'] > tolerance['max_abs']:
+        return False
+    if 'psnr' in tolerance and diff['psnr'] < tolerance['psnr']:
+        return False
+    return True
+
+
+def check(reference, candidate, img, tolerance=EXACT):
+    """Compare deux moteurs (nom, opération, paramètres) sur une image, retourne (statut, détail)"""
+    (ref_engine, ref_op, ref_params), (cand_engine, cand_op, cand_params) = reference, candidate
+    try:
+        expected = ENGINES[ref_engine](img, ref_op, dict(ref_params))
+    except Exception as e:
+        return 'unsupported', {'reason': f"référence: {e}"[:200]}
+    try:
+        actual = ENGINES[cand_engine](img, cand_op, dict(cand_params))
+    except Exception as e:
+        return 'fail', {'reason': f"candidat: {e}"[:200]}
+    diff = difference(expected, actual)
+    return ('pass' if within(diff, tolerance) else 'fail'), diff
+
+
+def _decode_difference(operation, reference, candidate):
+    """Divergence connue si un seul des deux moteurs décode le fichier en niveaux de gris"""
+    if operation in GRAYSCALE_DECODE and (reference == 'process_file') != (candidate == 'process_file'):
+        return GRAYSCALE_DECODE_REASON
+    return None
+
+
+def cases(reference, candidate, only=None):
+    """(nom, référence, candidat, tolérance, divergence connue) des deux séries"""
+    for operation in OperationsService.get_available_operations():
+        if only and operation not in only:
+            continue
+        defaults = default_params(operation)
+        for variant in [{}] + PARAM_VARIANTS.get(operation, []):
+            params = {**defaults, **variant}
+            label = operation + (' ' + ','.join(f"{k}={v}" for k, v in variant.items()) if variant else '')
+            yield (label, (reference, operation, params), (candidate, operation, params),
+                   TOLERANCES.get(operation, EXACT), _decode_difference(operation, reference, candidate))
+    for name, (process_op, process_params), (preview_op, preview_params), tolerance, known in EQUIVALENTS:
+        if only and process_op not in only and preview_op not in only:
+            continue
+        known = known or _decode_difference(process_op, reference, 'preview')
+        yield (f"aperçu/{name}", (reference, process_op, process_params), ('preview', preview_op, preview_params),
+               tolerance, known)
+
+
+def run(reference='process_file', candidate='process', shapes=DEFAULT_SHAPES, channels=DEFAULT_CHANNELS,
+        seed=0, only=None, log=print):
+    images = list(corpus(shapes, channels, seed))
+    results = []
+    for label, ref, cand, tolerance, known in cases(reference, candidate, only):
+        outcomes = []
+        for image_name, img in images:
+            status, detail = check(ref, cand, img, tolerance)
+            outcomes.append({'image': image_name, 'status': status, **detail})
+
+        failed = [o for o in outcomes if o['status'] == 'fail']
+        if all(o['status'] == 'unsupported' for o in outcomes):
+            status = 'unsupported'
+        elif failed:
+            status = 'known' if known else 'fail'
+        else:
+            # L'écart de décodage ne se voit pas avec tous les paramètres (seuil 0) : pas résolu pour autant
+            status = 'fixed' if known and known != GRAYSCALE_DECODE_REASON else 'pass'
+        worst = max((o for o in outcomes if 'max_abs' in o), key=lambda o: o['max_abs'], default=None)
+        results.append({'case': label, 'status': status, 'reference': list(ref), 'candidate': list(cand),
+                        'tolerance': tolerance, 'known': known, 'images': outcomes})
+
+        summary = f"{len(failed)}/{len(outcomes)} images en échec" if failed else f"{len(outcomes)} images"
+        if worst is not None and worst['max_abs']:
+            summary += f", écart max {worst['max_abs']:.0f}, PSNR {worst['psnr']} dB"
+        shapes_differ = [o for o in failed if 'shape' in o]
+        if shapes_differ:
+            summary += f", formes {shapes_differ[0]['shape'][0]} / {shapes_differ[0]['shape'][1]}"
+        if status in ('fail', 'known'):
+            reasons = [o['reason'] for o in failed if 'reason' in o]
+            if reasons:
+                summary += f" ({reasons[0]})"
+        log(f"{status.upper():11s} {label:40s} {summary}")
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'reference': reference,
+            'candidate': candidate,
+            'seed': seed,
+            'images': [name for name, _ in images],
+            'opencv': cv2.__version__,
+        },
+        'results': results,
+    }
+
+
+def _shape(value):
+    height, _, width = value.partition('x')
+    return int(height), int(width)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--reference', default='process_file', help=f"moteur de référence ({', '.join(ENGINES)})")
+    parser.add_argument('--candidate', default='process', help='moteur comparé à la référence')
+    parser.add_argument('--shapes', type=lambda v: tuple(_shape(s) for s in v.split(',') if s),
+                        default=DEFAULT_SHAPES, help='hauteurxlargeur, ex: 64x48,131x257')
+    parser.add_argument('--channels', type=lambda v: tuple(int(c) for c in v.split(',') if c),
+                        default=DEFAULT_CHANNELS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', type=lambda v: set(s for s in v.split(',') if s), help='opérations à vérifier')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+    for engine in (args.reference, args.candidate):
+        if engine not in ENGINES:
+            parser.error(f"moteur inconnu: {engine} ({', '.join(ENGINES)})")
+
+    report = run(args.reference, args.candidate, args.shapes, args.channels, args.seed, args.only)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+
+    counts = {}
+    for result in report['results']:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print(f"\n{', '.join(f'{n} {s}' for s, n in sorted(counts.items()))} — rapport : {args.output}")
+    fixed = [r['case'] for r in report['results'] if r['status'] == 'fixed']
+    if fixed:
+        print(f"Divergences connues résolues (à retirer de EQUIVALENTS) : {', '.join(fixed)}")
+    failures = [r['case'] for r in report['results'] if r['status'] == 'fail']
+    if failures:
+        print(f"*** {len(failures)} cas divergent(s) : {', '.join(failures)} ***", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
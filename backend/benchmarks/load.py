@@ -0,0 +1,433 @@
+"""Test de charge de bout en bout de l'API.
+
+Usage (depuis backend/) :
+
+    python -m benchmarks.load                                   # application en processus, mélange 'default'
+    python -m benchmarks.load --concurrency 1,2,4,8,16 --duration 20   # recherche du point de saturation
+    python -m benchmarks.load --mix browse
+    python -m benchmarks.load --mix gallery=5,preview=2,batch=1
+    python -m benchmarks.load --url http://localhost:5000       # serveur démarré (serve.py, asgi_app.py)
+
+En processus, ``create_app()`` est piloté par le client de test Flask (un
+client par thread) sur un dossier temporaire : index, uploads et images
+traitées du projet ne sont pas touchés. Avec ``--url``, les requêtes passent
+par HTTP et le corpus est uploadé sur le serveur visé.
+
+Un corpus synthétique (``--images`` images de ``--megapixels`` MP) est uploadé
+puis traité (grayscale) avant la mesure. Pour chaque niveau de concurrence :
+latences p50/p95/p99 par route, débit, taux d'erreurs et de délestage (503).
+Le point de saturation est le dernier niveau qui augmente encore le débit
+d'au moins ``--knee-gain`` sans erreurs.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime
+import cv2
+from config.settings import Config
+from benchmarks.operations import synthetic_image
+
+DEFAULT_OUTPUT = os.path.join(Config.CACHE_FOLDER, 'benchmarks', 'load.json')
+
+# Poids relatifs des types de requêtes
+MIXES = {
+    'default': {'gallery': 30, 'image': 20, 'preview': 20, 'histogram': 15, 'upload': 10, 'batch': 5},
+    'browse': {'gallery': 40, 'image': 30, 'histogram': 20, 'preview': 10},
+    'ingest': {'upload': 60, 'gallery': 30, 'image': 10},
+    'download': {'batch': 40, 'processed': 40, 'gallery': 20},
+}
+# Noms des opérations d'aperçu (ProcessingService.apply_operation)
+PREVIEW_OPERATIONS = [
+    ('grayscale', {}),
+    ('gaussian_blur', {'kernel': 5}),
+    ('canny', {}),
+    ('histogram_equalization', {}),
+]
+BATCH_SIZE = 4
+UPLOAD_POOL = 16  # images distinctes pré-encodées pour les uploads (ensuite dédupliquées)
+
+
+class InProcessClient:
+    """create_app() piloté par le client de test Flask, un client par thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, json_body=None, files=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        kwargs = {'method': method}
+        if json_body is not None:
+            kwargs['json'] = json_body
+        if files:
+            kwargs['data'] = {'files': [(io.BytesIO(content), name) for name, content in files]}
+            kwargs['content_type'] = 'multipart/form-data'
+        response = client.open(path, **kwargs)
+        try:
+            return response.status_code, response.get_data()
+        finally:
+            response.close()
+
+
+class HttpClient:
+    """Serveur démarré, requêtes HTTP (bibliothèque standard)"""
+
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, json_body=None, files=None):
+        headers = {}
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for name, content in files:
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="files"; '
+                             f'filename="{name}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+                parts.append(content)
+                parts.append(b'\r\n')
+            parts.append(f'--{boundary}--\r\n'.encode())
+            data = b''.join(parts)
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            return 0, str(e).encode()  # connexion refusée, délai dépassé
+
+
+def isolate(root):
+    """Redirige les dossiers et l'index du projet vers root (application en processus)"""
+    project_root = Config.PROJECT_ROOT
+    for name in dir(Config):
+        value = getattr(Config, name)
+        if (name not in ('BASE_DIR', 'PROJECT_ROOT', 'ACCEL_REDIRECT_ROOT') and isinstance(value, str)
+                and value.startswith(project_root + os.sep)):
+            setattr(Config, name, root + value[len(project_root):])
+
+
+def encoded_image(megapixels, seed, ext):
+    ok, buffer = cv2.imencode(ext, synthetic_image(megapixels, 3, 'uint8', seed=seed))
+    if not ok:
+        raise ValueError(f"encodage {ext} impossible")
+    return buffer.tobytes()
+
+
+class Corpus:
+    """Images uploadées, images traitées et charges d'upload de la session"""
+
+    def __init__(self, megapixels, seed):
+        self.megapixels = megapixels
+        self.seed = seed
+        self.uploads = []
+        self.processed = []
+        self.payloads = []
+        self._lock = threading.Lock()
+
+    def prepare(self, client, count):
+        self.payloads = [(f"load_{self.seed}_{i}{ext}", encoded_image(self.megapixels, self.seed + 1000 + i, ext))
+                         for i, ext in ((i, ('.jpg', '.png')[i % 2]) for i in range(UPLOAD_POOL))]
+        for i in range(count):
+            ext = ('.jpg', '.png')[i % 2]
+            content = encoded_image(self.megapixels, self.seed + i, ext)
+            status, body = client.request('POST', '/api/upload', files=[(f"corpus_{i}{ext}", content)])
+            filenames = self._uploaded(status, body)
+            if not filenames:
+                raise RuntimeError(f"upload du corpus refusé ({status}): {body[:200]!r}")
+            self.uploads.extend(filenames)
+
+        for filename in self.uploads:
+            status, body = client.request('POST', '/api/process',
+                                          json_body={'filename': filename, 'operation': 'grayscale'})
+            if status != 200:
+                raise RuntimeError(f"traitement du corpus refusé ({status}): {body[:200]!r}")
+            self.processed.append(json.loads(body)['output_file'])
+
+    def add_uploads(self, status, body):
+        filenames = self._uploaded(status, body)
+        with self._lock:
+            self.uploads.extend(filenames)
+
+    @staticmethod
+    def _uploaded(status, body):
+        if status != 200:
+            return []
+        return [r['filename'] for r in json.loads(body).get('successful_uploads', [])]
+
+
+# Type de requête -> (route rapportée, fonction(client, corpus, rng) -> (status, corps))
+def _gallery(client, corpus, rng):
+    return client.request('GET', '/api/gallery')
+
+
+def _image(client, corpus, rng):
+    return client.request('GET', f"/api/image/{rng.choice(corpus.uploads)}")
+
+
+def _processed(client, corpus, rng):
+    return client.request('GET', f"/api/processed/{rng.choice(corpus.processed)}")
+
+
+def _histogram(client, corpus, rng):
+    channel = rng.choice(('all', 'gray'))
+    return client.request('GET', f"/api/histogram/{rng.choice(corpus.uploads)}?channel={channel}")
+
+
+def _preview(client, corpus, rng):
+    operation, params = rng.choice(PREVIEW_OPERATIONS)
+    return client.request('POST', '/api/preview', json_body={
+        'filename': rng.choice(corpus.uploads), 'operation': operation, 'params': params})
+
+
+def _process(client, corpus, rng):
+    return client.request('POST', '/api/process', json_body={
+        'filename': rng.choice(corpus.uploads), 'operation': 'blur_gaussian',
+        'parameters': {'kernel_size': rng.choice((3, 5, 7, 9))}})
+
+
+def _upload(client, corpus, rng):
+    status, body = client.request('POST', '/api/upload', files=[rng.choice(corpus.payloads)])
+    corpus.add_uploads(status, body)
+    return status, body
+
+
+def _batch(client, corpus, rng):
+    files = rng.sample(corpus.processed, min(BATCH_SIZE, len(corpus.processed)))
+    return client.request('GET', f"/api/download/batch?files={','.join(files)}")
+
+
+REQUESTS = {
+    'gallery': ('GET /api/gallery', _gallery),
+    'image': ('GET /api/image/<filename>', _image),
+    'processed': ('GET /api/processed/<filename>', _processed),
+    'histogram': ('GET /api/histogram/<filename>', _histogram),
+    'preview': ('POST /api/preview', _preview),
+    'process': ('POST /api/process', _process),
+    'upload': ('POST /api/upload', _upload),
+    'batch': ('GET /api/download/batch', _batch),
+}
+
+
+def parse_mix(value):
+    """Nom d'un mélange prédéfini ou 'type=poids,...'"""
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in REQUESTS:
+            raise ValueError(f"type de requête inconnu: {name} ({', '.join(REQUESTS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("mélange vide")
+    return mix
+
+
+def _percentile(ordered, q):
+    """Rang le plus proche sur une liste triée"""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_level(client, corpus, mix, concurrency, duration=None, total=None, seed=0):
+    """Exécute le mélange avec `concurrency` utilisateurs simultanés, retourne le rapport du niveau"""
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    samples = []
+    samples_lock = threading.Lock()
+    remaining = [total]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_slot():
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        with samples_lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        while next_slot():
+            kind = rng.choices(kinds, weights)[0]
+            route, send = REQUESTS[kind]
+            start = time.perf_counter()
+            try:
+                status, _ = send(client, corpus, rng)
+            except Exception:
+                status = 0
+            local.append((route, status, time.perf_counter() - start))
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f"load-{i}") for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed, concurrency)
+
+
+def _stats(latencies, statuses, elapsed):
+    ordered = sorted(latencies)
+    errors = sum(1 for status in statuses if status == 0 or (status >= 400 and status != 503))
+    rejected = sum(1 for status in statuses if status == 503)
+    count = len(statuses)
+    return {
+        'requests': count,
+        'throughput': round(count / elapsed, 2) if elapsed else None,
+        'p50_ms': round(_percentile(ordered, 50) * 1000, 1) if ordered else None,
+        'p95_ms': round(_percentile(ordered, 95) * 1000, 1) if ordered else None,
+        'p99_ms': round(_percentile(ordered, 99) * 1000, 1) if ordered else None,
+        'errors': errors,
+        'rejected': rejected,
+        'error_rate': round(errors / count, 4) if count else 0,
+    }
+
+
+def summarize(samples, elapsed, concurrency):
+    routes = {}
+    for route, status, latency in samples:
+        latencies, statuses = routes.setdefault(route, ([], []))
+        latencies.append(latency)
+        statuses.append(status)
+    level = _stats([s[2] for s in samples], [s[1] for s in samples], elapsed)
+    level.update(concurrency=concurrency, seconds=round(elapsed, 2),
+                 routes={route: _stats(latencies, statuses, elapsed)
+                         for route, (latencies, statuses) in sorted(routes.items())})
+    return level
+
+
+def find_knee(levels, gain=0.1, max_error_rate=0.01):
+    """Dernier niveau de concurrence qui gagne encore `gain` de débit sans dépasser le taux d'erreurs"""
+    knee = None
+    previous = None
+    for level in levels:
+        if level['error_rate'] > max_error_rate or level['rejected']:
+            break
+        if previous is not None and level['throughput'] < previous['throughput'] * (1 + gain):
+            break
+        knee = level['concurrency']
+        previous = level
+    return knee
+
+
+def _print_level(level, log):
+    log(f"\n== concurrence {level['concurrency']} : {level['requests']} requêtes en {level['seconds']} s, "
+        f"{level['throughput']} req/s, p95 {level['p95_ms']} ms, "
+        f"erreurs {level['error_rate']:.1%}, délestées {level['rejected']}")
+    log(f"   {'route':32s} {'n':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>5} {'503':>5}")
+    for route, stats in level['routes'].items():
+        log(f"   {route:32s} {stats['requests']:6d} {stats['throughput']:8.2f} {stats['p50_ms']:9.1f} "
+            f"{stats['p95_ms']:9.1f} {stats['p99_ms']:9.1f} {stats['errors']:5d} {stats['rejected']:5d}")
+
+
+def run(client, mix, concurrency_levels, duration=None, total=None, images=8, megapixels=1, seed=0,
+        knee_gain=0.1, target='in-process', log=print):
+    corpus = Corpus(megapixels, seed)
+    log(f"Corpus : {images} images de {megapixels} MP ({target})")
+    corpus.prepare(client, images)
+
+    levels = []
+    for concurrency in concurrency_levels:
+        level = run_level(client, corpus, mix, concurrency, duration, total, seed)
+        _print_level(level, log)
+        levels.append(level)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'target': target,
+            'mix': mix,
+            'duration': duration,
+            'requests_per_level': total,
+            'images': images,
+            'megapixels': megapixels,
+            'seed': seed,
+            'cpu_count': os.cpu_count(),
+        },
+        'levels': levels,
+        'knee': find_knee(levels, knee_gain),
+    }
+
+
+def _csv_ints(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', help='serveur à tester (défaut : create_app() en processus)')
+    parser.add_argument('--mix', type=parse_mix, default='default',
+                        help=f"{', '.join(MIXES)} ou type=poids,... ({', '.join(REQUESTS)})")
+    parser.add_argument('--concurrency', type=_csv_ints, default=[1, 2, 4, 8], help='niveaux, ex: 1,2,4,8,16')
+    parser.add_argument('--duration', type=float, help='secondes par niveau')
+    parser.add_argument('--requests', type=int, help='requêtes par niveau (défaut : 200 sans --duration)')
+    parser.add_argument('--images', type=int, default=8, help='taille du corpus synthétique')
+    parser.add_argument('--megapixels', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--knee-gain', type=float, default=0.1, help='gain de débit minimal par niveau')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--keep', action='store_true', help='conserve le dossier temporaire (en processus)')
+    args = parser.parse_args(argv)
+    total = args.requests or (None if args.duration else 200)
+    output = os.path.abspath(args.output)  # avant isolate() : le défaut est sous le projet
+
+    root = None
+    if args.url:
+        client, target = HttpClient(args.url), args.url
+    else:
+        root = tempfile.mkdtemp(prefix='load_')
+        isolate(root)
+        from app import create_app  # après isolate() : l'application ne voit que le dossier temporaire
+        client, target = InProcessClient(create_app()), 'in-process'
+
+    try:
+        report = run(client, args.mix, args.concurrency, args.duration, total, args.images,
+                     args.megapixels, args.seed, args.knee_gain, target)
+    finally:
+        if root is not None:
+            from utils.lifecycle import shutdown
+            shutdown()
+            if args.keep:
+                print(f"Dossier conservé : {root}")
+            else:
+                shutil.rmtree(root, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nPoint de saturation : concurrence {report['knee']}" if report['knee'] is not None
+          else "\nPoint de saturation : non atteint sans erreurs dès le premier niveau")
+    print(f"Rapport enregistré dans {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""Microbenchmarks des opérations et des presets.
+
+Usage (depuis backend/) :
+
+    python -m benchmarks.operations                        # 1, 12 et 50 MP, 1 et 3 canaux, uint8
+    python -m benchmarks.operations --sizes 1 --repeat 1   # rapide
+    python -m benchmarks.operations --dtypes uint8,uint16,float32 --only blur_gaussian,resize
+    python -m benchmarks.operations --save-baseline        # enregistre la référence
+    python -m benchmarks.operations --baseline benchmarks/baseline.json   # échoue si régression
+
+Chaque opération de ``OperationsService.get_available_operations`` (paramètres
+par défaut) et chaque preset est mesuré sur des images synthétiques, par
+chemin d'exécution :
+
+- ``memory``  : ProcessingService.apply_operation (aperçus, presets)
+- ``compute`` : le calcul de /api/process sur une image en mémoire (sans codec)
+- ``file``    : le chemin fichier de /api/process (décodage, calcul, encodage, écriture)
+
+Résultats : médiane et minimum des durées, débit en MP/s et pic mémoire
+(tracemalloc, sur une exécution séparée). Une combinaison non prise en charge
+(opération inconnue du chemin, dtype refusé par OpenCV) est notée
+``unsupported`` sans interrompre la série.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import cv2
+import numpy as np
+from config.settings import Config
+from services.operations_service import OperationsService
+from services.processing_service import ProcessingService
+from services.preset_service import PRESETS, apply_preset
+
+DEFAULT_SIZES = (1, 12, 50)
+DEFAULT_CHANNELS = (1, 3)
+DEFAULT_DTYPES = ('uint8',)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(Config.CACHE_FOLDER, 'benchmarks', 'operations.json')
+# Extension du fichier d'entrée du chemin 'file' (PNG ne stocke pas de flottants)
+FILE_EXTENSIONS = {'uint8': '.png', 'uint16': '.png', 'float32': '.tiff'}
+
+
+def default_params(operation):
+    """Paramètres par défaut déclarés dans le registre des opérations"""
+    spec = OperationsService.get_available_operations()[operation]['parameters']
+    return {name: param['default'] for name, param in spec.items() if 'default' in param}
+
+
+def synthetic_image(megapixels, channels, dtype, seed=0):
+    """Dégradé + bruit (4:3) : plus proche d'une photo que du bruit pur pour les codecs"""
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 1, width, dtype=np.float32)[None, :] * np.linspace(0.3, 1, height, dtype=np.float32)[:, None]
+    planes = []
+    for c in range(channels):
+        noise = rng.normal(0, 0.05, (height, width)).astype(np.float32)
+        planes.append(np.clip(np.roll(gradient, c * width // 7, axis=1) + noise, 0, 1))
+    img = planes[0] if channels == 1 else np.dstack(planes)
+    if dtype == 'float32':
+        return img
+    scale = np.iinfo(dtype).max
+    return (img * scale).astype(dtype)
+
+
+def _runner(path, kind, name, params, input_path, tmp_dir, ext):
+    """Fonction sans argument exécutant une fois le cas mesuré"""
+    output_path = os.path.join(tmp_dir, f"out{ext}")
+    if kind == 'preset':
+        if path == 'memory':
+            return lambda img: apply_preset(img, name)
+
+        def render_file(img):
+            result = apply_preset(ProcessingService._imread(input_path), name)
+            if not ProcessingService._imwrite(output_path, result):
+                raise ValueError("encodage impossible")
+        return render_file
+
+    if path == 'memory':
+        return lambda img: ProcessingService.apply_operation(img, name, params)
+    if path == 'compute':
+        return lambda img: ProcessingService.apply_file_operation(img, name, params)
+
+    def process_file(img):
+        if not ProcessingService._apply_operation(input_path, output_path, name, params):
+            raise ValueError("opération refusée")
+    return process_file
+
+
+def measure(func, img, repeat):
+    """(médiane, minimum) en secondes après une exécution de chauffe, pic mémoire en octets"""
+    func(img)  # chauffe : erreurs détectées avant de mesurer, caches OpenCV initialisés
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(img)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(img)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), min(timings), peak
+
+
+def cases(only=None):
+    """(type, nom, paramètres, chemins) de chaque opération et preset"""
+    for operation in OperationsService.get_available_operations():
+        if not only or operation in only:
+            yield 'operation', operation, default_params(operation), ('memory', 'compute', 'file')
+    for preset in PRESETS:
+        if not only or preset in only:
+            yield 'preset', preset, {}, ('memory', 'file')
+
+
+def run(sizes=DEFAULT_SIZES, channels=DEFAULT_CHANNELS, dtypes=DEFAULT_DTYPES, repeat=3, only=None, log=print):
+    results = []
+    tmp_dir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        for megapixels in sizes:
+            for channel_count in channels:
+                for dtype in dtypes:
+                    img = synthetic_image(megapixels, channel_count, dtype)
+                    ext = FILE_EXTENSIONS[dtype]
+                    input_path = os.path.join(tmp_dir, f"input{ext}")
+                    cv2.imwrite(input_path, img)
+                    actual_mp = img.shape[0] * img.shape[1] / 1e6
+
+                    for kind, name, params, paths in cases(only):
+                        for path in paths:
+                            entry = {'kind': kind, 'name': name, 'path': path, 'megapixels': megapixels,
+                                     'channels': channel_count, 'dtype': dtype}
+                            func = _runner(path, kind, name, params, input_path, tmp_dir, ext)
+                            try:
+                                median, fastest, peak = measure(func, img, repeat)
+                            except Exception as e:
+                                entry.update(status='unsupported', reason=str(e)[:200])
+                            else:
+                                entry.update(status='ok', seconds_median=round(median, 6),
+                                             seconds_min=round(fastest, 6),
+                                             mp_per_s=round(actual_mp / median, 2) if median else None,
+                                             peak_mb=round(peak / (1024 * 1024), 2))
+                                log(f"{kind:9s} {name:24s} {path:7s} {megapixels:>4} MP {channel_count}c {dtype:7s} "
+                                    f"{median * 1000:9.1f} ms {entry['mp_per_s']:9.1f} MP/s {entry['peak_mb']:8.1f} MB")
+                            results.append(entry)
+    finally:
+        for filename in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, filename))
+        os.rmdir(tmp_dir)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv_threads': cv2.getNumThreads(),
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+
+def _key(entry):
+    return (entry['kind'], entry['name'], entry['path'], entry['megapixels'], entry['channels'], entry['dtype'])
+
+
+def compare(current, baseline, tolerance=0.25, memory_tolerance=0.25):
+    """Régressions par rapport à la référence : plus lent, plus gourmand ou plus pris en charge"""
+    reference = {_key(entry): entry for entry in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        base = reference.get(_key(entry))
+        if base is None or base['status'] != 'ok':
+            continue
+        label = ' '.join(str(part) for part in _key(entry))
+        if entry['status'] != 'ok':
+            regressions.append(f"{label}: ne fonctionne plus ({entry.get('reason')})")
+            continue
+        slowdown = entry['seconds_median'] / base['seconds_median'] - 1 if base['seconds_median'] else 0
+        if slowdown > tolerance:
+            regressions.append(f"{label}: {base['seconds_median'] * 1000:.1f} -> "
+                               f"{entry['seconds_median'] * 1000:.1f} ms (+{slowdown:.0%})")
+        if base['peak_mb'] and entry['peak_mb'] > base['peak_mb'] * (1 + memory_tolerance) + 1:
+            regressions.append(f"{label}: mémoire {base['peak_mb']:.1f} -> {entry['peak_mb']:.1f} MB")
+    return regressions
+
+
+def _csv(value, cast=str):
+    return tuple(cast(part) for part in value.split(',') if part)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=lambda v: _csv(v, float), default=DEFAULT_SIZES, help='mégapixels, ex: 1,12,50')
+    parser.add_argument('--channels', type=lambda v: _csv(v, int), default=DEFAULT_CHANNELS)
+    parser.add_argument('--dtypes', type=_csv, default=DEFAULT_DTYPES, help='uint8, uint16, float32')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', type=lambda v: set(_csv(v)), help='opérations ou presets à mesurer')
+    parser.add_argument('--threads', type=int, help='cv2.setNumThreads (défaut : OpenCV)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', help=f"référence à comparer (ex: {DEFAULT_BASELINE})")
+    parser.add_argument('--save-baseline', action='store_true', help='enregistre les résultats comme référence')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='ralentissement toléré (0.25 = +25 %%)')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.dtypes) - set(FILE_EXTENSIONS)
+    if unknown:
+        parser.error(f"dtype non pris en charge: {', '.join(sorted(unknown))}")
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    sizes = tuple(int(s) if float(s).is_integer() else s for s in args.sizes)
+
+    report = run(sizes, args.channels, args.dtypes, args.repeat, args.only)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    unsupported = sorted({r['name'] + '/' + r['path'] for r in report['results'] if r['status'] != 'ok'})
+    print(f"\n{len(report['results'])} mesures enregistrées dans {args.output}")
+    if unsupported:
+        print(f"Non pris en charge ({len(unsupported)}): {', '.join(unsupported)}")
+
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Référence enregistrée dans {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n*** {len(regressions)} RÉGRESSION(S) par rapport à {args.baseline} ***", file=sys.stderr)
+            for line in regressions:
+                print(f"  - {line}", file=sys.stderr)
+            return 1
+        print(f"Aucune régression par rapport à {args.baseline} (tolérance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,535 @@
+"""Traitement en masse hors HTTP, directement sur la couche services.
+
+Usage (depuis backend/) :
+
+    python -m cli photos/ --operation blur_gaussian --params '{"kernel_size": 7}' -o out/
+    python -m cli "photos/**/*.jpg" --preset denoise -o out/ --format webp --quality 80
+    python -m cli photos/ --pipeline pipeline.json -o out/ --workers 8
+    python -m cli photos/ --histogram all -o stats/          # histogrammes dans stats/histograms.jsonl
+
+Fichier de pipeline (JSON) : une liste d'étapes, ou un objet avec ``steps`` et
+un profil d'encodage ``output`` (voir EncodingService) :
+
+    {"steps": [{"operation": "resize", "parameters": {"width": 512, "height": 512}},
+               {"preset": "enhance_contrast"}],
+     "output": {"format": "jpeg", "quality": 85}}
+
+Les opérations sont celles de /api/process, appliquées en mémoire (sans
+fichier intermédiaire entre les étapes) ; les presets sont ceux de
+/api/preset/apply. Un thread lit les fichiers à l'avance, un pool de
+processus décode, traite et encode, un thread écrit les résultats.
+
+Entrées : dossiers, motifs glob, ou ``gallery:uploads`` / ``gallery:processed``
+(galerie lue à travers le backend de stockage configuré).
+
+Export de dataset (``--tensor``) : chaque image, après les étapes éventuelles,
+est ramenée à une forme fixe et écrite dans des shards NumPy de taille fixe
+avec un index (voir DatasetService) :
+
+    python -m cli gallery:processed --tensor 224x224 --fit crop -o dataset/
+    python -m cli photos/ --pipeline pipeline.json --tensor 256x256 --dtype float32 --shard-format npz -o dataset/
+
+Chaque image terminée est ajoutée au manifeste (``<sortie>/.manifest.jsonl``) :
+relancer la même commande après une interruption reprend là où elle s'était
+arrêtée (images inchangées, même traitement ; en export, shards complets
+seulement). ``--force`` retraite tout.
+"""
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import queue
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import cv2
+import numpy as np
+from PIL import Image
+from config.settings import Config
+from services.dataset_service import DatasetService, ShardWriter
+from services.encoding_service import EncodingService
+from services.histogram_service import compute_histogram
+from services.index_service import IndexService
+from services.multiframe_service import MultiFrameService
+from services.operations_service import OperationsService
+from services.preset_service import PRESETS, apply_preset
+from services.processing_service import ProcessingService
+from services.storage_service import StorageService
+
+MANIFEST_NAME = '.manifest.jsonl'
+HISTOGRAMS_NAME = 'histograms.jsonl'
+_DONE = object()
+
+
+class Input:
+    """Image à traiter : nom (chemin ou gallery:<espace>/<clé>), taille, date, lecture"""
+
+    def __init__(self, name, size, mtime, read):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.read = read
+
+    @property
+    def ext(self):
+        return os.path.splitext(self.name)[1].lower()
+
+
+def _read_file(path):
+    def read():
+        with open(path, 'rb') as f:
+            return f.read()
+    return read
+
+
+def _stored(namespace, backend, key, name):
+    size, mtime = backend.stat(key)
+    return Input(f"gallery:{namespace}/{name}", size, mtime, lambda: backend.read(key))
+
+
+def _gallery_inputs(namespace):
+    if namespace == 'uploads':
+        for upload in IndexService.list_uploads():
+            backend, key = StorageService.resolve_upload(upload['filename'])
+            if backend is not None:
+                yield _stored(namespace, backend, key, upload['filename'])
+    elif namespace == 'processed':
+        backend = StorageService.processed()
+        for key in backend.iter_keys():
+            yield _stored(namespace, backend, key, key)
+    else:
+        raise ValueError(f"Galerie inconnue: gallery:{namespace} (uploads ou processed)")
+
+
+def find_inputs(patterns):
+    """Images des motifs (glob, ** récursif), dossiers (parcourus récursivement) et galeries, triées"""
+    extensions = {f".{ext}" for ext in Config.ALLOWED_EXTENSIONS}
+    found = {}
+    for pattern in patterns:
+        if pattern.startswith('gallery:'):
+            for item in _gallery_inputs(pattern[len('gallery:'):]):
+                found[item.name] = item
+            continue
+        if os.path.isdir(pattern):
+            paths = [os.path.join(root, name) for root, _, files in os.walk(pattern) for name in files]
+        else:
+            paths = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+        for path in map(os.path.abspath, paths):
+            stat = os.stat(path)
+            found[path] = Input(path, stat.st_size, stat.st_mtime, _read_file(path))
+    return [found[name] for name in sorted(found) if os.path.splitext(name)[1].lower() in extensions]
+
+
+def load_steps(args):
+    """(étapes, profil d'encodage demandé) d'après --operation, --preset ou --pipeline"""
+    output = None
+    if args.pipeline:
+        with open(args.pipeline) as f:
+            pipeline = json.load(f)
+        if isinstance(pipeline, dict):
+            output = pipeline.get('output')
+            pipeline = pipeline.get('steps', [])
+        steps = pipeline
+    elif args.operation:
+        steps = [{'operation': args.operation, 'parameters': json.loads(args.params or '{}')}]
+    elif args.preset:
+        steps = [{'preset': args.preset}]
+    else:
+        steps = []
+
+    operations = OperationsService.get_available_operations()
+    for step in steps:
+        if 'preset' in step:
+            if step['preset'] not in PRESETS:
+                raise ValueError(f"Preset inconnu: {step['preset']} ({', '.join(PRESETS)})")
+        elif step.get('operation') not in operations:
+            raise ValueError(f"Opération inconnue: {step.get('operation')}")
+
+    if args.format or args.quality is not None or args.profile:
+        output = {key: value for key, value in (('format', args.format), ('quality', args.quality),
+                                                ('profile', args.profile)) if value is not None}
+    return steps, output
+
+
+def fingerprint(task):
+    """Identifie le traitement dans le manifeste : le changer retraite les images"""
+    return hashlib.sha256(IndexService.make_recipe(**task).encode()).hexdigest()[:16]
+
+
+def _as_color(img):
+    # Entre deux étapes : ce que cv2.IMREAD_COLOR relirait d'un fichier intermédiaire
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else img
+
+
+def _apply_steps(img, steps):
+    for step in steps:
+        img = _as_color(img)
+        if 'preset' in step:
+            img = apply_preset(img, step['preset'])
+        else:
+            img = ProcessingService.apply_file_operation(img, step['operation'], step.get('parameters') or {})
+    return img
+
+
+def _encoding(task, ext):
+    """(spécification normalisée, extension de sortie) pour une source d'extension ext"""
+    output = task.get('output')
+    if not output and ext == '.gif':
+        output = {'format': 'png'}  # OpenCV n'encode pas le GIF : trame unique en PNG
+    spec = EncodingService.normalize(output, ext)
+    return spec, EncodingService.extension(spec, ext)
+
+
+def _worker_init():
+    # Parallélisme assuré par les processus : un thread OpenCV chacun
+    cv2.setNumThreads(1)
+    # Ctrl+C géré par le processus principal (arrêt propre, manifeste à jour)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_task(task, data, ext):
+    """Exécuté dans un processus du pool : (octets, histogramme ou tenseur, extension, mégapixels)"""
+    if task.get('histogram'):
+        img = _decode(data)
+        return compute_histogram(img, task['histogram']), None, img.shape[0] * img.shape[1] / 1e6
+    if task.get('tensor'):
+        img = _decode(data)
+        tensor = DatasetService.to_tensor(_apply_steps(img, task['steps']), task['tensor'])
+        return tensor, None, img.shape[0] * img.shape[1] / 1e6
+
+    spec, out_ext = _encoding(task, ext)
+    if ext in MultiFrameService.EXTENSIONS and MultiFrameService.is_multiframe(io.BytesIO(data)):
+        if not task.get('output'):
+            spec, out_ext = None, ext  # animation conservée dans son format
+        if out_ext in MultiFrameService.EXTENSIONS:
+            return _run_multiframe(task, data, spec, out_ext)
+
+    img = _decode(data)
+    megapixels = img.shape[0] * img.shape[1] / 1e6
+    buffer, _ = EncodingService.encode(_apply_steps(img, task['steps']), spec, out_ext)
+    return buffer.tobytes(), out_ext, megapixels
+
+
+def _run_multiframe(task, data, spec, out_ext):
+    # GIF animé / TIFF multipage : chaque trame, comme /api/process
+    with tempfile.NamedTemporaryFile(suffix=out_ext) as tmp:
+        frames = MultiFrameService.render(io.BytesIO(data), tmp.name,
+                                          lambda frame: _apply_steps(frame, task['steps']), spec)
+        with open(tmp.name, 'rb') as f:
+            content = f.read()
+    with Image.open(io.BytesIO(data)) as img:
+        megapixels = img.width * img.height * frames / 1e6
+    return content, out_ext, megapixels
+
+
+def _decode(data):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        img = StorageService.decode_with_pil(io.BytesIO(data))
+    if img is None:
+        raise ValueError("Image illisible")
+    return img
+
+
+class Manifest:
+    """Journal en ajout seul des images terminées (reprise après interruption)"""
+
+    def __init__(self, path, task_id):
+        self.path = path
+        self.task_id = task_id
+        self.done = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # dernière ligne tronquée par l'interruption
+                    if entry.get('task') == task_id:
+                        self.done[entry['input']] = entry
+        self._file = open(path, 'a')
+
+    def is_done(self, item):
+        entry = self.done.get(item.name)
+        return (entry is not None and entry['status'] == 'ok'
+                and entry['size'] == item.size and entry['mtime'] == item.mtime)
+
+    def record(self, item, status, output=None, error=None):
+        entry = {'input': item.name, 'size': item.size, 'mtime': item.mtime, 'task': self.task_id,
+                 'status': status, 'output': output}
+        if error:
+            entry['error'] = error
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class FileSink:
+    """Un fichier par image, arborescence des entrées conservée (remplacement atomique)"""
+
+    def __init__(self, output_dir, inputs):
+        self.output_dir = output_dir
+        paths = [os.path.dirname(item.name) for item in inputs if not item.name.startswith('gallery:')]
+        self.root = os.path.commonpath(paths) if paths else output_dir
+
+    def write(self, item, result):
+        content, out_ext, _ = result
+        if item.name.startswith('gallery:'):
+            relative = item.name[len('gallery:'):]
+        else:
+            relative = os.path.relpath(item.name, self.root)
+        output = os.path.splitext(relative)[0] + out_ext
+        target = os.path.join(self.output_dir, output)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.part', 'wb') as f:
+            f.write(content)
+        os.replace(target + '.part', target)
+        return [(item, output)], len(content)
+
+    def close(self, interrupted):
+        return []
+
+
+class HistogramSink:
+    """Histogrammes ajoutés à <sortie>/histograms.jsonl"""
+
+    def __init__(self, output_dir):
+        self._file = open(os.path.join(output_dir, HISTOGRAMS_NAME), 'a')
+
+    def write(self, item, result):
+        line = json.dumps({'input': item.name, **result[0]}) + '\n'
+        self._file.write(line)
+        self._file.flush()
+        return [(item, HISTOGRAMS_NAME)], len(line)
+
+    def close(self, interrupted):
+        self._file.close()
+        return []
+
+
+class TensorSink:
+    """Tenseurs écrits dans des shards NumPy ; une image n'est terminée qu'avec son shard"""
+
+    def __init__(self, output_dir, spec, shard_size, shard_format, task_id, force):
+        self.writer = ShardWriter(output_dir, spec, shard_size, shard_format, task_id, force)
+        self._items = {}
+
+    def write(self, item, result):
+        self._items[item.name] = item
+        return self._committed(self.writer.add(item.name, result[0])), result[0].nbytes
+
+    def close(self, interrupted):
+        if interrupted:
+            self.writer.abort()  # shard incomplet reconstruit à la reprise
+            return []
+        return self._committed(self.writer.close())
+
+    def _committed(self, sources):
+        shard = self.writer.index['shards'][-1]['file'] if sources else None
+        return [(self._items.pop(name), shard) for name in sources]
+
+
+class Stats:
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.done = self.errors = 0
+        self.megapixels = self.bytes_in = self.bytes_out = 0
+        self.interrupted = False
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        return (f"{self.done + self.errors}/{self.total} images, {self.done / elapsed:.1f} img/s, "
+                f"{self.megapixels / elapsed:.1f} MP/s, lu {self.bytes_in / elapsed / 1e6:.1f} MB/s, "
+                f"écrit {self.bytes_out / elapsed / 1e6:.1f} MB/s, {self.errors} erreur(s)")
+
+    def tick(self, interval):
+        now = time.perf_counter()
+        if interval and now - self._last >= interval:
+            self._last = now
+            print(self.line(), flush=True)
+
+
+def _reader(items, inbox):
+    """Lit les images à l'avance (file bornée) pendant que le pool calcule"""
+    try:
+        for item in items:
+            try:
+                inbox.put((item, item.read(), None))
+            except (OSError, ValueError) as e:
+                inbox.put((item, None, str(e)))
+    finally:
+        inbox.put(_DONE)
+
+
+def _writer(outbox, sink, manifest, stats):
+    """Remet les résultats au sink puis inscrit au manifeste les images qu'il a terminées"""
+    while True:
+        item = outbox.get()
+        if item is _DONE:
+            return
+        source, result, error = item
+        if error is not None:
+            stats.errors += 1
+            manifest.record(source, 'error', error=error)
+            print(f"[ERREUR] {source.name}: {error}", file=sys.stderr)
+            continue
+        committed, written = sink.write(source, result)
+        stats.done += 1
+        stats.megapixels += result[2]
+        stats.bytes_out += written
+        for done, output in committed:
+            manifest.record(done, 'ok', output=output)
+
+
+def make_sink(output_dir, task, inputs, shard_size=1024, shard_format='npy', force=False):
+    if task.get('histogram'):
+        return HistogramSink(output_dir)
+    if task.get('tensor'):
+        return TensorSink(output_dir, task['tensor'], shard_size, shard_format, fingerprint(task), force)
+    return FileSink(output_dir, inputs)
+
+
+def run(inputs, output_dir, task, workers=None, prefetch=None, force=False, progress=5.0,
+        shard_size=1024, shard_format='npy'):
+    """Traite inputs vers output_dir, retourne les statistiques"""
+    workers = workers or Config.CPU_BUDGET
+    prefetch = prefetch or 2 * workers
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME), fingerprint(task))
+    pending = [item for item in inputs if force or not manifest.is_done(item)]
+    stats = Stats(len(pending), len(inputs) - len(pending))
+    if stats.skipped:
+        print(f"Reprise : {stats.skipped} image(s) déjà traitée(s) d'après le manifeste")
+
+    sink = make_sink(output_dir, task, inputs, shard_size, shard_format, force)
+    inbox = queue.Queue(maxsize=prefetch)
+    outbox = queue.Queue(maxsize=prefetch)
+    reader = threading.Thread(target=_reader, args=(pending, inbox), name='cli-reader', daemon=True)
+    writer = threading.Thread(target=_writer, args=(outbox, sink, manifest, stats), name='cli-writer')
+    reader.start()
+    writer.start()
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_worker_init)
+    futures = {}
+    try:
+        reading = True
+        while reading or futures:
+            # Au plus workers + prefetch images en vol dans le pool
+            while reading and len(futures) < workers + prefetch:
+                item = inbox.get()
+                if item is _DONE:
+                    reading = False
+                    break
+                source, data, error = item
+                stats.bytes_in += len(data or b'')
+                if error is not None:
+                    outbox.put((source, None, error))
+                    continue
+                futures[executor.submit(run_task, task, data, source.ext)] = source
+            if not futures:
+                continue
+            finished, _ = wait(futures, timeout=progress or None, return_when=FIRST_COMPLETED)
+            for future in finished:
+                source = futures.pop(future)
+                try:
+                    outbox.put((source, future.result(), None))
+                except Exception as e:
+                    outbox.put((source, None, str(e) or type(e).__name__))
+            stats.tick(progress)
+    except KeyboardInterrupt:
+        stats.interrupted = True
+        print("\nInterruption : les images terminées sont au manifeste, relancez la commande pour reprendre",
+              file=sys.stderr)
+    finally:
+        executor.shutdown(wait=not stats.interrupted, cancel_futures=True)
+        outbox.put(_DONE)
+        writer.join()
+        for done, output in sink.close(stats.interrupted):
+            manifest.record(done, 'ok', output=output)
+        manifest.close()
+    return stats
+
+
+def _tensor_shape(value):
+    height, _, width = value.lower().partition('x')
+    return [int(height), int(width)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('inputs', nargs='+',
+                        help='dossiers, motifs glob (entre guillemets pour **), gallery:uploads ou gallery:processed')
+    task_group = parser.add_mutually_exclusive_group()
+    task_group.add_argument('--operation', help="opération de /api/process")
+    task_group.add_argument('--preset', choices=sorted(PRESETS))
+    task_group.add_argument('--pipeline', help='fichier JSON des étapes')
+    task_group.add_argument('--histogram', choices=['all', 'gray', 'r', 'g', 'b'],
+                            help='calcule les histogrammes au lieu de traiter')
+    parser.add_argument('--params', help='paramètres JSON de --operation')
+    parser.add_argument('-o', '--output', required=True, help='dossier de sortie (arborescence conservée)')
+    parser.add_argument('--format', choices=sorted(EncodingService.FORMATS))
+    parser.add_argument('--quality', type=int)
+    parser.add_argument('--profile', choices=sorted(EncodingService.PROFILES))
+    tensor_group = parser.add_argument_group('export de dataset')
+    tensor_group.add_argument('--tensor', type=_tensor_shape, metavar='HxW',
+                              help='exporte des tenseurs de forme fixe en shards NumPy')
+    tensor_group.add_argument('--fit', choices=DatasetService.FITS, default='stretch')
+    tensor_group.add_argument('--channels', type=int, choices=[1, 3], default=3)
+    tensor_group.add_argument('--order', choices=['rgb', 'bgr'], default='rgb')
+    tensor_group.add_argument('--dtype', choices=['uint8', 'float32'], default='uint8',
+                              help='float32 : valeurs dans [0, 1]')
+    tensor_group.add_argument('--shard-size', type=int, default=1024, help='images par shard')
+    tensor_group.add_argument('--shard-format', choices=DatasetService.FORMATS, default='npy',
+                              help='npy (memmap, sans décodage) ou npz (compressé)')
+    parser.add_argument('--workers', type=int, help=f"processus de calcul (défaut : {Config.CPU_BUDGET})")
+    parser.add_argument('--prefetch', type=int, help='images lues à l\'avance (défaut : 2 x workers)')
+    parser.add_argument('--force', action='store_true', help='ignore le manifeste et retraite tout')
+    parser.add_argument('--progress', type=float, default=5.0, help='secondes entre deux lignes de progression')
+    args = parser.parse_args(argv)
+    if not (args.operation or args.preset or args.pipeline or args.histogram or args.tensor):
+        parser.error("--operation, --preset, --pipeline, --histogram ou --tensor requis")
+    if args.tensor and args.histogram:
+        parser.error("--tensor et --histogram sont incompatibles")
+
+    try:
+        steps, output = load_steps(args)
+        if output:
+            EncodingService.normalize(output, '.png')  # validation avant de lancer le pool
+        inputs = find_inputs(args.inputs)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+    if args.histogram:
+        task = {'histogram': args.histogram}
+    elif args.tensor:
+        task = {'steps': steps, 'tensor': {'shape': args.tensor, 'fit': args.fit, 'channels': args.channels,
+                                           'order': args.order, 'dtype': args.dtype}}
+    else:
+        task = {'steps': steps, 'output': output}
+
+    if not inputs:
+        parser.error("aucune image trouvée")
+    print(f"{len(inputs)} image(s) en entrée")
+
+    try:
+        stats = run(inputs, os.path.abspath(args.output), task, args.workers, args.prefetch, args.force,
+                    args.progress, args.shard_size, args.shard_format)
+    except ValueError as e:
+        parser.error(str(e))  # dataset existant construit par un autre traitement
+    print(f"Terminé en {time.perf_counter() - stats.start:.1f} s : {stats.line()}")
+    if stats.interrupted:
+        return 130
+    return 1 if stats.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
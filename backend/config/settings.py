@@ -10,10 +10,33 @@ class Config:
     # Dossiers
     UPLOAD_FOLDER = os.path.join(PROJECT_ROOT, 'uploads')
     PROCESSED_FOLDER = os.path.join(PROJECT_ROOT, 'processed')
+    CACHE_FOLDER = os.path.join(PROJECT_ROOT, 'cache')
+
+    # Stockage dédupliqué : contenu unique par hash, noms visibles = lignes de l'index
+    BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')
+    # Index SQLite (WAL) : disque local du nœud, jamais un partage réseau (NFS)
+    INDEX_DATABASE = os.environ.get('INDEX_DATABASE', os.path.join(PROJECT_ROOT, 'index.db'))
+
+    # Backend de stockage : 'local' (disque shardé), 'memory' (tests) ou 's3' (nécessite boto3)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET', 'image-preprocessing')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # ex: http://localhost:9000 (MinIO)
+    S3_REGION = os.environ.get('S3_REGION')
 
     # Limites de fichiers
     MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
     MAX_FILES_PER_UPLOAD = 10
+    UPLOAD_WORKERS = min(8, os.cpu_count() or 1)  # ingestion parallèle des uploads multiples
+
+    # Uploads par morceaux (reprenables)
+    UPLOAD_SESSION_FOLDER = os.path.join(CACHE_FOLDER, 'upload_sessions')
+    MAX_CHUNKED_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # taille conseillée au client
+    MAX_CHUNK_SIZE = 32 * 1024 * 1024
+    # Limite de pixels au décodage (PIL refuse par défaut au-delà de ~179 MP ; 2^30 comme OpenCV)
+    MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 2 ** 30))
+    UPLOAD_SESSION_TTL = 24 * 3600  # secondes
     
     # Formats supportés
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp'}
@@ -25,6 +48,51 @@ class Config:
     # Configuration Flask
     SECRET_KEY = 'dev-key-change-in-production'
     DEBUG = True
+
+    # Serveur de production (python serve.py) : workers pré-forkés par gunicorn
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:5000')
+    CPU_BUDGET = int(os.environ.get('CPU_BUDGET', os.cpu_count() or 1))  # cœurs alloués au serveur
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', CPU_BUDGET))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))  # threads par worker (requêtes simultanées)
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 120))  # secondes avant de tuer un worker bloqué
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 60))  # délai pour finir les travaux en cours
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 0))  # recyclage des workers (0 = jamais)
+    # Threads OpenCV par worker ; par défaut le budget de cœurs partagé entre les workers
+    OPENCV_THREADS = int(os.environ.get('OPENCV_THREADS', 0)) or max(1, CPU_BUDGET // SERVER_WORKERS)
+
+    # Contrôle d'admission des traitements (budget par processus, coûts en secondes estimées)
+    OPERATION_COSTS_FILE = os.path.join(CACHE_FOLDER, 'operation_costs.json')
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', max(1, SERVER_THREADS)))
+    ADMISSION_COST_BUDGET = float(os.environ.get('ADMISSION_COST_BUDGET', 4.0))
+    ADMISSION_INTERACTIVE_RESERVE = 0.25  # part du budget réservée aux aperçus
+    ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 16))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 5))  # secondes
+
+    # Couche ASGI (python asgi_app.py) : calcul déporté dans un pool partagé
+    ASYNC_CPU_EXECUTOR = os.environ.get('ASYNC_CPU_EXECUTOR', 'thread')  # 'thread' ou 'process'
+    ASYNC_CPU_WORKERS = int(os.environ.get('ASYNC_CPU_WORKERS', CPU_BUDGET))
+    # Mode 'process' : images échangées par mémoire partagée (segments réutilisés entre requêtes)
+    SHM_POOL_BYTES = int(os.environ.get('SHM_POOL_BYTES', 1024 * 1024 * 1024))  # segments inactifs conservés
+    SHM_LEASE_TIMEOUT = float(os.environ.get('SHM_LEASE_TIMEOUT', 300))  # secondes avant récupération
+    CORS_ORIGINS = ['http://localhost:5173']
+
+    # Métriques Prometheus : dossier partagé par les workers de serve.py
+    METRICS_MULTIPROC_DIR = os.path.join(CACHE_FOLDER, 'metrics')
+
+    # Envoi des fichiers délégué au proxy inverse : '' (le worker envoie les octets),
+    # 'x-accel-redirect' (nginx) ou 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+    FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD', '')
+    # nginx : location interne qui sert ACCEL_REDIRECT_ROOT (alias), par défaut la racine du projet
+    ACCEL_REDIRECT_ROOT = os.environ.get('ACCEL_REDIRECT_ROOT', PROJECT_ROOT)
+    ACCEL_REDIRECT_PREFIX = os.environ.get('ACCEL_REDIRECT_PREFIX', '/_protected/')
+
+    # Profilage : ?profile=1 réservé à l'administration (en-tête X-Admin-Token)
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # absent : autorisé en mode debug seulement
+    PROFILE_FOLDER = os.path.join(CACHE_FOLDER, 'profiles')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # fraction des requêtes profilées
+    SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))  # profils échantillonnés conservés au-delà
+    PROFILE_MAX_FILES = 200
+    PROFILE_TOP_FUNCTIONS = 30
     
     # Configuration thumbnails
     THUMBNAIL_SIZES = {
@@ -32,4 +100,23 @@ class Config:
         'medium': (200, 200),
         'large': (400, 400)
     }
-    DEFAULT_THUMBNAIL_SIZE = (200, 200)
\ No newline at end of file
+    DEFAULT_THUMBNAIL_SIZE = (200, 200)
+
+    # Images traitées : quota disque (éviction LRU, régénération à la demande)
+    PROCESSED_QUOTA_BYTES = int(os.environ.get('PROCESSED_QUOTA_BYTES', 5 * 1024 * 1024 * 1024))  # 5GB
+    GC_INTERVAL = 300  # secondes entre deux passages du ramasse-miettes
+    GC_LOW_WATERMARK = 0.9  # fraction du quota visée après éviction
+    ACCESS_TOUCH_INTERVAL = 60  # au plus une mise à jour de la date d'accès par minute
+    LOCK_FOLDER = os.path.join(CACHE_FOLDER, 'locks')  # verrous fcntl partagés entre workers
+
+    # Configuration pyramide de tuiles (deep zoom)
+    TILE_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'tiles')
+    TILE_SIZE = 256
+    TILE_FORMAT = 'jpg'
+    TILE_JPEG_QUALITY = 85
+    TILE_THRESHOLD_PIXELS = 16 * 1000 * 1000  # 16 MP
+    TILE_CACHE_QUOTA_BYTES = int(os.environ.get('TILE_CACHE_QUOTA_BYTES', 10 * 1024 * 1024 * 1024))  # 10GB
+
+    # GIF animés / TIFF multipages : trames traitées en parallèle, fenêtre bornée
+    FRAME_WORKERS = min(4, os.cpu_count() or 1)
+    FRAME_WINDOW = 2 * FRAME_WORKERS  # trames décodées en mémoire au plus
@@ -0,0 +1,35 @@
+from flask import Blueprint, Response, jsonify, request, current_app
+from services.stats_service import StatsService
+from services.similarity_service import SimilarityService
+from utils import profiling
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.before_request
+def require_admin():
+    if not profiling.is_admin(request, current_app.debug):
+        return jsonify({'error': 'Accès réservé à l\'administration'}), 403
+
+@admin_bp.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Profils enregistrés (?profile=1 et requêtes lentes échantillonnées), du plus récent au plus ancien"""
+    profiles = profiling.list_profiles()
+    return jsonify({'profiles': profiles, 'total': len(profiles)})
+
+@admin_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Résumé pstats d'un profil (le fichier .prof voisin s'ouvre avec pstats/snakeviz)"""
+    summary = profiling.read_profile(profile_id)
+    if summary is None:
+        return jsonify({'error': 'Profil non trouvé'}), 404
+    return Response(summary, content_type='text/plain; charset=utf-8')
+
+@admin_bp.route('/admin/stats/rebuild', methods=['POST'])
+def rebuild_stats():
+    """Mesure les images antérieures aux statistiques et recalcule les agrégats de /api/stats"""
+    return jsonify(StatsService.rebuild())
+
+@admin_bp.route('/admin/similarity/backfill', methods=['POST'])
+def backfill_perceptual_hashes():
+    """Calcule les empreintes perceptuelles des images antérieures à l'index de similarité"""
+    return jsonify(SimilarityService.backfill())
@@ -2,9 +2,12 @@ from flask import Blueprint, request, jsonify
 import cv2
 import numpy as np
 import base64
-import os
-from config.settings import Config
 from services.processing_service import ProcessingService  # ✨ Déplacé en haut
+from services.storage_service import StorageService
+from services.admission_service import AdmissionService, BATCH, INTERACTIVE
+from services.encoding_service import EncodingService
+from utils.error_handlers import handle_overloaded
+from utils import metrics
 
 advanced_bp = Blueprint('advanced', __name__)
 
@@ -17,26 +20,42 @@ def preview_transformation():
         filename = data.get('filename')
         operation = data.get('operation')
         params = data.get('params', {})
-
-        filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-        if not os.path.exists(filepath):
+        try:
+            # Aperçu en PNG par défaut ; jpeg/webp donnent une réponse plus légère
+            spec = EncodingService.normalize(data.get('output'), '.png')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        source, source_key = StorageService.resolve_upload(filename)
+        if source is None:
             return jsonify({'error': 'File not found'}), 404
 
-        img = cv2.imread(filepath)
-        if img is None:
-            return jsonify({'error': 'Failed to read image'}), 400
-
-        # ✅ FIX: Méthode statique directe (pas d'instanciation)
-        result = ProcessingService.apply_operation(img, operation, params)
-
-        # Convert to base64 for preview
-        _, buffer = cv2.imencode('.png', result)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-
-        return jsonify({
-            'preview': f'data:image/png;base64,{img_base64}',
-            'success': True
-        })
+        # Aperçu interactif : prioritaire sur les traitements batch
+        cost = AdmissionService.estimate_cost(filename, [operation])
+        with AdmissionService.admit(cost, INTERACTIVE) as admission:
+            if not admission.admitted:
+                return handle_overloaded(admission.retry_after)
+
+            with metrics.operation(f"preview:{operation}"):
+                try:
+                    img = StorageService.read_image(source, source_key)
+                except ValueError:
+                    return jsonify({'error': 'Failed to read image'}), 400
+
+                # ✅ FIX: Méthode statique directe (pas d'instanciation)
+                result = ProcessingService.apply_operation(img, operation, params)
+
+                # Convert to base64 for preview
+                with metrics.phase('encode'):
+                    buffer, mime_type = EncodingService.encode(result, spec)
+                with metrics.phase('serialize'):
+                    img_base64 = base64.b64encode(buffer).decode('utf-8')
+
+        with metrics.phase('json'):
+            return jsonify({
+                'preview': f'data:{mime_type};base64,{img_base64}',
+                'success': True
+            })
     except Exception as e:
         return jsonify({'error':  str(e)}), 500
 
@@ -49,11 +68,12 @@ def get_histogram(filename):
 
         channel = request.args.get('channel', 'all')
 
-        filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-        if not os.path.exists(filepath):
+        source, source_key = StorageService.resolve_upload(filename)
+        if source is None:
             return jsonify({'error': 'File not found'}), 404
 
-        histogram_data = generate_histogram(filepath, channel)
+        with source.fetch(source_key) as filepath:
+            histogram_data = generate_histogram(filepath, channel)
         return jsonify(histogram_data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -69,14 +89,15 @@ def detect_roi():
         filename = data.get('filename')
         roi_type = data.get('type', 'faces')
 
-        filepath = os.path.join(Config. UPLOAD_FOLDER, filename)
-        if not os.path.exists(filepath):
+        source, source_key = StorageService.resolve_upload(filename)
+        if source is None:
             return jsonify({'error': 'File not found'}), 404
 
-        if roi_type == 'faces':
-            regions = detect_faces(filepath)
-        else:
-            regions = detect_contours(filepath)
+        with source.fetch(source_key) as filepath:
+            if roi_type == 'faces':
+                regions = detect_faces(filepath)
+            else:
+                regions = detect_contours(filepath)
 
         return jsonify({'regions':  regions, 'success': True})
     except Exception as e:
@@ -123,18 +144,23 @@ def get_presets():
 def apply_preset():
     """Apply a preset to an image"""
     try:
-        from services.preset_service import apply_preset_operations
+        from services.preset_service import PRESETS, apply_preset_operations
 
         data = request.json
         filename = data.get('filename')
         preset_name = data.get('preset')
 
-        filepath = os. path.join(Config.UPLOAD_FOLDER, filename)
-        if not os.path.exists(filepath):
+        source, _ = StorageService.resolve_upload(filename)
+        if source is None:
             return jsonify({'error': 'File not found'}), 404
 
-        result_path = apply_preset_operations(filepath, preset_name)
+        operations = [op['type'] for op in PRESETS.get(preset_name, [])]
+        cost = AdmissionService.estimate_cost(filename, operations)
+        with AdmissionService.admit(cost, BATCH) as admission:
+            if not admission.admitted:
+                return handle_overloaded(admission.retry_after)
+            output_filename = apply_preset_operations(filename, preset_name, data.get('output'))
 
-        return jsonify({'processed_image': os.path.basename(result_path), 'success': True})
+        return jsonify({'processed_image': output_filename, 'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
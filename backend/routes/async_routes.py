@@ -0,0 +1,453 @@
+"""Routes asynchrones de la couche ASGI (asgi_app.py).
+
+Les transferts (uploads, téléchargements, ZIP) sont lus et écrits sur la
+boucle d'événements : un client lent n'occupe aucun thread. Les appels aux
+services restent synchrones et sont déportés (run_io pour l'index et le
+stockage, run_cpu pour OpenCV). Les routes absentes d'ici sont servies par
+l'application Flask montée derrière.
+"""
+import logging
+import mimetypes
+import functools
+import tempfile
+import base64
+import time
+import anyio
+from email.utils import formatdate
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import FileStorage
+from config.settings import Config
+from services.upload_service import UploadService
+from services.chunked_upload_service import ChunkedUploadService
+from services.processing_service import ProcessingService
+from services.storage_service import StorageService
+from services.lineage_service import LineageService
+from services.admission_service import AdmissionService, Overloaded, BATCH, INTERACTIVE
+from services.encoding_service import EncodingService
+from routes.download import parse_files_param, write_zip
+from utils.executors import run_cpu, run_cpu_image, run_io
+from utils.file_utils import FileUtils
+from utils import metrics, profiling
+
+logger = logging.getLogger(__name__)
+
+STREAM_BLOCK_SIZE = 256 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024  # au-delà, le corps est mis en tampon sur disque
+
+
+def _error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+def _upload_error(error):
+    logger.error(f"Erreur d'upload: {str(error)}")
+    return JSONResponse({
+        'error': 'Erreur lors de l\'upload',
+        'message': 'Une erreur inattendue s\'est produite'
+    }, status_code=500)
+
+
+def _file_not_found():
+    return _error('Fichier non trouvé', 404)
+
+
+def _overloaded(admission):
+    return JSONResponse({'error': 'Serveur surchargé, réessayez plus tard', 'retry_after': admission.retry_after},
+                        status_code=503, headers={'Retry-After': str(admission.retry_after)})
+
+
+async def _run_admitted(cost, priority, func, *args, run=run_cpu):
+    """Exécute func dans le pool de calcul si le budget l'admet, retourne (admission, résultat)
+
+    Avec run=None, func est une coroutine qui répartit elle-même son travail
+    entre les pools (décodage puis calcul). Protégé de l'annulation (client
+    déconnecté) : le calcul se poursuit de toute façon dans le pool, le budget
+    doit donc rester compté jusqu'à sa fin.
+    """
+    with anyio.CancelScope(shield=True):
+        admission = await run_io(AdmissionService.acquire, cost, priority)
+        if not admission.admitted:
+            return admission, None
+        try:
+            return admission, await (func(*args) if run is None else run(func, *args))
+        finally:
+            AdmissionService.release(admission)
+
+
+async def _resolve_processed(filename, priority=BATCH):
+    """LineageService.resolve sans bloquer la boucle : la régénération d'un
+    résultat évincé est admise puis exécutée dans le pool de calcul.
+
+    Retourne (backend, clé, None), ou (None, None, réponse 503) en cas de délestage.
+    """
+    backend, key, cost = await run_io(LineageService.locate, filename)
+    if cost is None:
+        return backend, key, None
+    admission, regenerated = await _run_admitted(cost, priority, LineageService.regenerate, filename)
+    if not admission.admitted:
+        return None, None, _overloaded(admission)
+    if not regenerated:
+        return None, None, None
+    backend, key = await run_io(StorageService.resolve_processed, filename)
+    return backend, key, None
+
+
+async def _iter_file(fileobj, close=True):
+    """Lit un fichier bloquant par blocs sans bloquer la boucle"""
+    try:
+        while True:
+            block = await run_io(fileobj.read, STREAM_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+    finally:
+        if close:
+            await run_io(fileobj.close)
+
+
+async def _send_stored(request, backend, key, as_attachment=False, download_name=None):
+    """Équivalent asynchrone de FileUtils.send_stored (ETag, 304, Range)"""
+    download_name = download_name or key
+    disposition = 'attachment' if as_attachment else 'inline'
+    etag, mtime, size = await run_io(FileUtils.stored_validators, backend, key)
+    headers = {
+        'ETag': f'"{etag}"',
+        'Last-Modified': formatdate(mtime, usegmt=True),
+        'Cache-Control': FileUtils.cache_control(etag, request.query_params.get('v'))
+    }
+    if FileUtils.not_modified(etag, mtime, request.headers.get('if-none-match'),
+                              request.headers.get('if-modified-since')):
+        return Response(status_code=304, headers=headers)
+
+    path = backend.local_path(key)
+    target = FileUtils.offload_target(path) if path is not None else None
+    if target is not None:
+        headers[target[0]] = target[1]
+        headers['Content-Disposition'] = f'{disposition}; filename="{download_name}"'
+        return Response(media_type=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+                        headers=headers)
+    if path is not None:
+        # FileResponse gère les requêtes Range
+        return FileResponse(path, filename=download_name, content_disposition_type=disposition,
+                            headers=headers)
+
+    fileobj = await run_io(backend.open, key)
+    headers['Content-Disposition'] = f'{disposition}; filename="{download_name}"'
+    headers['Content-Length'] = str(size)
+    return StreamingResponse(
+        _iter_file(fileobj),
+        media_type=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+        headers=headers)
+
+
+async def health(request):
+    return JSONResponse({'status': 'healthy', 'storage_backend': Config.STORAGE_BACKEND, 'asgi': True,
+                         'admission': AdmissionService.snapshot()})
+
+
+async def gallery(request):
+    """Récupérer la galerie d'images"""
+    try:
+        images = await run_io(FileUtils.get_uploaded_images)
+        return JSONResponse({'images': images, 'total': len(images)})
+    except Exception as e:
+        return _upload_error(e)
+
+
+async def upload_files(request):
+    """Upload multiple files : le corps multipart est reçu sans occuper de thread"""
+    max_body = Config.MAX_FILE_SIZE * Config.MAX_FILES_PER_UPLOAD + 1024 * 1024
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > max_body:
+        return _error(f"Requête trop volumineuse (max {Config.MAX_FILES_PER_UPLOAD} fichiers de "
+                      f"{Config.MAX_FILE_SIZE // (1024*1024)}MB)", 413)
+
+    try:
+        form = await request.form()
+    except Exception as e:
+        return _error(f"Corps multipart invalide: {e}", 400)
+
+    try:
+        uploads = [f for f in form.getlist('files') if hasattr(f, 'filename')]
+        if not uploads:
+            return _error('Aucun fichier fourni', 400)
+        if all(not f.filename for f in uploads):
+            return _error('Aucun fichier sélectionné', 400)
+
+        # Même interface que request.files côté Flask : le service est inchangé
+        files = [FileStorage(stream=f.file, filename=f.filename, content_type=f.content_type)
+                 for f in uploads]
+        success, results = await run_io(UploadService.upload_files, files)
+        if not success:
+            return _error(results, 400)
+
+        successful = [r for r in results if r.get('success')]
+        failed = [r for r in results if not r.get('success')]
+        return JSONResponse({
+            'message': f'{len(successful)} fichier(s) uploadé(s) avec succès',
+            'successful_uploads': successful,
+            'failed_uploads': failed,
+            'total_uploaded': len(successful),
+            'total_deduplicated': len([r for r in successful if r.get('deduplicated')])
+        })
+    except Exception as e:
+        return _upload_error(e)
+    finally:
+        await form.close()
+
+
+async def put_chunk(request):
+    """Reçoit un morceau brut à la position ?offset=N, mis en tampon de façon asynchrone"""
+    upload_id = request.path_params['upload_id']
+    offset = request.query_params.get('offset')
+    if offset is None or not offset.isdigit():
+        return _error('Paramètre offset requis', 400)
+
+    too_large = f'Morceau trop volumineux (max {Config.MAX_CHUNK_SIZE // (1024*1024)}MB)'
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > Config.MAX_CHUNK_SIZE:
+        return _error(too_large, 413)
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as body:
+        received = 0
+        async for block in request.stream():
+            received += len(block)
+            if received > Config.MAX_CHUNK_SIZE:
+                return _error(too_large, 413)
+            await run_io(body.write, block)
+        body.seek(0)
+
+        try:
+            session, error = await run_io(ChunkedUploadService.write_chunk, upload_id, int(offset), body)
+        except Exception as e:
+            return _upload_error(e)
+
+    if session is None:
+        return _error(error, 404)
+    if error == 'Offset invalide':
+        return JSONResponse({'error': error, 'received': session['received']}, status_code=409)
+    if error:
+        return _error(error, 400)
+    return JSONResponse({'upload_id': upload_id, 'received': session['received'], 'size': session['size']})
+
+
+async def get_image(request):
+    """Récupérer une image spécifique"""
+    filename = request.path_params['filename']
+    backend, key = await run_io(StorageService.resolve_upload, filename)
+    if backend is None:
+        return _file_not_found()
+    return await _send_stored(request, backend, key, download_name=filename)
+
+
+async def get_processed_image(request):
+    """Récupère une image traitée (régénérée si elle a été évincée)"""
+    filename = request.path_params['filename']
+    backend, key, overloaded = await _resolve_processed(filename, INTERACTIVE)
+    if overloaded is not None:
+        return overloaded
+    if backend is None:
+        return _file_not_found()
+    return await _send_stored(request, backend, key)
+
+
+async def download_processed_image(request):
+    """Télécharge une image traitée"""
+    filename = request.path_params['filename']
+    backend, key, overloaded = await _resolve_processed(filename)
+    if overloaded is not None:
+        return overloaded
+    if backend is None:
+        return _file_not_found()
+    return await _send_stored(request, backend, key, as_attachment=True, download_name=filename)
+
+
+async def download_single(request):
+    filename = request.path_params['filename']
+    backend, key, overloaded = await _resolve_processed(filename)
+    if overloaded is not None:
+        return overloaded
+    if backend is None:
+        return JSONResponse({'error': f'File not found: {filename}'}, status_code=404)
+    return await _send_stored(request, backend, key, as_attachment=True, download_name=filename)
+
+
+async def batch_download(request):
+    """ZIP construit dans un thread (tampon disque au-delà de 8MB), puis envoyé en flux"""
+    files_param = request.query_params.get('files')
+    if not files_param:
+        return _error('No files specified. Use ?files=file1.jpg,file2.jpg', 400)
+    files = parse_files_param(files_param)
+    if not files:
+        return _error('No valid files specified', 400)
+
+    # Régénère d'abord les fichiers évincés dans le pool de calcul : write_zip
+    # n'a plus qu'à les lire
+    for filename in files:
+        _, _, overloaded = await _resolve_processed(filename)
+        if overloaded is not None:
+            return overloaded
+
+    archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        found_files, missing_files = await run_io(write_zip, files, archive)
+    except Overloaded as e:
+        archive.close()
+        return _overloaded(e)
+    if not found_files:
+        archive.close()
+        return JSONResponse({'error': 'None of the requested files were found', 'missing': missing_files},
+                            status_code=404)
+
+    archive.seek(0)
+    return StreamingResponse(_iter_file(archive), media_type='application/zip',
+                             headers={'Content-Disposition': 'attachment; filename="images.zip"'})
+
+
+async def process_image(request):
+    """Traite une image : le calcul OpenCV tourne dans le pool partagé"""
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not data:
+        return _error('Données JSON requises', 400)
+
+    filename = data.get('filename')
+    operation = data.get('operation')
+    params = data.get('parameters', {})
+    if not filename or not operation:
+        return _error('filename et operation requis', 400)
+
+    try:
+        cost = await run_io(AdmissionService.estimate_cost, filename, [operation])
+        admission, result = await _run_admitted(cost, BATCH, ProcessingService.process_image,
+                                                filename, operation, params, data.get('output'))
+    except Exception as e:
+        return _upload_error(e)
+    if not admission.admitted:
+        return _overloaded(admission)
+    output_filename, error = result
+    if error:
+        return _error(error, 400)
+
+    return JSONResponse({
+        'message': 'Traitement terminé avec succès',
+        'input_file': filename,
+        'output_file': output_filename,
+        'operation': operation,
+        'parameters': params
+    })
+
+
+async def apply_preset(request):
+    """Apply a preset to an image"""
+    from services.preset_service import PRESETS, apply_preset_operations
+
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        preset_name = data.get('preset')
+
+        source, _ = await run_io(StorageService.resolve_upload, filename)
+        if source is None:
+            return _error('File not found', 404)
+
+        operations = [op['type'] for op in PRESETS.get(preset_name, [])]
+        cost = await run_io(AdmissionService.estimate_cost, filename, operations)
+        admission, output_filename = await _run_admitted(cost, BATCH, apply_preset_operations,
+                                                         filename, preset_name, data.get('output'))
+        if not admission.admitted:
+            return _overloaded(admission)
+        return JSONResponse({'processed_image': output_filename, 'success': True})
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+def _render_preview(img, operation, params, spec):
+    """Exécuté dans le pool : opération puis encodage, seul le fichier encodé revient"""
+    result = ProcessingService.apply_operation(img, operation, params)
+    buffer, mime_type = EncodingService.encode(result, spec)
+    return buffer.tobytes(), mime_type
+
+
+async def _read_and_render(source, source_key, operation, params, spec):
+    """Décodage (pool d'E/S) puis rendu (pool de calcul) ; None si l'image est illisible"""
+    try:
+        img = await run_io(StorageService.read_image, source, source_key)
+    except ValueError:
+        return None
+    return await run_cpu_image(_render_preview, img, operation, params, spec)
+
+
+async def preview_transformation(request):
+    """Aperçu sans enregistrement : l'image décodée est transmise au pool par mémoire partagée"""
+    try:
+        data = await request.json()
+        filename = data.get('filename')
+        operation = data.get('operation')
+        params = data.get('params', {})
+        try:
+            spec = EncodingService.normalize(data.get('output'), '.png')
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        source, source_key = await run_io(StorageService.resolve_upload, filename)
+        if source is None:
+            return _error('File not found', 404)
+
+        # Coût estimé d'après les métadonnées de l'index : l'image n'est décodée qu'une fois admise
+        cost = await run_io(AdmissionService.estimate_cost, filename, [operation])
+        admission, result = await _run_admitted(cost, INTERACTIVE, _read_and_render,
+                                                source, source_key, operation, params, spec, run=None)
+        if not admission.admitted:
+            return _overloaded(admission)
+        if result is None:
+            return _error('Failed to read image', 400)
+        buffer, mime_type = result
+        return JSONResponse({
+            'preview': f'data:{mime_type};base64,{base64.b64encode(buffer).decode("utf-8")}',
+            'success': True
+        })
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+def _route(path, endpoint, methods):
+    """Route instrumentée, étiquetée comme côté Flask (/api/image/<filename>)"""
+    label = path.replace('{', '<').replace('}', '>')
+
+    @functools.wraps(endpoint)
+    async def timed(request):
+        start = metrics.request_started()
+        # ?profile (administration) : durée totale seulement, les phases et cProfile
+        # restent propres aux routes Flask (coroutines entrelacées, pools partagés)
+        profiled = bool(request.query_params.get('profile')) and profiling.is_admin(request)
+        status = 500
+        try:
+            response = await endpoint(request)
+            status = response.status_code
+            if profiled:
+                response.headers['Server-Timing'] = profiling.server_timing({}, time.perf_counter() - start)
+            return response
+        finally:
+            metrics.request_finished(start, label, request.method, status)
+
+    return Route(path, timed, methods=methods)
+
+
+routes = [
+    _route('/api/health', health, ['GET']),
+    _route('/api/gallery', gallery, ['GET']),
+    _route('/api/upload', upload_files, ['POST']),
+    _route('/api/upload/{upload_id}/chunk', put_chunk, ['PUT']),
+    _route('/api/image/{filename}', get_image, ['GET']),
+    _route('/api/processed/{filename}', get_processed_image, ['GET']),
+    _route('/api/download/batch', batch_download, ['GET']),
+    _route('/api/download/single/{filename}', download_single, ['GET']),
+    _route('/api/download/{filename}', download_processed_image, ['GET']),
+    _route('/api/process', process_image, ['POST']),
+    _route('/api/preview', preview_transformation, ['POST']),
+    _route('/api/preset/apply', apply_preset, ['POST']),
+]
@@ -1,22 +1,18 @@
 from flask import Blueprint, send_file, request, jsonify
 import os
+import shutil
 import zipfile
-import io
+import tempfile
 from config.settings import Config
+from services.lineage_service import LineageService
+from services.admission_service import Overloaded
+from utils.error_handlers import handle_overloaded
+from utils.file_utils import FileUtils
 
 download_bp = Blueprint("download", __name__)
 
-# Use the same PROCESSED_FOLDER path as defined in Config
-PROCESSED_FOLDER = Config.PROCESSED_FOLDER
-
-# Add this to verify the path on startup
-print(f"[DOWNLOAD] PROCESSED_FOLDER: {PROCESSED_FOLDER}")
-print(f"[DOWNLOAD] Folder exists: {os.path.exists(PROCESSED_FOLDER)}")
-if os.path.exists(PROCESSED_FOLDER):
-    files = os.listdir(PROCESSED_FOLDER)
-    print(f"[DOWNLOAD] Files in folder: {len(files)}")
-    if files:
-        print(f"[DOWNLOAD] First 5 files: {files[:5]}")
+# Log the storage backend on startup (no directory listing: it does not scale)
+print(f"[DOWNLOAD] Storage backend: {Config.STORAGE_BACKEND}")
 
 
 def safe_filename(filename):
@@ -24,6 +20,32 @@ def safe_filename(filename):
     return os.path.basename(filename)
 
 
+def parse_files_param(files_param):
+    """Split and sanitize the ?files= list"""
+    return [safe_filename(fn.strip()) for fn in files_param.split(",") if fn.strip()]
+
+
+def write_zip(files, fileobj):
+    """Write the processed files into a ZIP archive, return (found, missing)"""
+    found_files = []
+    missing_files = []
+
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as zf:
+        for filename in files:
+            backend, key = LineageService.resolve(filename)
+
+            if backend is not None:
+                with backend.open(key) as src, zf.open(filename, "w") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                found_files.append(filename)
+                print(f"[BATCH DOWNLOAD] ✅ Added: {filename}")
+            else:
+                missing_files.append(filename)
+                print(f"[BATCH DOWNLOAD] ❌ Missing: {filename}")
+
+    return found_files, missing_files
+
+
 @download_bp.route("/download/batch", methods=["GET"])
 def batch_download():
     """Download multiple files as a ZIP archive
@@ -37,33 +59,26 @@ def batch_download():
         return jsonify({"error": "No files specified. Use ?files=file1.jpg,file2.jpg"}), 400
 
     # Parse and sanitize filenames
-    files = files_param.split(",")
-    files = [safe_filename(fn.strip()) for fn in files if fn.strip()]
+    files = parse_files_param(files_param)
 
     if not files:
         return jsonify({"error": "No valid files specified"}), 400
 
     print(f"[BATCH DOWNLOAD] Requested {len(files)} files: {files}")
 
-    # Create ZIP in memory
-    memory_file = io.BytesIO()
-    found_files = []
-    missing_files = []
-
-    with zipfile.ZipFile(memory_file, "w", zipfile.ZIP_DEFLATED) as zf:
-        for filename in files:
-            filepath = os.path.join(PROCESSED_FOLDER, filename)
-
-            if os.path.isfile(filepath):
-                zf.write(filepath, arcname=filename)
-                found_files.append(filename)
-                print(f"[BATCH DOWNLOAD] ✅ Added: {filename}")
-            else:
-                missing_files.append(filename)
-                print(f"[BATCH DOWNLOAD] ❌ Missing: {filename}")
+    # Create ZIP in an anonymous temporary file: a real file descriptor lets the
+    # WSGI server send it with sendfile() (gunicorn's wsgi.file_wrapper)
+    archive = tempfile.TemporaryFile()
+    try:
+        found_files, missing_files = write_zip(files, archive)
+    except Overloaded as e:
+        # An evicted file could not be regenerated within the processing budget
+        archive.close()
+        return handle_overloaded(e.retry_after)
 
     # Return error if no files found
     if not found_files:
+        archive.close()
         return jsonify({
             "error": "None of the requested files were found",
             "missing": missing_files
@@ -71,13 +86,16 @@ def batch_download():
 
     print(f"[BATCH DOWNLOAD] Success: {len(found_files)} files, {len(missing_files)} missing")
 
-    memory_file.seek(0)
-    return send_file(
-        memory_file,
+    size = archive.tell()
+    archive.seek(0)
+    response = send_file(
+        archive,
         mimetype="application/zip",
         download_name="images.zip",
         as_attachment=True,
     )
+    response.content_length = size
+    return response
 
 
 @download_bp.route("/download/single/<filename>", methods=["GET"])
@@ -89,22 +107,18 @@ def download_single(filename):
     print(f"\n[SINGLE DOWNLOAD] Request received")
 
     filename = safe_filename(filename)
-    filepath = os.path.join(PROCESSED_FOLDER, filename)
+    try:
+        backend, key = LineageService.resolve(filename)
+    except Overloaded as e:
+        return handle_overloaded(e.retry_after)
 
     print(f"[SINGLE DOWNLOAD] Requested: {filename}")
-    print(f"[SINGLE DOWNLOAD] Full path: {filepath}")
-    print(f"[SINGLE DOWNLOAD] File exists: {os.path.isfile(filepath)}")
-
-    if not os.path.isfile(filepath):
-        # Show available files for debugging
-        if os.path.exists(PROCESSED_FOLDER):
-            available = os.listdir(PROCESSED_FOLDER)[:10]
-            print(f"[SINGLE DOWNLOAD] Available files (first 10): {available}")
+    print(f"[SINGLE DOWNLOAD] File exists: {backend is not None}")
 
+    if backend is None:
         return jsonify({
-            "error": f"File not found: {filename}",
-            "path_checked": filepath
+            "error": f"File not found: {filename}"
         }), 404
 
     print(f"[SINGLE DOWNLOAD] ✅ Sending file: {filename}")
-    return send_file(filepath, as_attachment=True, download_name=filename)
\ No newline at end of file
+    return FileUtils.send_stored(backend, key, as_attachment=True, download_name=filename)
\ No newline at end of file
@@ -0,0 +1,10 @@
+from flask import Blueprint, Response
+from utils import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métriques au format texte Prometheus"""
+    body, content_type = metrics.export()
+    return Response(body, content_type=content_type)
@@ -1,9 +1,12 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, request, jsonify, send_file
 from services.processing_service import ProcessingService
 from services.operations_service import OperationsService
-from utils.error_handlers import handle_upload_error, handle_file_not_found
-from config.settings import Config
-import os
+from services.tile_service import TileService
+from services.storage_service import StorageService
+from services.lineage_service import LineageService
+from services.admission_service import AdmissionService, Overloaded, BATCH, INTERACTIVE
+from utils.error_handlers import handle_upload_error, handle_file_not_found, handle_overloaded
+from utils.file_utils import FileUtils
 from PIL import Image, ImageFilter
 from flask import current_app
 processing_bp = Blueprint('processing', __name__)
@@ -24,18 +27,25 @@ def process_image():
         if not filename or not operation:
             return jsonify({'error': 'filename et operation requis'}), 400
         
-        # Traiter l'image
-        output_filename, error = ProcessingService.process_image(filename, operation, params)
+        # Traiter l'image (admis selon son coût estimé, sinon 503)
+        cost = AdmissionService.estimate_cost(filename, [operation])
+        with AdmissionService.admit(cost, BATCH) as admission:
+            if not admission.admitted:
+                return handle_overloaded(admission.retry_after)
+            output_filename, error = ProcessingService.process_image(filename, operation, params,
+                                                                     data.get('output'))
         
         if error:
             return jsonify({'error': error}), 400
-         # Sauvegarder l'image traitée dans PROCESSED_FOLDER
-        input_path = os.path.join(Config.UPLOAD_FOLDER, filename)
-        output_path = os.path.join(Config.PROCESSED_FOLDER, output_filename)
+         # Sauvegarder l'image traitée dans le stockage des images traitées
+        processed = StorageService.processed()
         
-        if not os.path.exists(output_path):  # si le fichier n'existe pas déjà
+        if not processed.exists(output_filename):  # si le fichier n'existe pas déjà
             from PIL import Image
-            img = Image.open(input_path)
+            source, source_key = StorageService.resolve_upload(filename)
+            with source.open(source_key) as f:
+                img = Image.open(f)
+                img.load()
             
             # Refaire le même traitement que ProcessingService pour sauvegarde
             if operation == "blur_mean":
@@ -48,7 +58,8 @@ def process_image():
                 from PIL import ImageFilter
                 img = img.filter(ImageFilter.MedianFilter(params.get("kernel_size", 5)))
             
-            img.save(output_path)
+            with processed.staging(output_filename) as output_path:
+                img.save(output_path)
         
         return jsonify({
             'message': 'Traitement terminé avec succès',
@@ -74,19 +85,49 @@ def get_operations():
 def get_processed_image(filename):
     """Récupère une image traitée"""
     try:
-        return send_from_directory(Config.PROCESSED_FOLDER, filename)
-    except FileNotFoundError:
+        backend, key = LineageService.resolve(filename, INTERACTIVE)
+    except Overloaded as e:
+        return handle_overloaded(e.retry_after)
+    if backend is None:
         return handle_file_not_found()
+    return FileUtils.send_stored(backend, key)
+
+@processing_bp.route('/processed/<filename>/tiles', methods=['GET'])
+def get_processed_tiles(filename):
+    """Décrit la pyramide de tuiles d'une image traitée"""
+    try:
+        backend, key = LineageService.resolve(filename, INTERACTIVE)
+        if backend is None:
+            return handle_file_not_found()
+        return jsonify(TileService.get_descriptor(backend, key, filename))
+    except Overloaded as e:
+        return handle_overloaded(e.retry_after)
+    except Exception as e:
+        return handle_upload_error(e)
+
+@processing_bp.route('/processed/<filename>/tiles/<int:level>/<int:x>_<int:y>', methods=['GET'])
+def get_processed_tile(filename, level, x, y):
+    """Récupère une tuile d'une image traitée, générée à la demande"""
+    try:
+        backend, key = LineageService.resolve(filename, INTERACTIVE)
+        if backend is None:
+            return handle_file_not_found()
+        tile_path, error = TileService.get_tile(backend, key, level, x, y)
+        if error:
+            return jsonify({'error': error}), 400
+        return send_file(tile_path)
+    except Overloaded as e:
+        return handle_overloaded(e.retry_after)
+    except Exception as e:
+        return handle_upload_error(e)
 
 @processing_bp.route('/download/<filename>', methods=['GET'])
 def download_processed_image(filename):
     """Télécharge une image traitée"""
     try:
-        return send_from_directory(
-            Config.PROCESSED_FOLDER, 
-            filename, 
-            as_attachment=True,
-            download_name=filename
-        )
-    except FileNotFoundError:
-        return handle_file_not_found()
\ No newline at end of file
+        backend, key = LineageService.resolve(filename)
+    except Overloaded as e:
+        return handle_overloaded(e.retry_after)
+    if backend is None:
+        return handle_file_not_found()
+    return FileUtils.send_stored(backend, key, as_attachment=True, download_name=filename)
\ No newline at end of file
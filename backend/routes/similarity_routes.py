@@ -0,0 +1,30 @@
+from flask import Blueprint, jsonify, request
+from services.similarity_service import SimilarityService
+
+similarity_bp = Blueprint('similarity', __name__)
+
+def _distance():
+    """Rayon de Hamming ?distance= (défaut 6), None si invalide"""
+    distance = request.args.get('distance', SimilarityService.DEFAULT_DISTANCE, type=int)
+    if distance is None or not 0 <= distance <= SimilarityService.MAX_DISTANCE:
+        return None
+    return distance
+
+@similarity_bp.route('/image/<filename>/similar', methods=['GET'])
+def get_similar(filename):
+    """Images à distance de Hamming <= ?distance= (empreintes perceptuelles 64 bits)"""
+    distance = _distance()
+    if distance is None:
+        return jsonify({'error': f'distance doit être un entier entre 0 et {SimilarityService.MAX_DISTANCE}'}), 400
+    matches = SimilarityService.similar(filename, distance)
+    if matches is None:
+        return jsonify({'error': 'Image non trouvée ou sans empreinte'}), 404
+    return jsonify({'filename': filename, 'distance': distance, 'matches': matches, 'total': len(matches)})
+
+@similarity_bp.route('/duplicates', methods=['GET'])
+def get_duplicates():
+    """Rapport de doublons de la galerie : groupes, image gardée, images supprimables"""
+    distance = _distance()
+    if distance is None:
+        return jsonify({'error': f'distance doit être un entier entre 0 et {SimilarityService.MAX_DISTANCE}'}), 400
+    return jsonify(SimilarityService.report(distance))
@@ -0,0 +1,21 @@
+from flask import Blueprint, jsonify, request
+from services.stats_service import StatsService
+
+stats_bp = Blueprint('stats', __name__)
+
+@stats_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """Moyenne, écart-type, min/max et histogrammes par canal (R, G, B) des images uploadées.
+
+    Filtres : ?format=PNG, ?mode=RGB (agrégats maintenus, lecture directe),
+    ?files=a.png,b.png, ?since= / ?until= (date d'upload ISO) ; ?histogram=0
+    omet les histogrammes.
+    """
+    files = request.args.get('files')
+    filenames = [name.strip() for name in files.split(',') if name.strip()] if files else None
+    stats = StatsService.summary(filenames, request.args.get('format'), request.args.get('mode'),
+                                 request.args.get('since'), request.args.get('until'),
+                                 histogram=request.args.get('histogram', '1') != '0')
+    if stats is None:
+        return jsonify({'error': 'Aucune image dans cette sélection'}), 404
+    return jsonify(stats)
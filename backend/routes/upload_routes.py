@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, request, jsonify, send_file
 from services.upload_service import UploadService
+from services.chunked_upload_service import ChunkedUploadService
 from services.image_service import ImageService
+from services.tile_service import TileService
+from services.storage_service import StorageService
 from utils.file_utils import FileUtils
 from utils.error_handlers import handle_upload_error, handle_file_not_found
 from config.settings import Config
@@ -28,7 +31,8 @@ def upload_files():
                 'message': f'{len(successful)} fichier(s) uploadé(s) avec succès',
                 'successful_uploads': successful,
                 'failed_uploads': failed,
-                'total_uploaded': len(successful)
+                'total_uploaded': len(successful),
+                'total_deduplicated': len([r for r in successful if r.get('deduplicated')])
             })
         else:
             return jsonify({'error': results}), 400
@@ -36,6 +40,66 @@ def upload_files():
     except Exception as e:
         return handle_upload_error(e)
 
+@upload_bp.route('/upload/init', methods=['POST'])
+def init_chunked_upload():
+    """Ouvre une session d'upload par morceaux (reprenable)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        session, errors = ChunkedUploadService.init_upload(data.get('filename'), data.get('size'))
+        if errors:
+            return jsonify({'error': 'Upload refusé', 'errors': errors}), 400
+        return jsonify(session), 201
+    except Exception as e:
+        return handle_upload_error(e)
+
+@upload_bp.route('/upload/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """État d'une session : permet au client de reprendre à 'received'"""
+    session = ChunkedUploadService.get_status(upload_id)
+    if session is None:
+        return jsonify({'error': 'Session d\'upload inconnue'}), 404
+    return jsonify(session)
+
+@upload_bp.route('/upload/<upload_id>/chunk', methods=['PUT'])
+def put_chunk(upload_id):
+    """Reçoit un morceau brut (corps de la requête) à la position ?offset=N"""
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'Paramètre offset requis'}), 400
+        if request.content_length and request.content_length > Config.MAX_CHUNK_SIZE:
+            return jsonify({'error': f'Morceau trop volumineux (max {Config.MAX_CHUNK_SIZE // (1024*1024)}MB)'}), 413
+
+        session, error = ChunkedUploadService.write_chunk(upload_id, offset, request.stream)
+        if session is None:
+            return jsonify({'error': error}), 404
+        if error == 'Offset invalide':
+            return jsonify({'error': error, 'received': session['received']}), 409
+        if error:
+            return jsonify({'error': error}), 400
+        return jsonify({'upload_id': upload_id, 'received': session['received'], 'size': session['size']})
+    except Exception as e:
+        return handle_upload_error(e)
+
+@upload_bp.route('/upload/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Finalise l'upload (hash optionnel à vérifier : {"sha256": "..."})"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result, error = ChunkedUploadService.complete_upload(upload_id, data.get('sha256'))
+        if error:
+            return jsonify({'error': error}), 400
+        return jsonify(result)
+    except Exception as e:
+        return handle_upload_error(e)
+
+@upload_bp.route('/upload/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Abandonne une session d'upload"""
+    if ChunkedUploadService.abort_upload(upload_id):
+        return jsonify({'message': 'Upload annulé'})
+    return jsonify({'error': 'Session d\'upload inconnue'}), 404
+
 @upload_bp.route('/gallery', methods=['GET'])
 def get_gallery():
     """Récupérer la galerie d'images"""
@@ -51,10 +115,10 @@ def get_gallery():
 @upload_bp.route('/image/<filename>', methods=['GET'])
 def get_image(filename):
     """Récupérer une image spécifique"""
-    try:
-        return send_from_directory(Config.UPLOAD_FOLDER, filename)
-    except FileNotFoundError:
+    backend, key = StorageService.resolve_upload(filename)
+    if backend is None:
         return handle_file_not_found()
+    return FileUtils.send_stored(backend, key, download_name=filename)
 
 @upload_bp.route('/image/<filename>', methods=['DELETE'])
 def delete_image(filename):
@@ -76,5 +140,30 @@ def get_image_info(filename):
             return jsonify(info)
         else:
             return handle_file_not_found()
+    except Exception as e:
+        return handle_upload_error(e)
+
+@upload_bp.route('/image/<filename>/tiles', methods=['GET'])
+def get_image_tiles(filename):
+    """Décrit la pyramide de tuiles d'une image (deep zoom)"""
+    try:
+        backend, key = StorageService.resolve_upload(filename)
+        if backend is None:
+            return handle_file_not_found()
+        return jsonify(TileService.get_descriptor(backend, key, filename))
+    except Exception as e:
+        return handle_upload_error(e)
+
+@upload_bp.route('/image/<filename>/tiles/<int:level>/<int:x>_<int:y>', methods=['GET'])
+def get_image_tile(filename, level, x, y):
+    """Récupère une tuile de la pyramide, générée à la demande"""
+    try:
+        backend, key = StorageService.resolve_upload(filename)
+        if backend is None:
+            return handle_file_not_found()
+        tile_path, error = TileService.get_tile(backend, key, level, x, y)
+        if error:
+            return jsonify({'error': error}), 400
+        return send_file(tile_path)
     except Exception as e:
         return handle_upload_error(e)
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""Point d'entrée de production : gunicorn pré-forké, OpenCV réglé par worker.
+
+Usage (depuis backend/) : python serve.py
+
+Réglages dans Config (variables d'environnement SERVER_*, CPU_BUDGET,
+OPENCV_THREADS). start_server.py reste le serveur de développement.
+"""
+import os
+import shutil
+from config.settings import Config
+
+# Les pools OpenMP/BLAS sont dimensionnés à l'import de numpy/cv2 :
+# fixer la limite avant de les charger, une fois pour tous les workers
+os.environ.setdefault('OMP_NUM_THREADS', str(Config.OPENCV_THREADS))
+os.environ.setdefault('OPENBLAS_NUM_THREADS', str(Config.OPENCV_THREADS))
+
+# Métriques agrégées sur tous les workers : le dossier doit être connu (et vidé)
+# avant l'import de prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', Config.METRICS_MULTIPROC_DIR)
+shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Importés avant le fork : les workers partagent les pages des bibliothèques
+import cv2
+import numpy  # noqa: F401
+from app import create_app
+from services.lineage_service import LineageService
+from utils import lifecycle, metrics
+from prometheus_client import multiprocess
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # Windows, ou gunicorn absent
+    BaseApplication = None
+
+
+def when_ready(server):
+    # Le ramasse-miettes démarré par create_app tourne dans chaque worker, pas dans le maître
+    LineageService.stop_collector()
+    server.log.info(f"OpenCV: {Config.OPENCV_THREADS} thread(s) par worker, "
+                    f"{Config.SERVER_WORKERS} worker(s) x {Config.SERVER_THREADS} thread(s)")
+
+
+def post_fork(server, worker):
+    cv2.setNumThreads(Config.OPENCV_THREADS)
+    LineageService.start_collector()
+    metrics.worker_threads.set(Config.SERVER_THREADS)
+
+
+def worker_exit(server, worker):
+    # Les requêtes en cours sont terminées (graceful_timeout) : attendre les travaux de fond
+    lifecycle.shutdown()
+
+
+def child_exit(server, worker):
+    # Retire les jauges du worker arrêté ; ses compteurs restent acquis
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def gunicorn_options():
+    return {
+        'bind': Config.SERVER_BIND,
+        'workers': Config.SERVER_WORKERS,
+        'threads': Config.SERVER_THREADS,
+        'worker_class': 'gthread',
+        'timeout': Config.SERVER_TIMEOUT,
+        'graceful_timeout': Config.SERVER_GRACEFUL_TIMEOUT,
+        'max_requests': Config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': Config.SERVER_MAX_REQUESTS // 10,
+        'preload_app': True,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'child_exit': child_exit,
+    }
+
+
+if BaseApplication is not None:
+    class ProductionServer(BaseApplication):
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def main():
+    if BaseApplication is None:
+        raise SystemExit("gunicorn est requis (pip install gunicorn) ; "
+                         "il n'est pas disponible sous Windows : utiliser start_server.py")
+    app = create_app()
+    app.config['DEBUG'] = False
+    cv2.setNumThreads(Config.OPENCV_THREADS)
+    ProductionServer(app, gunicorn_options()).run()
+
+
+if __name__ == '__main__':
+    main()
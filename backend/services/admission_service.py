@@ -0,0 +1,241 @@
+"""Contrôle d'admission des traitements (délestage par coût estimé).
+
+Le coût d'une requête est une estimation de son temps de calcul en secondes :
+mégapixels de l'image source (métadonnées de l'index) multipliés par le
+coefficient de chaque opération. Les coefficients viennent de
+``Config.OPERATION_COSTS_FILE`` s'il existe, produit par :
+
+    python -m services.admission_service   (depuis backend/)
+
+Les requêtes sont admises tant que le nombre et le coût des traitements en
+cours restent dans le budget du processus ; sinon elles attendent dans une
+file bornée, puis sont refusées (503 + Retry-After). Les aperçus
+interactifs ont priorité et disposent d'une réserve que les traitements
+« batch » ne peuvent pas consommer.
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image
+from config.settings import Config
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from utils import metrics
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+# Secondes par mégapixel (mesurées sur un cœur, image 3 canaux, lecture/écriture comprises
+# pour les opérations de /api/process) ; remplacées par le fichier de calibration s'il existe
+DEFAULT_COSTS = {
+    # /api/process (fichier -> fichier)
+    'grayscale': 0.021, 'threshold': 0.019, 'blur_gaussian': 0.048, 'blur_median': 0.060,
+    'blur_average': 0.058, 'sharpen_kernel': 0.062, 'edge_canny': 0.046, 'edge_sobel': 0.050,
+    'edge_prewitt': 0.043, 'edge_laplacian': 0.032, 'resize': 0.010, 'rotate': 0.055,
+    'flip': 0.041, 'normalize': 0.040, 'histogram_eq': 0.049, 'histogram_stretch': 0.055,
+    'extract_channel': 0.043,
+    # aperçus et presets (en mémoire)
+    'blur': 0.003, 'gaussian_blur': 0.003, 'sharpen': 0.004, 'canny': 0.024,
+    'histogram_equalization': 0.004, 'bilateral_filter': 0.138, 'adaptive_threshold': 0.006,
+    'median_blur': 0.006, 'brightness': 0.008, 'contrast': 0.002, 'contrast_brightness': 0.001,
+}
+DEFAULT_OPERATION_COST = 0.05
+
+
+class Overloaded(Exception):
+    """Délestage d'un traitement déclenché en cours de route (régénération d'un résultat évincé)"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Serveur surchargé, réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+class Admission:
+    """Résultat d'une demande d'admission"""
+
+    def __init__(self, cost, priority, admitted, retry_after=0, waited=0.0):
+        self.cost = cost
+        self.priority = priority
+        self.admitted = admitted
+        self.retry_after = retry_after
+        self.waited = waited
+
+
+class AdmissionService:
+    _cond = threading.Condition()
+    _in_flight = 0
+    _in_flight_cost = 0.0
+    _waiting = {INTERACTIVE: 0, BATCH: 0}
+    _rejected = 0
+    _costs = None
+
+    # ===== ESTIMATION =====
+    @staticmethod
+    def operation_costs():
+        if AdmissionService._costs is None:
+            costs = dict(DEFAULT_COSTS)
+            if os.path.exists(Config.OPERATION_COSTS_FILE):
+                with open(Config.OPERATION_COSTS_FILE) as f:
+                    costs.update(json.load(f))
+            AdmissionService._costs = costs
+        return AdmissionService._costs
+
+    @staticmethod
+    def estimate_cost(filename, operations):
+        """Coût estimé (secondes) d'une suite d'opérations sur une image uploadée"""
+        megapixels = AdmissionService._pixels(filename) / 1e6
+        costs = AdmissionService.operation_costs()
+        per_megapixel = sum(costs.get(op, DEFAULT_OPERATION_COST) for op in operations)
+        return megapixels * per_megapixel
+
+    @staticmethod
+    def _pixels(filename):
+        upload = IndexService.get_upload(filename)
+        metadata = upload['metadata'] if upload else {}
+        if metadata.get('width') and metadata.get('height'):
+            return metadata['width'] * metadata['height'] * metadata.get('frames', 1)
+
+        # Ancien upload non indexé : lecture de l'en-tête seulement
+        backend, key = StorageService.resolve_upload(filename)
+        if backend is None:
+            return 0
+        try:
+            with backend.open(key) as f, Image.open(f) as img:
+                return img.width * img.height * getattr(img, 'n_frames', 1)
+        except Exception:
+            return 0
+
+    # ===== ADMISSION =====
+    @staticmethod
+    def acquire(cost, priority=BATCH):
+        """Attend une place dans le budget ; Admission.admitted est False en cas de délestage"""
+        cond = AdmissionService._cond
+        start = time.monotonic()
+        with cond:
+            if not AdmissionService._can_admit(cost, priority):
+                if sum(AdmissionService._waiting.values()) >= Config.ADMISSION_MAX_QUEUE:
+                    return AdmissionService._reject(cost, priority, 0.0)
+
+                AdmissionService._waiting[priority] += 1
+                metrics.queue_depth.labels(f"admission_{priority}").inc()
+                deadline = start + Config.ADMISSION_QUEUE_TIMEOUT
+                try:
+                    while not AdmissionService._can_admit(cost, priority):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return AdmissionService._reject(cost, priority, time.monotonic() - start)
+                        cond.wait(remaining)
+                finally:
+                    AdmissionService._waiting[priority] -= 1
+                    metrics.queue_depth.labels(f"admission_{priority}").dec()
+                    # Un aperçu qui quitte la file peut débloquer les traitements batch
+                    cond.notify_all()
+
+            AdmissionService._in_flight += 1
+            AdmissionService._in_flight_cost += cost
+        metrics.jobs_in_flight.labels('processing').inc()
+        return Admission(cost, priority, True, waited=time.monotonic() - start)
+
+    @staticmethod
+    def release(admission):
+        if not admission.admitted:
+            return
+        with AdmissionService._cond:
+            AdmissionService._in_flight -= 1
+            AdmissionService._in_flight_cost -= admission.cost
+            AdmissionService._cond.notify_all()
+        metrics.jobs_in_flight.labels('processing').dec()
+
+    @staticmethod
+    @contextmanager
+    def admit(cost, priority=BATCH):
+        admission = AdmissionService.acquire(cost, priority)
+        try:
+            yield admission
+        finally:
+            AdmissionService.release(admission)
+
+    @staticmethod
+    def snapshot():
+        with AdmissionService._cond:
+            return {
+                'in_flight': AdmissionService._in_flight,
+                'in_flight_cost': round(AdmissionService._in_flight_cost, 3),
+                'waiting': dict(AdmissionService._waiting),
+                'rejected': AdmissionService._rejected,
+                'max_concurrent': Config.ADMISSION_MAX_CONCURRENT,
+                'cost_budget': Config.ADMISSION_COST_BUDGET
+            }
+
+    @staticmethod
+    def _can_admit(cost, priority):
+        if AdmissionService._in_flight == 0:
+            return True  # une requête plus chère que tout le budget passe seule
+        if priority == BATCH:
+            if AdmissionService._waiting[INTERACTIVE]:
+                return False
+            share = 1 - Config.ADMISSION_INTERACTIVE_RESERVE
+        else:
+            share = 1
+        max_concurrent = max(1, int(Config.ADMISSION_MAX_CONCURRENT * share))
+        return (AdmissionService._in_flight < max_concurrent and
+                AdmissionService._in_flight_cost + cost <= Config.ADMISSION_COST_BUDGET * share)
+
+    @staticmethod
+    def _reject(cost, priority, waited):
+        AdmissionService._rejected += 1
+        metrics.admission_rejected.labels(priority).inc()
+        # Temps estimé pour écouler le travail en cours
+        drain = AdmissionService._in_flight_cost / max(1, Config.ADMISSION_MAX_CONCURRENT)
+        retry_after = min(60, max(1, math.ceil(drain)))
+        return Admission(cost, priority, False, retry_after=retry_after, waited=waited)
+
+
+def calibrate(width=2000, height=1500, repeat=3):
+    """Mesure le coût de chaque opération (secondes par mégapixel) et l'enregistre"""
+    import cv2
+    from services.processing_service import ProcessingService
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    megapixels = width * height / 1e6
+    costs = {}
+
+    tmp_dir = tempfile.mkdtemp()
+    input_path = os.path.join(tmp_dir, 'input.png')
+    output_path = os.path.join(tmp_dir, 'output.png')
+    cv2.imwrite(input_path, img)
+    try:
+        for operation in DEFAULT_COSTS:
+            timings = []
+            try:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    if not ProcessingService._apply_operation(input_path, output_path, operation, {}):
+                        ProcessingService.apply_operation(img, operation, {})
+                    timings.append(time.perf_counter() - start)
+            except Exception:
+                continue  # opération indisponible : coefficient par défaut conservé
+            costs[operation] = round(min(timings) / megapixels, 4)
+    finally:
+        for path in (input_path, output_path):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(tmp_dir)
+
+    os.makedirs(os.path.dirname(Config.OPERATION_COSTS_FILE), exist_ok=True)
+    with open(Config.OPERATION_COSTS_FILE, 'w') as f:
+        json.dump(costs, f, indent=2, sort_keys=True)
+    AdmissionService._costs = None
+    return costs
+
+
+if __name__ == '__main__':
+    for operation, cost in sorted(calibrate().items()):
+        print(f"{operation:24s} {cost:.4f} s/MP")
+    print(f"Coefficients enregistrés dans {Config.OPERATION_COSTS_FILE}")
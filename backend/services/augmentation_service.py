@@ -0,0 +1,184 @@
+import os
+import signal
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from config.settings import Config
+from services.dataset_service import DatasetService
+from services.processing_service import ProcessingService
+from services.storage_service import StorageService
+
+Batch = namedtuple('Batch', ['images', 'sources', 'params'])
+
+
+class AugmentationService:
+    """Augmentations d'entraînement à la volée à partir des opérations existantes.
+
+    ``batches`` est un générateur de lots (B, hauteur, largeur, canaux) : un
+    pool de processus décode et augmente chaque lot directement dans un bloc
+    de mémoire partagée (seuls les chemins et paramètres sont transmis), avec
+    au plus ``prefetch`` lots d'avance. Les paramètres de chaque image sont
+    tirés d'un générateur initialisé par (seed, époque, index) : le résultat
+    ne dépend ni du nombre de workers ni de l'ordre d'exécution.
+
+        for batch in AugmentationService.batches(paths, batch_size=32, shape=(224, 224), seed=1):
+            train_step(batch.images)  # vue valide jusqu'au lot suivant (copy=True sinon)
+    """
+
+    # Probabilité et plage de chaque augmentation, appliquées dans cet ordre
+    DEFAULTS = {
+        'rotate': {'p': 0.5, 'angle': (-15, 15)},
+        'flip': {'p': 0.5, 'direction': ('horizontal', 'vertical')},
+        'resize': {'p': 0.5, 'scale': (0.8, 1.25)},  # zoom : redimensionné puis recadré à la forme
+        'blur': {'p': 0.2, 'kernel_size': (3, 5, 7)},
+        'brightness': {'p': 0.5, 'delta': (-30, 30)},
+        'contrast': {'p': 0.5, 'factor': (0.8, 1.25)},
+    }
+
+    @staticmethod
+    def sample(rng, augmentations=None):
+        """Paramètres tirés pour une image (dictionnaire vide : image inchangée)"""
+        augmentations = AugmentationService.DEFAULTS if augmentations is None else augmentations
+        params = {}
+        for name, spec in augmentations.items():
+            if rng.random() >= spec.get('p', 1.0):
+                continue
+            if name == 'rotate':
+                params['rotate'] = round(float(rng.uniform(*spec['angle'])), 2)
+            elif name == 'flip':
+                params['flip'] = str(rng.choice(spec['direction']))
+            elif name == 'resize':
+                params['resize'] = round(float(rng.uniform(*spec['scale'])), 3)
+            elif name == 'blur':
+                params['blur'] = int(rng.choice(spec['kernel_size']))
+            elif name == 'brightness':
+                params['brightness'] = int(rng.integers(spec['delta'][0], spec['delta'][1] + 1))
+            elif name == 'contrast':
+                params['contrast'] = round(float(rng.uniform(*spec['factor'])), 3)
+            else:
+                raise ValueError(f"Augmentation inconnue: {name}")
+        return params
+
+    @staticmethod
+    def apply(img, params):
+        """Applique les paramètres tirés avec les opérations de ProcessingService"""
+        if 'rotate' in params:
+            img = ProcessingService.apply_file_operation(img, 'rotate', {'angle': params['rotate']})
+        if 'flip' in params:
+            img = ProcessingService.apply_file_operation(img, 'flip', {'direction': params['flip']})
+        if 'resize' in params:
+            h, w = img.shape[:2]
+            img = ProcessingService.apply_file_operation(img, 'resize', {
+                'width': max(1, round(w * params['resize'])), 'height': max(1, round(h * params['resize']))})
+        if 'blur' in params:
+            img = ProcessingService.apply_file_operation(img, 'blur_gaussian', {'kernel_size': params['blur']})
+        if 'brightness' in params or 'contrast' in params:
+            img = ProcessingService.apply_contrast_brightness(img, {
+                'contrast': params.get('contrast', 1.0), 'brightness': params.get('brightness', 0)})
+        return img
+
+    @staticmethod
+    def batches(sources, batch_size, shape, seed=0, augmentations=None, epochs=1, shuffle=True,
+                drop_last=False, channels=3, order='rgb', dtype='uint8', workers=None, prefetch=2, copy=False):
+        """Générateur de Batch(images, sources, params) augmentés.
+
+        sources : chemins d'images. Sans copy, ``images`` est une vue sur la
+        mémoire partagée, réutilisée après l'itération suivante.
+        """
+        sources = list(sources)
+        if not sources:
+            return
+        workers = workers or Config.CPU_BUDGET
+        spec = {'shape': list(shape), 'fit': 'crop', 'channels': channels, 'order': order, 'dtype': dtype}
+        sample_shape = (batch_size,) + DatasetService.sample_shape(spec)
+        nbytes = int(np.prod(sample_shape)) * np.dtype(dtype).itemsize
+
+        # Un bloc par lot en vol, plus celui que détient l'appelant
+        slots = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(prefetch + 1)]
+        free = deque(slots)
+        pending = deque()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_worker_init)
+        held = None
+        try:
+            plans = AugmentationService._plans(sources, batch_size, seed, augmentations, epochs, shuffle, drop_last)
+            exhausted = False
+            while True:
+                while not exhausted and free:
+                    plan = next(plans, None)
+                    if plan is None:
+                        exhausted = True
+                        break
+                    slot = free.popleft()
+                    future = executor.submit(_fill_batch, slot.name, sample_shape, dtype, spec, plan)
+                    pending.append((future, slot, plan))
+                if held is not None:
+                    free.append(held)  # l'appelant est passé au lot suivant
+                    held = None
+                    continue
+                if not pending:
+                    return
+                future, slot, plan = pending.popleft()
+                count = future.result()
+                images = np.ndarray(sample_shape, dtype=dtype, buffer=slot.buf)[:count]
+                held = slot
+                yield Batch(images.copy() if copy else images,
+                            [path for path, _ in plan], [params for _, params in plan])
+        finally:
+            for future, _, _ in pending:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+            for slot in slots:
+                slot.close()
+                slot.unlink()
+
+    @staticmethod
+    def _plans(sources, batch_size, seed, augmentations, epochs, shuffle, drop_last):
+        """Lots de (chemin, paramètres), déterministes pour une graine donnée"""
+        for epoch in range(epochs):
+            order = np.arange(len(sources))
+            if shuffle:
+                np.random.default_rng([seed, epoch]).shuffle(order)
+            for start in range(0, len(order), batch_size):
+                indices = order[start:start + batch_size]
+                if drop_last and len(indices) < batch_size:
+                    break
+                yield [(sources[i], AugmentationService.sample(np.random.default_rng([seed, epoch, int(i)]),
+                                                               augmentations))
+                       for i in indices]
+
+
+# Côté worker : blocs de mémoire partagée ouverts une fois par processus
+_attached = {}
+
+
+def _worker_init():
+    cv2.setNumThreads(1)  # parallélisme assuré par les processus
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C géré par le processus principal
+
+
+def _attach(name):
+    # Les workers partagent le suivi des ressources du processus principal, qui libère les blocs
+    block = _attached.get(name)
+    if block is None:
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=name)
+        _attached[name] = block
+    return block
+
+
+def _fill_batch(slot_name, sample_shape, dtype, spec, plan):
+    """Décode et augmente un lot directement dans le bloc partagé, retourne le nombre d'images"""
+    images = np.ndarray(sample_shape, dtype=dtype, buffer=_attach(slot_name).buf)
+    for i, (path, params) in enumerate(plan):
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            img = StorageService.decode_with_pil(path)
+        if img is None:
+            raise ValueError(f"Image illisible: {os.path.basename(path)}")
+        images[i] = DatasetService.to_tensor(AugmentationService.apply(img, params), spec)
+    return len(plan)
@@ -0,0 +1,203 @@
+import cv2
+import numpy as np
+from services.processing_service import ProcessingService
+
+
+class BatchService:
+    """Opérations de /api/process sur des lots d'images de même forme.
+
+    Les images sont empilées dans un tableau contigu (N, hauteur, largeur[, canaux]).
+    Les opérations point à point (seuil, contraste/luminosité), les
+    retournements, l'extraction de canal et la conversion en niveaux de gris
+    sont un seul appel sur tout le lot, vu comme une image (N*H, W) ; les convolutions et les
+    transformations géométriques bouclent sur les images en écrivant dans un
+    tableau de sortie alloué une fois. Le résultat de chaque image est
+    identique à celui de ``ProcessingService.apply_file_operation``.
+    """
+
+    # Opérations lues en niveaux de gris (IMREAD_GRAYSCALE dans le moteur fichier)
+    GRAYSCALE_INPUT = {'threshold', 'edge_canny', 'edge_sobel', 'edge_prewitt', 'edge_laplacian'}
+    OPERATIONS = GRAYSCALE_INPUT | {
+        'grayscale', 'blur_gaussian', 'blur_median', 'blur_average', 'sharpen_kernel', 'resize', 'rotate',
+        'flip', 'normalize', 'histogram_eq', 'histogram_stretch', 'extract_channel', 'contrast_brightness'}
+    # Valeurs 0..255 (LUT de l'étirement d'histogramme)
+    _RAMP = np.arange(256, dtype=np.uint8).reshape(1, 256)
+
+    @staticmethod
+    def group(images):
+        """Regroupe les images par forme et type : liste de (indices, lot contigu)"""
+        groups = {}
+        for i, img in enumerate(images):
+            groups.setdefault((img.shape, img.dtype.str), []).append(i)
+        return [(indices, np.stack([images[i] for i in indices])) for indices in groups.values()]
+
+    @staticmethod
+    def apply_many(images, operation, params):
+        """Traite une liste d'images de formes quelconques, résultats dans l'ordre d'entrée"""
+        results = [None] * len(images)
+        for indices, batch in BatchService.group(images):
+            for i, result in zip(indices, BatchService.apply(batch, operation, params)):
+                results[i] = result
+        return results
+
+    @staticmethod
+    def apply(batch, operation, params, out=None):
+        """Applique une opération à un lot (N, H, W[, C]), retourne le lot résultat"""
+        if operation not in BatchService.OPERATIONS:
+            raise ValueError(f"Opération inconnue: {operation}")
+        params = params or {}
+        try:
+            if operation in BatchService.GRAYSCALE_INPUT and batch.ndim == 4:
+                batch = BatchService._grayscale(batch)
+            return BatchService._dispatch(batch, operation, params, out)
+        except cv2.error:
+            raise ValueError(f"Erreur lors du traitement {operation}")
+
+    @staticmethod
+    def _dispatch(batch, operation, params, out):
+        # ===== Un seul appel pour tout le lot =====
+        if operation == 'grayscale':
+            return BatchService._grayscale(batch, out)
+        elif operation == 'threshold' and params.get('type', 'binary') != 'adaptive':
+            value = params.get('threshold', 127)
+            return BatchService._flat(batch, out, batch.shape, batch.dtype, lambda src, dst: cv2.threshold(
+                src, value, 255, cv2.THRESH_BINARY, dst=dst)[1])
+        elif operation == 'contrast_brightness':
+            alpha, beta = float(params.get('contrast', 1.0)), int(params.get('brightness', 0))
+            return BatchService._flat(batch, out, batch.shape, np.uint8, lambda src, dst: cv2.convertScaleAbs(
+                src, dst=dst, alpha=alpha, beta=beta))
+        elif operation == 'flip':
+            direction = params.get('direction', 'horizontal')
+            if direction == 'horizontal':  # retourne chaque ligne : le lot entier en un appel
+                return BatchService._flat(batch, out, batch.shape, batch.dtype, lambda src, dst: cv2.flip(src, 1, dst=dst))
+            result = BatchService._output(out, batch.shape, batch.dtype)
+            if direction == 'vertical':
+                np.copyto(result, batch[:, ::-1])  # copie de lignes entières
+                return result
+            return BatchService._each(batch, result, batch.shape, lambda img, dst: cv2.flip(img, -1, dst=dst))
+        elif operation == 'extract_channel':
+            index = {'red': 2, 'green': 1}.get(params.get('channel', 'red'), 0)
+            result = BatchService._output(out, batch.shape, batch.dtype)
+            result[...] = 0
+            result[..., index] = batch[..., index]
+            return result
+        elif operation == 'histogram_stretch':
+            return BatchService._histogram_stretch(batch, out)
+
+        # ===== Boucle sur les images, sortie préallouée =====
+        elif operation == 'threshold':  # adaptatif
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.adaptiveThreshold(
+                img, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2, dst=dst))
+        elif operation == 'blur_gaussian':
+            k = params.get('kernel_size', 5)
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.GaussianBlur(img, (k, k), 0, dst=dst))
+        elif operation == 'blur_median':
+            k = params.get('kernel_size', 5)
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.medianBlur(img, k, dst=dst))
+        elif operation == 'blur_average':
+            k = params.get('kernel_size', 5)
+            kernel = np.ones((k, k), np.float32) / (k * k)
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.filter2D(img, -1, kernel, dst=dst))
+        elif operation == 'sharpen_kernel':
+            kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.filter2D(img, -1, kernel, dst=dst))
+        elif operation == 'edge_canny':
+            low, high = params.get('low', 50), params.get('high', 150)
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.Canny(img, low, high, edges=dst))
+        elif operation == 'edge_sobel':
+            k = max(3, params.get('kernel_size', 3) | 1)
+            return BatchService._gradient(batch, out, lambda img, dst, dx, dy: cv2.Sobel(img, cv2.CV_64F, dx, dy, dst=dst, ksize=k))
+        elif operation == 'edge_prewitt':
+            kernels = ProcessingService.PREWITT_KERNELS.get(params.get('kernel_size', 3), ProcessingService.PREWITT_KERNELS[3])
+            return BatchService._gradient(batch, out, lambda img, dst, dx, dy: cv2.filter2D(
+                img, cv2.CV_64F, kernels['x'] if dx else kernels['y'], dst=dst))
+        elif operation == 'edge_laplacian':
+            kernel = ProcessingService.LAPLACIAN_KERNELS.get(params.get('kernel_size', 3), ProcessingService.LAPLACIAN_KERNELS[3])
+            work = np.empty(batch.shape[1:], np.float64)
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.convertScaleAbs(
+                cv2.filter2D(img, cv2.CV_64F, kernel, dst=work), dst=dst))
+        elif operation == 'resize':
+            width, height = params.get('width', 300), params.get('height', 300)
+            shape = (len(batch), height, width) + batch.shape[3:]
+            return BatchService._each(batch, out, shape, lambda img, dst: cv2.resize(img, (width, height), dst=dst))
+        elif operation == 'rotate':
+            height, width = batch.shape[1:3]
+            matrix = cv2.getRotationMatrix2D((width // 2, height // 2), params.get('angle', 90), 1.0)
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.warpAffine(
+                img, matrix, (width, height), dst=dst))
+        elif operation == 'normalize':
+            return BatchService._each(batch, out, batch.shape, lambda img, dst: cv2.normalize(
+                img, dst, 0, 255, cv2.NORM_MINMAX))
+        else:  # histogram_eq : conversions YUV sur tout le lot, égalisation par image
+            yuv = BatchService._flat(batch, None, batch.shape, batch.dtype, lambda src, dst: cv2.cvtColor(
+                src, cv2.COLOR_BGR2YUV, dst=dst))
+            for img in yuv:
+                img[:, :, 0] = cv2.equalizeHist(img[:, :, 0])
+            return BatchService._flat(yuv, out, batch.shape, batch.dtype, lambda src, dst: cv2.cvtColor(
+                src, cv2.COLOR_YUV2BGR, dst=dst))
+
+    @staticmethod
+    def _output(out, shape, dtype):
+        if out is None:
+            return np.empty(shape, dtype)
+        if out.shape != tuple(shape) or out.dtype != dtype or not out.flags.c_contiguous:
+            raise ValueError(f"Sortie {out.shape} {out.dtype} incompatible, attendu {tuple(shape)} {np.dtype(dtype)}")
+        return out
+
+    @staticmethod
+    def _flat(batch, out, shape, dtype, func):
+        """Opération pixel à pixel : le lot vu comme une seule image (N*H, W[, C]), un seul appel"""
+        result = BatchService._output(out, shape, dtype)
+        rows = batch.shape[0] * batch.shape[1]
+        src = np.ascontiguousarray(batch).reshape((rows,) + batch.shape[2:])
+        dst = result.reshape((rows,) + result.shape[2:])
+        written = func(src, dst)
+        if written is not dst:
+            dst[...] = written
+        return result
+
+    @staticmethod
+    def _grayscale(batch, out=None):
+        return BatchService._flat(batch, out, batch.shape[:3], batch.dtype, lambda src, dst: cv2.cvtColor(
+            src, cv2.COLOR_BGR2GRAY, dst=dst))
+
+    @staticmethod
+    def _each(batch, out, shape, func):
+        result = BatchService._output(out, shape, batch.dtype)
+        for img, dst in zip(batch, result):
+            written = func(img, dst)
+            if written is not dst:
+                dst[...] = written  # OpenCV a réalloué la sortie
+        return result
+
+    @staticmethod
+    def _gradient(batch, out, derivative):
+        """Norme du gradient (Sobel, Prewitt) avec des tampons float64 réutilisés"""
+        gx, gy = np.empty(batch.shape[1:], np.float64), np.empty(batch.shape[1:], np.float64)
+
+        def norm(img, dst):
+            derivative(img, gx, 1, 0)
+            derivative(img, gy, 0, 1)
+            np.multiply(gx, gx, out=gx)
+            np.multiply(gy, gy, out=gy)
+            np.add(gx, gy, out=gx)
+            np.sqrt(gx, out=gx)
+            return cv2.convertScaleAbs(gx, dst=dst)
+        return BatchService._each(batch, out, batch.shape, norm)
+
+    @staticmethod
+    def _histogram_stretch(batch, out):
+        """Étirement par image et par canal : une LUT (N, 256, C) calculée avec la formule du moteur fichier"""
+        n, channels = len(batch), batch.shape[3] if batch.ndim == 4 else 1
+        # Réduction sur les lignes puis les colonnes : numpy vectorise le long de l'axe contigu
+        low = batch.min(axis=1).min(axis=1).reshape(n, 1, channels)
+        high = batch.max(axis=1).max(axis=1).reshape(n, 1, channels)
+        span = high - low
+        ramp = BatchService._RAMP.reshape(1, 256, 1)
+        luts = ((ramp - low) / np.where(span > 0, span, 1) * 255).astype(np.uint8)
+        luts = np.where(span > 0, luts, ramp)
+        luts = luts.reshape(n, 1, 256, channels) if channels > 1 else luts.reshape(n, 1, 256)
+        result = BatchService._output(out, batch.shape, batch.dtype)
+        for img, lut, dst in zip(batch, luts, result):
+            cv2.LUT(img, lut, dst=dst)
+        return result
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from PIL import Image
+from werkzeug.utils import secure_filename
+from config.settings import Config
+from services.upload_service import UploadService
+from services.validation_service import ValidationService
+from utils import file_lock
+
+
+class ChunkedUploadService:
+    """Uploads reprenables : init / PUT d'un morceau / complete.
+
+    Chaque session est un couple ``<id>.json`` (état) + ``<id>.part`` (données)
+    dans ``UPLOAD_SESSION_FOLDER``. Les morceaux sont écrits en flux sur le
+    disque et hachés au fil de l'eau ; l'image n'est décodée qu'une seule fois,
+    à la finalisation, et ce décodage fournit aussi les métadonnées.
+
+    Les morceaux d'un même upload peuvent arriver sur des workers différents :
+    les opérations d'une session sont sérialisées par un verrou ``flock`` sur
+    le ``.part``, et le hash en cours d'un worker n'est réutilisé que s'il
+    couvre exactement les octets reçus.
+    """
+
+    STREAM_BLOCK_SIZE = 1024 * 1024
+    SNIFF_SIZE = 16
+
+    _hashers = {}  # upload_id -> (octets hachés, hasher), propre au processus
+
+    @staticmethod
+    def init_upload(filename, size):
+        """Crée une session d'upload, retourne (session, erreurs)"""
+        ChunkedUploadService.cleanup_expired()
+
+        if not filename:
+            return None, ["Nom de fichier requis"]
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return None, ["Taille du fichier requise"]
+        if size <= 0:
+            return None, ["Taille du fichier requise"]
+
+        is_valid, errors = ValidationService.validate_header(filename, size, None)
+        if not is_valid:
+            return None, errors
+
+        os.makedirs(Config.UPLOAD_SESSION_FOLDER, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        session = {
+            'upload_id': upload_id,
+            'filename': secure_filename(filename),
+            'size': size,
+            'received': 0,
+            'chunk_size': Config.UPLOAD_CHUNK_SIZE,
+            'created': time.time()
+        }
+        open(ChunkedUploadService._part_path(upload_id), 'wb').close()
+        ChunkedUploadService._save_session(session)
+        ChunkedUploadService._hashers[upload_id] = (0, hashlib.sha256())
+        return session, []
+
+    @staticmethod
+    def get_status(upload_id):
+        """Retourne l'état d'une session (None si inconnue)"""
+        return ChunkedUploadService._load_session(upload_id)
+
+    @staticmethod
+    def write_chunk(upload_id, offset, stream):
+        """Écrit un morceau à la position ``offset``, retourne (session, erreur).
+
+        L'offset doit être égal au nombre d'octets déjà reçus : un client qui
+        reprend après une coupure interroge d'abord l'état de la session.
+        """
+        with ChunkedUploadService._locked(upload_id) as session:
+            if session is None:
+                return None, "Session d'upload inconnue"
+            if offset != session['received']:
+                return session, "Offset invalide"
+
+            part_path = ChunkedUploadService._part_path(upload_id)
+            hasher = ChunkedUploadService._get_hasher(session)
+            remaining = session['size'] - offset
+            written = 0
+
+            with open(part_path, 'r+b') as f:
+                # Une écriture interrompue a pu laisser des octets non validés
+                f.truncate(offset)
+                f.seek(offset)
+
+                pending_hasher = hasher.copy()
+                first_block = offset == 0
+                while True:
+                    block = stream.read(ChunkedUploadService.STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    if first_block:
+                        is_valid, errors = ValidationService.validate_header(
+                            session['filename'], session['size'],
+                            block[:ChunkedUploadService.SNIFF_SIZE])
+                        if not is_valid:
+                            f.truncate(offset)
+                            return session, errors[0]
+                        first_block = False
+                    written += len(block)
+                    if written > remaining:
+                        f.truncate(offset)
+                        return session, "Le morceau dépasse la taille annoncée"
+                    f.write(block)
+                    pending_hasher.update(block)
+
+            session['received'] = offset + written
+            ChunkedUploadService._save_session(session)
+            ChunkedUploadService._hashers[upload_id] = (session['received'], pending_hasher)
+            return session, None
+
+    @staticmethod
+    def complete_upload(upload_id, expected_sha256=None):
+        """Finalise l'upload : contrôle du hash, décodage unique, rangement dans le stockage dédupliqué"""
+        with ChunkedUploadService._locked(upload_id) as session:
+            if session is None:
+                return None, "Session d'upload inconnue"
+            if session['received'] != session['size']:
+                return None, f"Upload incomplet ({session['received']}/{session['size']} octets)"
+
+            sha256 = ChunkedUploadService._get_hasher(session).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                return None, "Le hash SHA-256 ne correspond pas"
+
+            part_path = ChunkedUploadService._part_path(upload_id)
+            try:
+                with Image.open(part_path) as img:
+                    metadata = UploadService._metadata_from_image(img, session['size'])
+            except Exception:
+                metadata = None
+            # Décodage OpenCV (pas de copie RGB intermédiaire), réutilisé pour les statistiques et l'empreinte
+            pixels = UploadService._decode(part_path) if metadata is not None else None
+            if pixels is None:
+                ChunkedUploadService._discard(upload_id)
+                return None, "Le fichier n'est pas une image valide"
+
+            unique_filename = UploadService._unique_filename(session['filename'])
+            result = UploadService._store_upload(part_path, sha256, unique_filename,
+                                                 session['filename'], metadata, pixels)
+            ChunkedUploadService._discard(upload_id)
+            return result, None
+
+    @staticmethod
+    def abort_upload(upload_id):
+        with ChunkedUploadService._locked(upload_id) as session:
+            if session is None:
+                return False
+            ChunkedUploadService._discard(upload_id)
+            return True
+
+    @staticmethod
+    def cleanup_expired():
+        """Supprime les sessions abandonnées depuis plus de UPLOAD_SESSION_TTL"""
+        if not os.path.exists(Config.UPLOAD_SESSION_FOLDER):
+            return
+        limit = time.time() - Config.UPLOAD_SESSION_TTL
+        for entry in os.scandir(Config.UPLOAD_SESSION_FOLDER):
+            if not entry.name.endswith('.json'):
+                continue
+            upload_id = entry.name[:-len('.json')]
+            # Session occupée (morceau en cours d'écriture) : revue au prochain passage
+            with ChunkedUploadService._locked(upload_id, blocking=False) as session:
+                if session is not None and entry.stat().st_mtime < limit:
+                    ChunkedUploadService._discard(upload_id)
+
+    @staticmethod
+    def _get_hasher(session):
+        # Hash absent (redémarrage) ou en retard (morceaux reçus par un autre worker) :
+        # reconstruit depuis le .part
+        position, hasher = ChunkedUploadService._hashers.get(session['upload_id'], (None, None))
+        if position != session['received']:
+            hasher = hashlib.sha256()
+            with open(ChunkedUploadService._part_path(session['upload_id']), 'rb') as f:
+                remaining = session['received']
+                while remaining > 0:
+                    block = f.read(min(ChunkedUploadService.STREAM_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+            ChunkedUploadService._hashers[session['upload_id']] = (session['received'], hasher)
+        return hasher
+
+    @staticmethod
+    def _load_session(upload_id):
+        if not upload_id or not upload_id.isalnum():
+            return None
+        try:
+            with open(ChunkedUploadService._session_path(upload_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_session(session):
+        path = ChunkedUploadService._session_path(session['upload_id'])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _discard(upload_id):
+        ChunkedUploadService._hashers.pop(upload_id, None)
+        # Le .json d'abord : une requête en attente du verrou relit alors une session inconnue
+        for path in (ChunkedUploadService._session_path(upload_id),
+                     ChunkedUploadService._part_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _session_path(upload_id):
+        return os.path.join(Config.UPLOAD_SESSION_FOLDER, f"{upload_id}.json")
+
+    @staticmethod
+    def _part_path(upload_id):
+        return os.path.join(Config.UPLOAD_SESSION_FOLDER, f"{upload_id}.part")
+
+    @staticmethod
+    @contextmanager
+    def _locked(upload_id, blocking=True):
+        """Verrou exclusif de la session entre threads et processus, fournit la session (None si inconnue)
+
+        Le verrou porte sur le .part, jamais remplacé (le .json l'est à chaque
+        sauvegarde) ; une session supprimée pendant l'attente est relue comme
+        inconnue, de même qu'une session occupée quand blocking est False.
+        """
+        if not upload_id or not upload_id.isalnum():
+            yield None
+            return
+        with ExitStack() as stack:
+            try:
+                acquired = stack.enter_context(file_lock.locked(
+                    ChunkedUploadService._part_path(upload_id), blocking, create=False))
+            except FileNotFoundError:
+                acquired = False  # session supprimée
+            yield ChunkedUploadService._load_session(upload_id) if acquired else None
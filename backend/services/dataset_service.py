@@ -0,0 +1,200 @@
+import json
+import os
+import cv2
+import numpy as np
+
+
+class DatasetService:
+    """Export d'images en tenseurs NumPy de forme fixe, en shards pour l'entraînement.
+
+    Un dossier de dataset contient des shards de ``shard_size`` images
+    (``shard-00000.npy`` de forme (n, hauteur, largeur, canaux), ou ``.npz``
+    compressé avec le tableau ``images``) et ``index.json`` : forme, type,
+    ordre des canaux et, pour chaque shard, les images sources dans l'ordre
+    des lignes. Les shards .npy se lisent sans décodage avec
+    ``np.load(path, mmap_mode='r')`` (voir ``DatasetService.load``).
+    """
+
+    INDEX_NAME = 'index.json'
+    FORMATS = ('npy', 'npz')
+    FITS = ('stretch', 'crop', 'pad')
+
+    @staticmethod
+    def to_tensor(img, spec):
+        """Image BGR (ou niveaux de gris) -> tableau (hauteur, largeur, canaux) selon spec.
+
+        spec : {'shape': [h, w], 'fit': 'stretch'|'crop'|'pad', 'channels': 1|3,
+                'order': 'rgb'|'bgr', 'dtype': 'uint8'|'float32'}
+        """
+        height, width = spec['shape']
+        channels = spec.get('channels', 3)
+        if img.ndim == 3 and channels == 1:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        elif img.ndim == 2 and channels == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        if channels == 3 and spec.get('order', 'rgb') == 'rgb':
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+        fit = spec.get('fit', 'stretch')
+        h, w = img.shape[:2]
+        if fit == 'crop':
+            # Recadrage central au rapport d'aspect cible, puis redimensionnement
+            scale = max(height / h, width / w)
+            crop_h, crop_w = min(h, round(height / scale)), min(w, round(width / scale))
+            top, left = (h - crop_h) // 2, (w - crop_w) // 2
+            img = img[top:top + crop_h, left:left + crop_w]
+            img = DatasetService._resize(img, width, height)
+        elif fit == 'pad':
+            # Redimensionnement dans le cadre, bandes noires centrées
+            scale = min(height / h, width / w)
+            new_h, new_w = max(1, round(h * scale)), max(1, round(w * scale))
+            resized = DatasetService._resize(img, new_w, new_h)
+            img = np.zeros((height, width) + resized.shape[2:], dtype=resized.dtype)
+            top, left = (height - new_h) // 2, (width - new_w) // 2
+            img[top:top + new_h, left:left + new_w] = resized
+        else:
+            img = DatasetService._resize(img, width, height)
+
+        if img.ndim == 2:
+            img = img[:, :, None]
+        if spec.get('dtype', 'uint8') == 'float32':
+            return img.astype(np.float32) / 255.0
+        return np.ascontiguousarray(img, dtype=np.uint8)
+
+    @staticmethod
+    def sample_shape(spec):
+        height, width = spec['shape']
+        return height, width, spec.get('channels', 3)
+
+    @staticmethod
+    def load(dataset_dir):
+        """(index, liste des shards) ; les shards .npy sont projetés en mémoire (mmap), sans copie"""
+        with open(os.path.join(dataset_dir, DatasetService.INDEX_NAME)) as f:
+            index = json.load(f)
+        shards = []
+        for shard in index['shards']:
+            path = os.path.join(dataset_dir, shard['file'])
+            if path.endswith('.npz'):
+                with np.load(path) as archive:
+                    shards.append(archive['images'])
+            else:
+                shards.append(np.load(path, mmap_mode='r'))
+        return index, shards
+
+    @staticmethod
+    def _resize(img, width, height):
+        h, w = img.shape[:2]
+        # INTER_AREA pour réduire (pas de moiré), INTER_LINEAR pour agrandir
+        interpolation = cv2.INTER_AREA if width < w and height < h else cv2.INTER_LINEAR
+        return cv2.resize(img, (width, height), interpolation=interpolation)
+
+
+class ShardWriter:
+    """Écriture en flux des échantillons dans des shards de taille fixe.
+
+    Le shard en cours est un memmap .npy sur disque (``.part``) : la mémoire ne
+    dépend pas de la taille du shard. Un shard n'apparaît dans l'index qu'une
+    fois complet et renommé ; ``add`` retourne alors les sources qu'il contient,
+    que l'appelant peut considérer comme exportées (reprise après interruption).
+    """
+
+    def __init__(self, dataset_dir, spec, shard_size=1024, shard_format='npy', task_id=None, force=False):
+        self.dataset_dir = dataset_dir
+        self.spec = spec
+        self.shard_size = shard_size
+        self.shard_format = shard_format
+        self.dtype = np.dtype(spec.get('dtype', 'uint8'))
+        self.index_path = os.path.join(dataset_dir, DatasetService.INDEX_NAME)
+        os.makedirs(dataset_dir, exist_ok=True)
+
+        self.index = self._load_index(task_id, force)
+        self._current = None
+        self._sources = []
+
+    def _load_index(self, task_id, force):
+        if os.path.exists(self.index_path) and not force:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('task') != task_id:
+                raise ValueError(f"{self.dataset_dir} contient un dataset d'un autre traitement "
+                                 f"(--force pour le remplacer)")
+            return index
+        for name in os.listdir(self.dataset_dir):
+            if name.startswith('shard-'):
+                os.remove(os.path.join(self.dataset_dir, name))
+        height, width, channels = DatasetService.sample_shape(self.spec)
+        return {'task': task_id, 'shape': [height, width, channels], 'dtype': self.dtype.name,
+                'order': self.spec.get('order', 'rgb') if channels == 3 else 'gray',
+                'fit': self.spec.get('fit', 'stretch'), 'shard_size': self.shard_size,
+                'format': self.shard_format, 'count': 0, 'shards': []}
+
+    def add(self, source, sample):
+        """Ajoute un échantillon, retourne les sources du shard qu'il a complété (sinon [])"""
+        if self._current is None:
+            self._open()
+        self._current[len(self._sources)] = sample
+        self._sources.append(source)
+        if len(self._sources) == self.shard_size:
+            return self._close_shard()
+        return []
+
+    def close(self):
+        """Termine le dernier shard (incomplet), retourne ses sources"""
+        if self._current is None:
+            return []
+        return self._close_shard()
+
+    def abort(self):
+        """Abandonne le shard en cours (interruption) : il sera reconstruit à la reprise"""
+        if self._current is not None:
+            del self._current
+            self._current = None
+            os.remove(self._part_path())
+            self._sources = []
+
+    def _shard_name(self):
+        return f"shard-{len(self.index['shards']):05d}.{self.shard_format}"
+
+    def _part_path(self):
+        return os.path.join(self.dataset_dir, self._shard_name() + '.part.npy')
+
+    def _open(self):
+        shape = (self.shard_size,) + tuple(self.index['shape'])
+        self._current = np.lib.format.open_memmap(self._part_path(), mode='w+', dtype=self.dtype, shape=shape)
+
+    def _close_shard(self):
+        count = len(self._sources)
+        name = self._shard_name()
+        target = os.path.join(self.dataset_dir, name)
+        part = self._part_path()
+        self._current.flush()
+        if self.shard_format == 'npz':
+            np.savez_compressed(target + '.tmp.npz', images=self._current[:count])
+            del self._current
+            os.replace(target + '.tmp.npz', target)
+            os.remove(part)
+        elif count == self.shard_size:
+            del self._current
+            os.replace(part, target)
+        else:
+            # Dernier shard : l'en-tête .npy porte la forme, copie vers un fichier à la bonne taille
+            final = np.lib.format.open_memmap(target + '.tmp', mode='w+', dtype=self.dtype,
+                                              shape=(count,) + tuple(self.index['shape']))
+            final[:] = self._current[:count]
+            final.flush()
+            del final, self._current
+            os.replace(target + '.tmp', target)
+            os.remove(part)
+        self._current = None
+
+        sources, self._sources = self._sources, []
+        self.index['shards'].append({'file': name, 'count': count, 'sources': sources})
+        self.index['count'] += count
+        self._write_index()
+        return sources
+
+    def _write_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
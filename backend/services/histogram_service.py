@@ -7,7 +7,11 @@ def generate_histogram(image_path, channel='all'):
     img = cv2.imread(image_path)
     if img is None:
         raise ValueError("Failed to read image")
+    return compute_histogram(img, channel)
 
+
+def compute_histogram(img, channel='all'):
+    """Histogram data of an already decoded BGR image"""
     histogram_data = {}
 
     if channel == 'gray':
@@ -1,26 +1,30 @@
-import os
 from PIL import Image
-from config.settings import Config
 from services.upload_service import UploadService
+from services.index_service import IndexService
+from services.storage_service import StorageService
 
 class ImageService:
     @staticmethod
     def get_image_info(filename):
         """Récupère les informations détaillées d'une image"""
         try:
-            filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
+            backend, key = StorageService.resolve_upload(filename)
             
-            if not os.path.exists(filepath):
+            if backend is None:
                 return None
             
-            # Réutiliser la méthode existante (DRY)
-            base_metadata = UploadService._extract_metadata(filepath)
+            # Métadonnées de l'index si disponibles, sinon lecture de l'en-tête
+            upload = IndexService.get_upload(filename)
+            if upload and upload['metadata']:
+                base_metadata = dict(upload['metadata'])
+            else:
+                base_metadata = UploadService._extract_stored_metadata(backend, key)
             
             if not base_metadata:
                 return None
             
             # Ajouter les informations supplémentaires
-            with Image.open(filepath) as img:
+            with backend.open(key) as f, Image.open(f) as img:
                 base_metadata.update({
                     'filename': filename,
                     'aspect_ratio': round(img.width / img.height, 2),
@@ -0,0 +1,427 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config.settings import Config
+
+
+class IndexService:
+    """Index SQLite des uploads, des contenus (blobs) et des images dérivées.
+
+    - ``blobs`` : un contenu unique par hash SHA-256, avec compteur de références
+    - ``uploads`` : nom visible par l'utilisateur (alias) -> hash du contenu
+    - ``derivatives`` : lignage des images traitées (source, recette, taille,
+      dernier accès, éviction par le ramasse-miettes)
+    - ``blob_stats`` / ``stats_aggregates`` : statistiques de pixels par contenu
+      et agrégats maintenus à l'upload et à la suppression (voir StatsService)
+    - ``perceptual_hashes`` : empreinte perceptuelle 64 bits par contenu, découpée
+      en quatre blocs de 16 bits indexés (voir SimilarityService)
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            ext TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS uploads (
+            filename TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            original_filename TEXT,
+            metadata TEXT,
+            upload_time TEXT
+        );
+        CREATE INDEX IF NOT EXISTS uploads_hash ON uploads (hash);
+        CREATE TABLE IF NOT EXISTS derivatives (
+            filename TEXT PRIMARY KEY,
+            source_hash TEXT NOT NULL,
+            recipe TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS derivatives_recipe ON derivatives (source_hash, recipe);
+        CREATE TABLE IF NOT EXISTS blob_stats (
+            hash TEXT PRIMARY KEY,
+            format TEXT,
+            mode TEXT,
+            groups TEXT NOT NULL,
+            pixels INTEGER NOT NULL,
+            mean BLOB NOT NULL,
+            m2 BLOB NOT NULL,
+            histogram BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS stats_aggregates (
+            key TEXT PRIMARY KEY,
+            images INTEGER NOT NULL,
+            pixels INTEGER NOT NULL,
+            mean BLOB NOT NULL,
+            m2 BLOB NOT NULL,
+            histogram BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS perceptual_hashes (
+            hash TEXT PRIMARY KEY,
+            phash INTEGER NOT NULL,
+            c0 INTEGER NOT NULL,
+            c1 INTEGER NOT NULL,
+            c2 INTEGER NOT NULL,
+            c3 INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS perceptual_hashes_c0 ON perceptual_hashes (c0);
+        CREATE INDEX IF NOT EXISTS perceptual_hashes_c1 ON perceptual_hashes (c1);
+        CREATE INDEX IF NOT EXISTS perceptual_hashes_c2 ON perceptual_hashes (c2);
+        CREATE INDEX IF NOT EXISTS perceptual_hashes_c3 ON perceptual_hashes (c3);
+    """
+
+    # Colonnes ajoutées après la création des tables (bases existantes)
+    MIGRATIONS = {
+        'derivatives': (
+            ('source_filename', 'TEXT'),
+            ('size_bytes', 'INTEGER NOT NULL DEFAULT 0'),
+            ('last_access', 'REAL'),
+            ('evicted', 'INTEGER NOT NULL DEFAULT 0'),
+        ),
+    }
+
+    # Paramètres par requête (limite de SQLite < 3.32 : 999)
+    MAX_VARIABLES = 900
+
+    _local = threading.local()
+
+    @staticmethod
+    def connection():
+        """Connexion propre au thread courant (SQLite en mode WAL)"""
+        conn = getattr(IndexService._local, 'conn', None)
+        if conn is None or IndexService._local.path != Config.INDEX_DATABASE:
+            os.makedirs(os.path.dirname(Config.INDEX_DATABASE), exist_ok=True)
+            conn = sqlite3.connect(Config.INDEX_DATABASE, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(IndexService.SCHEMA)
+            IndexService._migrate(conn)
+            IndexService._local.conn = conn
+            IndexService._local.path = Config.INDEX_DATABASE
+        return conn
+
+    @staticmethod
+    def _migrate(conn):
+        for table, columns in IndexService.MIGRATIONS.items():
+            existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for name, definition in columns:
+                if name not in existing:
+                    try:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+                    except sqlite3.OperationalError:
+                        pass  # ajoutée en parallèle par un autre processus
+        conn.execute('CREATE INDEX IF NOT EXISTS derivatives_source ON derivatives (source_filename)')
+        conn.execute('CREATE INDEX IF NOT EXISTS derivatives_lru ON derivatives (evicted, last_access)')
+
+    @staticmethod
+    @contextmanager
+    def transaction():
+        """Transaction en écriture exclusive (sérialise les écrivains, y compris entre processus)"""
+        conn = IndexService.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    # ===== BLOBS =====
+    @staticmethod
+    def get_blob(content_hash, conn=None):
+        conn = conn or IndexService.connection()
+        row = conn.execute('SELECT * FROM blobs WHERE hash = ?', (content_hash,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def add_blob(conn, content_hash, ext, size_bytes):
+        conn.execute(
+            'INSERT OR IGNORE INTO blobs (hash, ext, size_bytes, refcount, created) VALUES (?, ?, ?, 0, ?)',
+            (content_hash, ext, size_bytes, time.time()))
+
+    @staticmethod
+    def delete_blob(conn, content_hash):
+        conn.execute('DELETE FROM blobs WHERE hash = ?', (content_hash,))
+        conn.execute('DELETE FROM perceptual_hashes WHERE hash = ?', (content_hash,))
+
+    # ===== UPLOADS =====
+    @staticmethod
+    def add_upload(conn, filename, content_hash, original_filename, metadata, upload_time):
+        """Enregistre un alias et incrémente le compteur de références du blob"""
+        conn.execute(
+            'INSERT INTO uploads (filename, hash, original_filename, metadata, upload_time) VALUES (?, ?, ?, ?, ?)',
+            (filename, content_hash, original_filename, json.dumps(metadata), upload_time))
+        conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?', (content_hash,))
+
+    @staticmethod
+    def remove_upload(conn, filename):
+        """Supprime un alias, retourne le blob mis à jour (None si l'alias est inconnu)"""
+        row = conn.execute('SELECT hash FROM uploads WHERE filename = ?', (filename,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('DELETE FROM uploads WHERE filename = ?', (filename,))
+        conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?', (row['hash'],))
+        return IndexService.get_blob(row['hash'], conn)
+
+    @staticmethod
+    def get_upload(filename, conn=None):
+        conn = conn or IndexService.connection()
+        row = conn.execute('SELECT * FROM uploads WHERE filename = ?', (filename,)).fetchone()
+        if row is None:
+            return None
+        upload = dict(row)
+        upload['metadata'] = json.loads(upload['metadata']) if upload['metadata'] else {}
+        return upload
+
+    @staticmethod
+    def list_uploads():
+        """Uploads du plus récent au plus ancien (aucun accès au stockage)"""
+        rows = IndexService.connection().execute(
+            'SELECT * FROM uploads ORDER BY upload_time DESC').fetchall()
+        uploads = []
+        for row in rows:
+            upload = dict(row)
+            upload['metadata'] = json.loads(upload['metadata']) if upload['metadata'] else {}
+            uploads.append(upload)
+        return uploads
+
+    @staticmethod
+    def get_upload_hash(filename):
+        row = IndexService.connection().execute(
+            'SELECT hash FROM uploads WHERE filename = ?', (filename,)).fetchone()
+        return row['hash'] if row else None
+
+    @staticmethod
+    def find_upload_by_hash(content_hash, conn=None):
+        conn = conn or IndexService.connection()
+        row = conn.execute(
+            'SELECT filename FROM uploads WHERE hash = ? LIMIT 1', (content_hash,)).fetchone()
+        return IndexService.get_upload(row['filename'], conn) if row else None
+
+    @staticmethod
+    def uploads_of(hashes):
+        """Alias de plusieurs contenus, du plus ancien au plus récent"""
+        hashes, uploads = list(hashes), []
+        for start in range(0, len(hashes), IndexService.MAX_VARIABLES):
+            part = hashes[start:start + IndexService.MAX_VARIABLES]
+            rows = IndexService.connection().execute(
+                f"SELECT * FROM uploads WHERE hash IN ({', '.join('?' * len(part))})", part).fetchall()
+            for row in rows:
+                upload = dict(row)
+                upload['metadata'] = json.loads(upload['metadata']) if upload['metadata'] else {}
+                uploads.append(upload)
+        return sorted(uploads, key=lambda upload: upload['upload_time'] or '')
+
+    # ===== DÉRIVÉS =====
+    @staticmethod
+    def make_recipe(**recipe):
+        """Clé canonique d'une recette de traitement"""
+        return json.dumps(recipe, sort_keys=True, separators=(',', ':'))
+
+    @staticmethod
+    def find_derivatives(content_hash, recipe):
+        rows = IndexService.connection().execute(
+            'SELECT filename FROM derivatives WHERE source_hash = ? AND recipe = ? AND evicted = 0 '
+            'ORDER BY created', (content_hash, recipe)).fetchall()
+        return [row['filename'] for row in rows]
+
+    @staticmethod
+    def add_derivative(filename, content_hash, recipe, source_filename, size_bytes):
+        now = time.time()
+        with IndexService.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO derivatives '
+                '(filename, source_hash, recipe, created, source_filename, size_bytes, last_access, evicted) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+                (filename, content_hash, recipe, now, source_filename, size_bytes, now))
+
+    @staticmethod
+    def get_derivative(filename):
+        row = IndexService.connection().execute(
+            'SELECT * FROM derivatives WHERE filename = ?', (filename,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def touch_derivative(filename, min_interval):
+        """Met à jour la date d'accès (au plus une écriture par intervalle)"""
+        now = time.time()
+        conn = IndexService.connection()
+        conn.execute(
+            'UPDATE derivatives SET last_access = ? WHERE filename = ? AND '
+            '(last_access IS NULL OR last_access < ?)', (now, filename, now - min_interval))
+
+    @staticmethod
+    def set_derivative_evicted(conn, filename, evicted, size_bytes=None):
+        if size_bytes is None:
+            conn.execute('UPDATE derivatives SET evicted = ? WHERE filename = ?', (int(evicted), filename))
+        else:
+            conn.execute('UPDATE derivatives SET evicted = ?, size_bytes = ?, last_access = ? WHERE filename = ?',
+                         (int(evicted), size_bytes, time.time(), filename))
+
+    @staticmethod
+    def derivatives_of(source_filename):
+        rows = IndexService.connection().execute(
+            'SELECT filename FROM derivatives WHERE source_filename = ?', (source_filename,)).fetchall()
+        return [row['filename'] for row in rows]
+
+    @staticmethod
+    def delete_derivative(conn, filename):
+        conn.execute('DELETE FROM derivatives WHERE filename = ?', (filename,))
+
+    @staticmethod
+    def resident_derivatives_size(conn=None):
+        conn = conn or IndexService.connection()
+        row = conn.execute(
+            'SELECT COALESCE(SUM(size_bytes), 0) AS total FROM derivatives WHERE evicted = 0').fetchone()
+        return row['total']
+
+    @staticmethod
+    def least_recently_used_derivatives(limit, conn=None):
+        conn = conn or IndexService.connection()
+        rows = conn.execute(
+            'SELECT filename, size_bytes FROM derivatives WHERE evicted = 0 '
+            'ORDER BY COALESCE(last_access, created) LIMIT ?', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    # ===== STATISTIQUES =====
+    @staticmethod
+    def add_blob_stats(conn, content_hash, image_format, mode, groups, row):
+        """Enregistre les statistiques d'un contenu, False si elles existent déjà"""
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO blob_stats (hash, format, mode, groups, pixels, mean, m2, histogram) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (content_hash, image_format, mode, json.dumps(groups), row['pixels'], row['mean'], row['m2'],
+             row['histogram']))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def pop_blob_stats(conn, content_hash):
+        """Retire les statistiques d'un contenu et les retourne (None si absentes)"""
+        row = conn.execute('SELECT * FROM blob_stats WHERE hash = ?', (content_hash,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('DELETE FROM blob_stats WHERE hash = ?', (content_hash,))
+        row = dict(row)
+        row['groups'] = json.loads(row['groups'])
+        return row
+
+    @staticmethod
+    def all_blob_stats(conn):
+        rows = [dict(row) for row in conn.execute('SELECT * FROM blob_stats')]
+        for row in rows:
+            row['groups'] = json.loads(row['groups'])
+        return rows
+
+    @staticmethod
+    def blob_stats_hashes():
+        return {row['hash'] for row in IndexService.connection().execute('SELECT hash FROM blob_stats')}
+
+    @staticmethod
+    def find_blob_stats(filenames=None, image_format=None, mode=None, since=None, until=None):
+        """Statistiques des contenus d'un sous-ensemble d'uploads (chaque contenu une fois)"""
+        if filenames is not None and len(filenames) > IndexService.MAX_VARIABLES:
+            # Liste longue : par tranches, chaque contenu une fois
+            rows, filenames = {}, list(filenames)
+            for start in range(0, len(filenames), IndexService.MAX_VARIABLES):
+                part = filenames[start:start + IndexService.MAX_VARIABLES]
+                for row in IndexService.find_blob_stats(part, image_format, mode, since, until):
+                    rows[row['hash']] = row
+            return list(rows.values())
+        upload_filters, params = [], []
+        if filenames is not None:
+            upload_filters.append(f"filename IN ({', '.join('?' * len(filenames))})")
+            params += list(filenames)
+        if since:
+            upload_filters.append('upload_time >= ?')
+            params.append(since)
+        if until:
+            upload_filters.append('upload_time < ?')
+            params.append(until)
+        query = 'SELECT * FROM blob_stats WHERE hash IN (SELECT hash FROM uploads'
+        query += f" WHERE {' AND '.join(upload_filters)})" if upload_filters else ')'
+        if image_format:
+            query += ' AND format = ?'
+            params.append(image_format)
+        if mode:
+            query += ' AND mode = ?'
+            params.append(mode)
+        return [dict(row) for row in IndexService.connection().execute(query, params)]
+
+    @staticmethod
+    def get_stats_aggregate(key, conn=None):
+        conn = conn or IndexService.connection()
+        row = conn.execute('SELECT * FROM stats_aggregates WHERE key = ?', (key,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def put_stats_aggregate(conn, key, row):
+        """Remplace un agrégat (supprimé quand il ne compte plus aucune image)"""
+        if row['images'] <= 0:
+            conn.execute('DELETE FROM stats_aggregates WHERE key = ?', (key,))
+            return
+        conn.execute(
+            'INSERT OR REPLACE INTO stats_aggregates (key, images, pixels, mean, m2, histogram) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, row['images'], row['pixels'], row['mean'], row['m2'], row['histogram']))
+
+    @staticmethod
+    def clear_stats_aggregates(conn):
+        conn.execute('DELETE FROM stats_aggregates')
+
+    # ===== EMPREINTES PERCEPTUELLES =====
+    @staticmethod
+    def add_perceptual_hash(conn, content_hash, chunks):
+        """Enregistre l'empreinte d'un contenu, donnée par ses quatre blocs de 16 bits"""
+        value = 0
+        for chunk in chunks:
+            value = value << 16 | chunk
+        # INTEGER SQLite signé sur 64 bits
+        value = value - (1 << 64) if value >= 1 << 63 else value
+        conn.execute('INSERT OR IGNORE INTO perceptual_hashes (hash, phash, c0, c1, c2, c3) VALUES (?, ?, ?, ?, ?, ?)',
+                     (content_hash, value, *chunks))
+
+    @staticmethod
+    def get_perceptual_hash(content_hash):
+        row = IndexService.connection().execute(
+            'SELECT phash FROM perceptual_hashes WHERE hash = ?', (content_hash,)).fetchone()
+        return row['phash'] & 0xFFFFFFFFFFFFFFFF if row else None
+
+    @staticmethod
+    def find_perceptual_hashes(probes):
+        """Contenus dont au moins un bloc vaut une des valeurs sondées : {hash: empreinte}
+
+        probes : une liste de valeurs par bloc (c0..c3), chaque requête passe par l'index du bloc.
+        """
+        conn, found = IndexService.connection(), {}
+        for column, values in enumerate(probes):
+            values = list(values)
+            for start in range(0, len(values), IndexService.MAX_VARIABLES):
+                part = values[start:start + IndexService.MAX_VARIABLES]
+                rows = conn.execute(f"SELECT hash, phash FROM perceptual_hashes WHERE c{column} IN "
+                                    f"({', '.join('?' * len(part))})", part)
+                for row in rows:
+                    found[row['hash']] = row['phash'] & 0xFFFFFFFFFFFFFFFF
+        return found
+
+    @staticmethod
+    def all_perceptual_hashes():
+        return [(row['hash'], row['phash'] & 0xFFFFFFFFFFFFFFFF)
+                for row in IndexService.connection().execute('SELECT hash, phash FROM perceptual_hashes')]
+
+    @staticmethod
+    def uploads_without_perceptual_hash():
+        """Un alias par contenu encore sans empreinte (galerie antérieure, image illisible)"""
+        rows = IndexService.connection().execute(
+            'SELECT * FROM uploads WHERE hash NOT IN (SELECT hash FROM perceptual_hashes) GROUP BY hash').fetchall()
+        uploads = []
+        for row in rows:
+            upload = dict(row)
+            upload['metadata'] = json.loads(upload['metadata']) if upload['metadata'] else {}
+            uploads.append(upload)
+        return uploads
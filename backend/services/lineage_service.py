@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import threading
+import zlib
+from config.settings import Config
+from services.admission_service import AdmissionService, Overloaded, BATCH
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from services.tile_service import TileService
+from utils import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class LineageService:
+    """Cycle de vie des images traitées.
+
+    Chaque image traitée est rattachée dans l'index à son contenu source et à
+    sa recette. Cela permet :
+
+    - de supprimer en cascade les dérivés d'une image source supprimée
+    - de suivre la date du dernier accès (téléchargements, affichage, tuiles)
+    - d'évincer les résultats les moins récemment utilisés quand le quota
+      ``PROCESSED_QUOTA_BYTES`` est dépassé (la ligne et sa recette restent)
+    - de régénérer un résultat évincé à sa prochaine demande
+    """
+
+    # Verrous répartis par nom (utils.file_lock, communs à tous les workers) :
+    # une seule régénération / éviction à la fois par fichier
+    LOCK_STRIPES = 64
+    _collector = None
+    _stop = threading.Event()
+
+    @staticmethod
+    def resolve(filename, priority=BATCH):
+        """Nom d'une image traitée -> (backend, clé), en la régénérant si elle a été évincée
+
+        La régénération passe par le contrôle d'admission : Overloaded si le
+        budget de calcul est épuisé.
+        """
+        backend, key, cost = LineageService.locate(filename)
+        if cost is None:
+            return backend, key
+        with AdmissionService.admit(cost, priority) as admission:
+            if not admission.admitted:
+                raise Overloaded(admission.retry_after)
+            if not LineageService.regenerate(filename):
+                return None, None
+        return StorageService.resolve_processed(filename)
+
+    @staticmethod
+    def locate(filename):
+        """(backend, clé, None) si l'image est disponible, (None, None, coût estimé) si elle est à régénérer"""
+        backend, key = StorageService.resolve_processed(filename)
+        derivative = IndexService.get_derivative(filename)
+        if derivative is None:
+            return backend, key, None
+
+        if backend is None or derivative['evicted']:
+            recipe = json.loads(derivative['recipe'])
+            return None, None, AdmissionService.estimate_cost(derivative['source_filename'],
+                                                              LineageService._operations(recipe))
+        IndexService.touch_derivative(filename, Config.ACCESS_TOUCH_INTERVAL)
+        return backend, key, None
+
+    @staticmethod
+    def regenerate(filename):
+        """Recalcule une image traitée à partir de sa recette, retourne True si elle est disponible"""
+        with LineageService._locked(filename):
+            derivative = IndexService.get_derivative(filename)
+            if derivative is None:
+                return False
+            processed = StorageService.processed()
+            # Un autre thread l'a peut-être déjà régénérée pendant l'attente du verrou
+            if not derivative['evicted'] and processed.exists(filename):
+                return True
+
+            blob = IndexService.get_blob(derivative['source_hash'])
+            if blob is None:
+                return False
+            source = StorageService.blobs()
+            source_key = StorageService.blob_key(blob['hash'], blob['ext'])
+            if not source.exists(source_key):
+                return False
+
+            recipe = json.loads(derivative['recipe'])
+            try:
+                if 'preset' in recipe:
+                    from services.preset_service import render_preset
+                    render_preset(source, source_key, recipe['preset'], filename, recipe.get('output'))
+                else:
+                    from services.processing_service import ProcessingService
+                    if not ProcessingService.render(source, source_key, recipe['operation'],
+                                                    recipe['params'], filename, recipe.get('output')):
+                        return False
+            except (ValueError, KeyError):
+                return False
+
+            with IndexService.transaction() as conn:
+                IndexService.set_derivative_evicted(conn, filename, False, processed.size(filename))
+            return True
+
+    @staticmethod
+    def _operations(recipe):
+        if 'preset' in recipe:
+            from services.preset_service import PRESETS
+            return [operation['type'] for operation in PRESETS.get(recipe['preset'], [])]
+        return [recipe.get('operation')]
+
+    @staticmethod
+    def delete_derived_from(source_filename):
+        """Supprime les images traitées produites à partir d'un nom source"""
+        processed = StorageService.processed()
+        deleted = 0
+        for filename in IndexService.derivatives_of(source_filename):
+            with LineageService._locked(filename):
+                processed.delete(filename)
+                TileService.purge(processed, filename)
+                with IndexService.transaction() as conn:
+                    IndexService.delete_derivative(conn, filename)
+            deleted += 1
+        return deleted
+
+    @staticmethod
+    def collect(quota_bytes=None):
+        """Évince les résultats les moins récemment utilisés jusqu'à repasser sous le quota.
+
+        On descend jusqu'à ``GC_LOW_WATERMARK`` du quota pour ne pas relancer
+        une éviction à chaque nouveau traitement. Le total, le choix des
+        victimes et leur marquage se font dans une seule transaction : deux
+        collectes concurrentes ne comptent pas deux fois les mêmes octets.
+        Retourne (fichiers, octets) libérés.
+        """
+        quota = Config.PROCESSED_QUOTA_BYTES if quota_bytes is None else quota_bytes
+        victims = []
+        with IndexService.transaction() as conn:
+            total = IndexService.resident_derivatives_size(conn)
+            if total <= quota:
+                return 0, 0
+            target = quota * Config.GC_LOW_WATERMARK
+            while total > target:
+                # Les lignes déjà marquées sortent de la requête suivante
+                candidates = IndexService.least_recently_used_derivatives(100, conn)
+                if not candidates:
+                    break
+                for candidate in candidates:
+                    if total <= target:
+                        break
+                    IndexService.set_derivative_evicted(conn, candidate['filename'], True)
+                    victims.append(candidate)
+                    total -= candidate['size_bytes']
+
+        processed = StorageService.processed()
+        for candidate in victims:
+            filename = candidate['filename']
+            with LineageService._locked(filename):
+                # Régénérée depuis le marquage : le fichier est de nouveau utile
+                derivative = IndexService.get_derivative(filename)
+                if derivative is not None and derivative['evicted']:
+                    processed.delete(filename)
+                    TileService.purge(processed, filename)
+        return len(victims), sum(candidate['size_bytes'] for candidate in victims)
+
+    @staticmethod
+    def start_collector():
+        """Lance le ramasse-miettes périodique (thread démon par processus, un seul collecte à la fois)"""
+        if LineageService._collector is not None and LineageService._collector.is_alive():
+            return
+        LineageService._stop.clear()
+        LineageService._collector = threading.Thread(
+            target=LineageService._run_collector, name='processed-gc', daemon=True)
+        LineageService._collector.start()
+
+    @staticmethod
+    def stop_collector():
+        LineageService._stop.set()
+        if LineageService._collector is not None:
+            LineageService._collector.join()
+            LineageService._collector = None
+
+    @staticmethod
+    def _run_collector():
+        while not LineageService._stop.wait(Config.GC_INTERVAL):
+            try:
+                with LineageService._lock_file('gc', blocking=False) as acquired:
+                    if not acquired:
+                        continue  # un autre worker collecte
+                    evicted, freed = LineageService.collect()
+                    tiles, tile_bytes = TileService.collect()
+                if evicted:
+                    logger.info("%d image(s) traitée(s) évincée(s), %d octets libérés", evicted, freed)
+                if tiles:
+                    logger.info("%d cache(s) de tuiles supprimé(s), %d octets libérés", tiles, tile_bytes)
+            except Exception:
+                logger.exception("Échec du ramasse-miettes des images traitées")
+
+    @staticmethod
+    def _locked(filename):
+        # crc32 plutôt que hash() : même répartition dans tous les processus
+        return LineageService._lock_file(f"lineage_{zlib.crc32(filename.encode()) % LineageService.LOCK_STRIPES}")
+
+    @staticmethod
+    def _lock_file(name, blocking=True):
+        """Verrou exclusif entre threads et processus, fournit True s'il est obtenu"""
+        os.makedirs(Config.LOCK_FOLDER, exist_ok=True)
+        return file_lock.locked(os.path.join(Config.LOCK_FOLDER, f"{name}.lock"), blocking)
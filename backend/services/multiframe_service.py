@@ -0,0 +1,152 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence, GifImagePlugin, TiffImagePlugin
+from config.settings import Config
+from services.storage_service import StorageService
+from utils import metrics
+from utils.lifecycle import on_shutdown
+
+
+class MultiFrameService:
+    """Traitement trame par trame des GIF animés et des TIFF multipages.
+
+    Les trames sont décodées une à une (PIL ImageSequence), traitées dans un
+    pool de threads partagé avec au plus ``Config.FRAME_WINDOW`` trames en
+    vol, puis réécrites dans l'ordre au fil de l'eau : la mémoire dépend de la
+    fenêtre, pas du nombre de trames.
+    """
+
+    EXTENSIONS = {'.gif': 'gif', '.tif': 'tiff', '.tiff': 'tiff'}
+    TIFF_COMPRESSION = {'none': 'raw', 'lzw': 'tiff_lzw', 'deflate': 'tiff_adobe_deflate'}
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def is_multiframe(path):
+        """True si le fichier contient plusieurs trames (GIF animé, TIFF multipage)"""
+        try:
+            with Image.open(path) as img:
+                return bool(getattr(img, 'is_animated', False))
+        except Exception:
+            return False
+
+    @staticmethod
+    def render_stored(source, source_key, output_filename, process_frame, output=None, name='frames'):
+        """render() depuis le stockage vers les images traitées.
+
+        Retourne None si la source n'a qu'une trame ou si le format de sortie ne
+        conserve pas les trames (l'appelant traite alors l'image seule).
+        """
+        extensions = MultiFrameService.EXTENSIONS
+        if (MultiFrameService._extension(output_filename) not in extensions or
+                MultiFrameService._extension(source_key) not in extensions):
+            return None
+        with source.fetch(source_key) as input_path:
+            if not MultiFrameService.is_multiframe(input_path):
+                return None
+            with StorageService.processed().staging(output_filename) as output_path, \
+                    metrics.operation(name):
+                return MultiFrameService.render(input_path, output_path, process_frame, output)
+
+    @staticmethod
+    def render(input_path, output_path, process_frame, output=None):
+        """Applique process_frame (image BGR -> image) à chaque trame, retourne le nombre de trames"""
+        with Image.open(input_path) as source:
+            frames = MultiFrameService._decoded_frames(source)
+            results = MultiFrameService._map_bounded(process_frame, frames)
+            fmt = MultiFrameService.EXTENSIONS[MultiFrameService._extension(output_path)]
+            if fmt == 'gif':
+                return MultiFrameService._write_gif(output_path, results, source.info.get('loop', 0))
+            return MultiFrameService._write_tiff(output_path, results, output)
+
+    @staticmethod
+    def _decoded_frames(source):
+        """(image BGR, durée en ms) pour chaque trame, décodées à la demande"""
+        for frame in ImageSequence.Iterator(source):
+            with metrics.phase('decode'):
+                bgr = cv2.cvtColor(np.asarray(frame.convert('RGB')), cv2.COLOR_RGB2BGR)
+            metrics.decoded(bgr, 0, 'processing')
+            yield bgr, frame.info.get('duration')
+
+    @staticmethod
+    def _map_bounded(process_frame, frames):
+        """Résultats dans l'ordre, au plus FRAME_WINDOW trames soumises et non écrites"""
+        executor = MultiFrameService._get_executor()
+        pending = deque()
+        try:
+            for img, duration in frames:
+                pending.append((executor.submit(process_frame, img), duration))
+                if len(pending) >= Config.FRAME_WINDOW:
+                    future, frame_duration = pending.popleft()
+                    yield future.result(), frame_duration
+            while pending:
+                future, frame_duration = pending.popleft()
+                yield future.result(), frame_duration
+        finally:
+            for future, _ in pending:
+                future.cancel()
+
+    @staticmethod
+    def _to_pil(img):
+        if img.ndim == 2:
+            return Image.fromarray(img)
+        return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+
+    @staticmethod
+    def _write_gif(output_path, results, loop):
+        # Écriture incrémentale (en-tête, puis chaque trame avec sa propre palette) :
+        # Image.save(save_all=True) garderait toutes les trames en mémoire
+        count = 0
+        with open(output_path, 'wb') as f:
+            for img, duration in results:
+                with metrics.phase('encode'):
+                    frame = MultiFrameService._to_pil(img).convert('RGB').convert(
+                        'P', palette=Image.Palette.ADAPTIVE)
+                    if count == 0:
+                        header, _ = GifImagePlugin.getheader(frame, info={'loop': loop})
+                        f.write(b''.join(header))
+                    chunks = GifImagePlugin.getdata(frame, duration=duration or 0, include_color_table=True)
+                with metrics.phase('write'):
+                    for chunk in chunks:
+                        f.write(chunk)
+                count += 1
+            f.write(b';')  # fin du fichier GIF
+        return count
+
+    @staticmethod
+    def _write_tiff(output_path, results, output):
+        # Une page ajoutée à la fois (Image.save(save_all=True) matérialise la liste des pages)
+        compression = MultiFrameService.TIFF_COMPRESSION[(output or {}).get('compression', 'lzw')]
+        count = 0
+        with open(output_path, 'w+b') as f, TiffImagePlugin.AppendingTiffWriter(f) as tiff:
+            for img, _ in results:
+                with metrics.phase('encode'):
+                    MultiFrameService._to_pil(img).save(tiff, format='TIFF', compression=compression)
+                    tiff.newFrame()
+                count += 1
+        return count
+
+    @staticmethod
+    def _extension(path):
+        return ('.' + path.rsplit('.', 1)[-1].lower()) if '.' in path else ''
+
+    @staticmethod
+    def _get_executor():
+        # Pool partagé : borne le nombre total de trames traitées simultanément
+        with MultiFrameService._executor_lock:
+            if MultiFrameService._executor is None:
+                MultiFrameService._executor = ThreadPoolExecutor(
+                    max_workers=Config.FRAME_WORKERS, thread_name_prefix='frames')
+                on_shutdown(MultiFrameService._shutdown_executor)
+            return MultiFrameService._executor
+
+    @staticmethod
+    def _shutdown_executor():
+        with MultiFrameService._executor_lock:
+            if MultiFrameService._executor is not None:
+                MultiFrameService._executor.shutdown(wait=True)
+                MultiFrameService._executor = None
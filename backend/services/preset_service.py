@@ -1,47 +1,82 @@
 import cv2
 import os
-from config.settings import Config  # ✨ FIX: Import Config, pas PROCESSED_FOLDER
 from services.processing_service import ProcessingService
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from services.encoding_service import EncodingService
+from services.multiframe_service import MultiFrameService
+from utils import metrics
 
 
-def apply_preset_operations(image_path, preset_name):
-    """Apply a series of operations defined by a preset"""
-    presets = {
-        'enhance_contrast': [
-            {'type': 'histogram_equalization', 'params': {}},  # ✨ FIX: Dict au lieu de tuple
-            {'type': 'sharpen', 'params': {'strength': 1.5}}
-        ],
-        'edge_detection': [
-            {'type': 'grayscale', 'params': {}},
-            {'type': 'gaussian_blur', 'params': {'kernel':  5}},
-            {'type': 'canny', 'params': {'threshold1': 100, 'threshold2': 200}}
-        ],
-        'denoise': [
-            {'type':  'bilateral_filter', 'params': {'d': 9, 'sigmaColor': 75, 'sigmaSpace': 75}}
-        ],
-        'black_white': [
-            {'type': 'grayscale', 'params': {}},
-            {'type': 'adaptive_threshold', 'params': {'blockSize': 11, 'C':  2}}
-        ]
-    }
-
-    if preset_name not in presets:
-        raise ValueError(f"Unknown preset: {preset_name}")
+PRESETS = {
+    'enhance_contrast': [
+        {'type': 'histogram_equalization', 'params': {}},  # ✨ FIX: Dict au lieu de tuple
+        {'type': 'sharpen', 'params': {'strength': 1.5}}
+    ],
+    'edge_detection': [
+        {'type': 'grayscale', 'params': {}},
+        {'type': 'gaussian_blur', 'params': {'kernel':  5}},
+        {'type': 'canny', 'params': {'threshold1': 100, 'threshold2': 200}}
+    ],
+    'denoise': [
+        {'type':  'bilateral_filter', 'params': {'d': 9, 'sigmaColor': 75, 'sigmaSpace': 75}}
+    ],
+    'black_white': [
+        {'type': 'grayscale', 'params': {}},
+        {'type': 'adaptive_threshold', 'params': {'blockSize': 11, 'C':  2}}
+    ]
+}
+
+
+def apply_preset(img, preset_name):
+    """Apply each preset operation in sequence to an in-memory image"""
+    for operation in PRESETS[preset_name]:
+        img = ProcessingService.apply_operation(img, operation['type'], operation['params'])
+    return img
+
+
+def render_preset(source, source_key, preset_name, output_filename, output=None):
+    """Apply the preset operations to a stored image and publish the result"""
+    # Animated GIF / multi-page TIFF: every frame goes through the preset
+    frames = MultiFrameService.render_stored(source, source_key, output_filename,
+                                             lambda img: apply_preset(img, preset_name),
+                                             output, name=f"preset:{preset_name}")
+    if frames is not None:
+        return
+
+    with metrics.operation(f"preset:{preset_name}"):
+        img = apply_preset(StorageService.read_image(source, source_key), preset_name)
 
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError("Failed to read image")
+        # Save result
+        with StorageService.processed().staging(output_filename) as output_path, EncodingService.using(output):
+            ProcessingService._imwrite(output_path, img)
 
-    # ✨ FIX:  Pas d'instanciation, méthode statique directe
-    # Apply each operation in sequence
-    for operation in presets[preset_name]:
-        img = ProcessingService. apply_operation(img, operation['type'], operation['params'])
 
-    # Save result
-    filename = os.path.basename(image_path)
+def apply_preset_operations(filename, preset_name, output=None):
+    """Apply a series of operations defined by a preset, return the output filename
+
+    output is an optional encoding spec (see EncodingService).
+    """
+    if preset_name not in PRESETS:
+        raise ValueError(f"Unknown preset: {preset_name}")
+
+    source, source_key = StorageService.resolve_upload(filename)
+    if source is None:
+        raise FileNotFoundError(filename)
+
     name, ext = os.path.splitext(filename)
-    output_filename = f"{name}_preset_{preset_name}{ext}"
-    output_path = os.path.join(Config. PROCESSED_FOLDER, output_filename)  # ✨ FIX: Config.PROCESSED_FOLDER
+    spec = EncodingService.normalize(output, ext)
+    output_filename = (f"{name}_preset_{preset_name}{EncodingService.suffix(spec)}"
+                       f"{EncodingService.extension(spec, ext)}")
+
+    # Reuse the result of an identical upload (deduplicated content)
+    source_hash = IndexService.get_upload_hash(filename)
+    recipe = IndexService.make_recipe(preset=preset_name, **({'output': spec} if spec else {}))
+    if source_hash and ProcessingService.reuse_derivative(source_hash, recipe, output_filename, filename):
+        return output_filename
 
-    cv2.imwrite(output_path, img)
-    return output_path
\ No newline at end of file
+    render_preset(source, source_key, preset_name, output_filename, spec)
+    if source_hash:
+        IndexService.add_derivative(output_filename, source_hash, recipe, filename,
+                                    StorageService.processed().size(output_filename))
+    return output_filename
@@ -1,10 +1,42 @@
 import os
+import threading
 import cv2
 import numpy as np
 from PIL import Image, ImageEnhance
 from config.settings import Config
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from services.encoding_service import EncodingService
+from services.multiframe_service import MultiFrameService
+from utils import metrics
 
 class ProcessingService:
+    # Trame en cours de traitement par apply_file_operation (lue par _imread, capturée par _imwrite)
+    _frame = threading.local()
+
+    # Kernels Prewitt prédéfinis
+    PREWITT_KERNELS = {
+        3: {
+            'x': np.array([[-1, 0, 1], [-1, 0, 1], [-1, 0, 1]], dtype=np.float32),
+            'y': np.array([[-1, -1, -1], [0, 0, 0], [1, 1, 1]], dtype=np.float32)
+        },
+        5: {
+            'x': np.array([[-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1]], dtype=np.float32),
+            'y': np.array([[-1, -1, -1, -1, -1], [-1, -1, -1, -1, -1], [0, 0, 0, 0, 0], [1, 1, 1, 1, 1], [1, 1, 1, 1, 1]], dtype=np.float32)
+        },
+        7: {
+            'x': np.array([[-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1]], dtype=np.float32),
+            'y': np.array([[-1, -1, -1, -1, -1, -1, -1], [-1, -1, -1, -1, -1, -1, -1], [-1, -1, -1, -1, -1, -1, -1], [0, 0, 0, 0, 0, 0, 0], [1, 1, 1, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1, 1]], dtype=np.float32)
+        }
+    }
+
+    # Kernels Laplacien prédéfinis
+    LAPLACIAN_KERNELS = {
+        3: np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]], dtype=np.float32),
+        5: np.array([[0, 0, -1, 0, 0], [0, -1, -2, -1, 0], [-1, -2, 16, -2, -1], [0, -1, -2, -1, 0], [0, 0, -1, 0, 0]], dtype=np.float32),
+        7: np.array([[0, 0, 0, -1, 0, 0, 0], [0, 0, -1, -2, -1, 0, 0], [0, -1, -2, -4, -2, -1, 0], [-1, -2, -4, 32, -4, -2, -1], [0, -1, -2, -4, -2, -1, 0], [0, 0, -1, -2, -1, 0, 0], [0, 0, 0, -1, 0, 0, 0]], dtype=np.float32)
+    }
+
     @staticmethod
     def _generate_param_suffix(operation, params):
         """Génère un suffixe basé sur les paramètres"""
@@ -37,6 +69,51 @@ class ProcessingService:
         return f"_{'_'.join(suffix_parts)}" if suffix_parts else ""
         # ✨ NOUVEAU: Méthode pour les fonctionnalités avancées (preview & presets)
 
+    @staticmethod
+    def reuse_derivative(source_hash, recipe, output_filename, source_filename):
+        """Partage un résultat existant (même contenu source, même recette) sous output_filename"""
+        processed = StorageService.processed()
+        for cached_filename in IndexService.find_derivatives(source_hash, recipe):
+            if not processed.exists(cached_filename):
+                continue
+            if cached_filename != output_filename:
+                # Lien physique en local, copie côté serveur en S3
+                processed.copy(cached_filename, output_filename)
+                IndexService.add_derivative(output_filename, source_hash, recipe, source_filename,
+                                            processed.size(output_filename))
+            metrics.cache_hit('derivatives', True)
+            return True
+        metrics.cache_hit('derivatives', False)
+        return False
+
+    @staticmethod
+    def render(source, source_key, operation, params, output_filename, output=None):
+        """Calcule une opération et publie le résultat dans le stockage des images traitées"""
+        # GIF animé / TIFF multipage : chaque trame passe par la même opération
+        frames = MultiFrameService.render_stored(
+            source, source_key, output_filename,
+            lambda img: ProcessingService.apply_file_operation(img, operation, params),
+            output, name=operation)
+        if frames is not None:
+            return frames > 0
+
+        with source.fetch(source_key) as input_path, \
+                StorageService.processed().staging(output_filename) as output_path, \
+                EncodingService.using(output):
+            return ProcessingService._apply_operation(input_path, output_path, operation, params)
+
+    @staticmethod
+    def apply_file_operation(image, operation, params):
+        """Applique une opération de /api/process à une image en mémoire (trame d'une animation)"""
+        frame = ProcessingService._frame
+        frame.input, frame.output = image, None
+        try:
+            if not ProcessingService._dispatch_operation(None, None, operation, params):
+                raise ValueError(f"Erreur lors du traitement {operation}")
+            return frame.output
+        finally:
+            frame.input = frame.output = None
+
     @staticmethod
     def apply_contrast_brightness(image, params):
         alpha = float(params.get('contrast', 1.0))
@@ -175,23 +252,35 @@ class ProcessingService:
             raise Exception(f"Error applying operation '{operation}': {str(e)}")
 
     @staticmethod
-    def process_image(filename, operation, params=None):
-        """Traite une image avec l'opération spécifiée"""
+    def process_image(filename, operation, params=None, output=None):
+        """Traite une image avec l'opération spécifiée (output : profil d'encodage, optionnel)"""
         try:
-            input_path = os.path.join(Config.UPLOAD_FOLDER, filename)
-            if not os.path.exists(input_path):
+            source, source_key = StorageService.resolve_upload(filename)
+            if source is None:
                 return None, "Image non trouvée"
             
-            # Générer nom de fichier de sortie avec paramètres
+            # Générer nom de fichier de sortie avec paramètres et profil d'encodage
             name, ext = os.path.splitext(filename)
+            spec = EncodingService.normalize(output, ext)
             param_suffix = ProcessingService._generate_param_suffix(operation, params)
-            output_filename = f"{name}_{operation}{param_suffix}{ext}"
-            output_path = os.path.join(Config.PROCESSED_FOLDER, output_filename)
+            output_filename = (f"{name}_{operation}{param_suffix}{EncodingService.suffix(spec)}"
+                               f"{EncodingService.extension(spec, ext)}")
+            
+            # Résultat déjà calculé pour un contenu identique (doublon dédupliqué)
+            source_hash = IndexService.get_upload_hash(filename)
+            recipe = IndexService.make_recipe(operation=operation, params=params or {},
+                                              **({'output': spec} if spec else {}))
+            if source_hash and ProcessingService.reuse_derivative(source_hash, recipe, output_filename, filename):
+                return output_filename, None
             
-            # Appliquer l'opération
-            success = ProcessingService._apply_operation(input_path, output_path, operation, params)
+            # Appliquer l'opération (chemins locaux fournis par le stockage)
+            success = ProcessingService.render(source, source_key, operation, params, output_filename, spec)
             
             if success:
+                if source_hash:
+                    # Lignage : permet la régénération après éviction et la suppression en cascade
+                    IndexService.add_derivative(output_filename, source_hash, recipe, filename,
+                                                StorageService.processed().size(output_filename))
                 return output_filename, None
             else:
                 return None, f"Erreur lors du traitement {operation}"
@@ -291,7 +380,43 @@ class ProcessingService:
 
     @staticmethod
     def _apply_operation(input_path, output_path, operation, params):
-        """Applique l'opération spécifique"""
+        """Applique l'opération spécifique (durées par phase dans les métriques)"""
+        with metrics.operation(operation):
+            return ProcessingService._dispatch_operation(input_path, output_path, operation, params)
+
+    @staticmethod
+    def _imread(path, flags=cv2.IMREAD_COLOR):
+        """Décode l'image source (phase 'decode')"""
+        img = getattr(ProcessingService._frame, 'input', None)
+        if img is not None:
+            if flags == cv2.IMREAD_GRAYSCALE and img.ndim == 3:
+                return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            return img.copy()
+        with metrics.phase('decode'):
+            img = cv2.imread(path, flags)
+            if img is None:
+                img = StorageService.decode_with_pil(path, flags)
+        metrics.decoded(img, os.path.getsize(path), 'processing')
+        return img
+
+    @staticmethod
+    def _imwrite(path, img):
+        """Encode le résultat puis l'écrit (phases 'encode' et 'write')"""
+        if getattr(ProcessingService._frame, 'input', None) is not None:
+            ProcessingService._frame.output = img  # trame : réencodée par MultiFrameService
+            return True
+        with metrics.phase('encode'):
+            ok, buffer = cv2.imencode(os.path.splitext(path)[1], img, EncodingService.current_params())
+        if not ok:
+            return False
+        with metrics.phase('write'):
+            with open(path, 'wb') as f:
+                f.write(buffer)
+        metrics.encoded(len(buffer), 'processed')
+        return True
+
+    @staticmethod
+    def _dispatch_operation(input_path, output_path, operation, params):
         try:
             if operation == 'grayscale':
                 return ProcessingService._grayscale(input_path, output_path)
@@ -341,9 +466,9 @@ class ProcessingService:
     @staticmethod
     def _grayscale(input_path, output_path):
         """Conversion en niveaux de gris"""
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        cv2.imwrite(output_path, gray)
+        ProcessingService._imwrite(output_path, gray)
         return True
     
     @staticmethod
@@ -352,14 +477,14 @@ class ProcessingService:
         threshold_value = params.get('threshold', 127) if params else 127
         threshold_type = params.get('type', 'binary') if params else 'binary'
         
-        img = cv2.imread(input_path, cv2.IMREAD_GRAYSCALE)
+        img = ProcessingService._imread(input_path, cv2.IMREAD_GRAYSCALE)
         
         if threshold_type == 'adaptive':
             result = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 2)
         else:
             _, result = cv2.threshold(img, threshold_value, 255, cv2.THRESH_BINARY)
         
-        cv2.imwrite(output_path, result)
+        ProcessingService._imwrite(output_path, result)
         return True
     
     # ===== FILTRES DE FLOU =====
@@ -367,38 +492,38 @@ class ProcessingService:
     def _blur_gaussian(input_path, output_path, params):
         """Flou gaussien"""
         kernel_size = params.get('kernel_size', 5) if params else 5
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         blurred = cv2.GaussianBlur(img, (kernel_size, kernel_size), 0)
-        cv2.imwrite(output_path, blurred)
+        ProcessingService._imwrite(output_path, blurred)
         return True
     
     @staticmethod
     def _blur_median(input_path, output_path, params):
         """Flou médian"""
         kernel_size = params.get('kernel_size', 5) if params else 5
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         blurred = cv2.medianBlur(img, kernel_size)
-        cv2.imwrite(output_path, blurred)
+        ProcessingService._imwrite(output_path, blurred)
         return True
     
     @staticmethod
     def _blur_average(input_path, output_path, params):
         """Flou moyenneur"""
         kernel_size = params.get('kernel_size', 5) if params else 5
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         kernel = np.ones((kernel_size, kernel_size), np.float32) / (kernel_size * kernel_size)
         blurred = cv2.filter2D(img, -1, kernel)
-        cv2.imwrite(output_path, blurred)
+        ProcessingService._imwrite(output_path, blurred)
         return True
     
     # ===== FILTRES DE SHARPENING =====
     @staticmethod
     def _sharpen_kernel(input_path, output_path):
         """Accentuation avec kernel classique"""
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
         sharpened = cv2.filter2D(img, -1, kernel)
-        cv2.imwrite(output_path, sharpened)
+        ProcessingService._imwrite(output_path, sharpened)
         return True
     
 
@@ -410,9 +535,9 @@ class ProcessingService:
         """Détection de contours Canny"""
         low_threshold = params.get('low', 50) if params else 50
         high_threshold = params.get('high', 150) if params else 150
-        img = cv2.imread(input_path, cv2.IMREAD_GRAYSCALE)
+        img = ProcessingService._imread(input_path, cv2.IMREAD_GRAYSCALE)
         edges = cv2.Canny(img, low_threshold, high_threshold)
-        cv2.imwrite(output_path, edges)
+        ProcessingService._imwrite(output_path, edges)
         return True
     
 
@@ -426,12 +551,12 @@ class ProcessingService:
         if kernel_size < 3:
             kernel_size = 3
             
-        img = cv2.imread(input_path, cv2.IMREAD_GRAYSCALE)
+        img = ProcessingService._imread(input_path, cv2.IMREAD_GRAYSCALE)
         sobel_x = cv2.Sobel(img, cv2.CV_64F, 1, 0, ksize=kernel_size)
         sobel_y = cv2.Sobel(img, cv2.CV_64F, 0, 1, ksize=kernel_size)
         edges = np.sqrt(sobel_x**2 + sobel_y**2)
         edges = cv2.convertScaleAbs(edges)
-        cv2.imwrite(output_path, edges)
+        ProcessingService._imwrite(output_path, edges)
         return True
     
     @staticmethod
@@ -439,35 +564,19 @@ class ProcessingService:
         """Filtre de Prewitt avec kernels prédéfinis"""
         kernel_size = params.get('kernel_size', 3) if params else 3
         
-        # Kernels Prewitt prédéfinis
-        kernels = {
-            3: {
-                'x': np.array([[-1, 0, 1], [-1, 0, 1], [-1, 0, 1]], dtype=np.float32),
-                'y': np.array([[-1, -1, -1], [0, 0, 0], [1, 1, 1]], dtype=np.float32)
-            },
-            5: {
-                'x': np.array([[-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1], [-1, -1, 0, 1, 1]], dtype=np.float32),
-                'y': np.array([[-1, -1, -1, -1, -1], [-1, -1, -1, -1, -1], [0, 0, 0, 0, 0], [1, 1, 1, 1, 1], [1, 1, 1, 1, 1]], dtype=np.float32)
-            },
-            7: {
-                'x': np.array([[-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1], [-1, -1, -1, 0, 1, 1, 1]], dtype=np.float32),
-                'y': np.array([[-1, -1, -1, -1, -1, -1, -1], [-1, -1, -1, -1, -1, -1, -1], [-1, -1, -1, -1, -1, -1, -1], [0, 0, 0, 0, 0, 0, 0], [1, 1, 1, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1, 1]], dtype=np.float32)
-            }
-        }
-        
         # Utiliser taille 3 par défaut si non supportée
-        if kernel_size not in kernels:
+        if kernel_size not in ProcessingService.PREWITT_KERNELS:
             kernel_size = 3
             
-        img = cv2.imread(input_path, cv2.IMREAD_GRAYSCALE)
-        prewitt_x = kernels[kernel_size]['x']
-        prewitt_y = kernels[kernel_size]['y']
+        img = ProcessingService._imread(input_path, cv2.IMREAD_GRAYSCALE)
+        prewitt_x = ProcessingService.PREWITT_KERNELS[kernel_size]['x']
+        prewitt_y = ProcessingService.PREWITT_KERNELS[kernel_size]['y']
         
         edges_x = cv2.filter2D(img, cv2.CV_64F, prewitt_x)
         edges_y = cv2.filter2D(img, cv2.CV_64F, prewitt_y)
         edges = np.sqrt(edges_x**2 + edges_y**2)
         edges = cv2.convertScaleAbs(edges)
-        cv2.imwrite(output_path, edges)
+        ProcessingService._imwrite(output_path, edges)
         return True
     
     @staticmethod
@@ -475,22 +584,15 @@ class ProcessingService:
         """Filtre Laplacien avec kernels prédéfinis"""
         kernel_size = params.get('kernel_size', 3) if params else 3
         
-        # Kernels Laplacien prédéfinis
-        kernels = {
-            3: np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]], dtype=np.float32),
-            5: np.array([[0, 0, -1, 0, 0], [0, -1, -2, -1, 0], [-1, -2, 16, -2, -1], [0, -1, -2, -1, 0], [0, 0, -1, 0, 0]], dtype=np.float32),
-            7: np.array([[0, 0, 0, -1, 0, 0, 0], [0, 0, -1, -2, -1, 0, 0], [0, -1, -2, -4, -2, -1, 0], [-1, -2, -4, 32, -4, -2, -1], [0, -1, -2, -4, -2, -1, 0], [0, 0, -1, -2, -1, 0, 0], [0, 0, 0, -1, 0, 0, 0]], dtype=np.float32)
-        }
-        
         # Utiliser taille 3 par défaut si non supportée
-        if kernel_size not in kernels:
+        if kernel_size not in ProcessingService.LAPLACIAN_KERNELS:
             kernel_size = 3
             
-        img = cv2.imread(input_path, cv2.IMREAD_GRAYSCALE)
-        laplacian_kernel = kernels[kernel_size]
+        img = ProcessingService._imread(input_path, cv2.IMREAD_GRAYSCALE)
+        laplacian_kernel = ProcessingService.LAPLACIAN_KERNELS[kernel_size]
         edges = cv2.filter2D(img, cv2.CV_64F, laplacian_kernel)
         edges = cv2.convertScaleAbs(edges)
-        cv2.imwrite(output_path, edges)
+        ProcessingService._imwrite(output_path, edges)
         return True
     
     @staticmethod
@@ -499,9 +601,9 @@ class ProcessingService:
         width = params.get('width', 300) if params else 300
         height = params.get('height', 300) if params else 300
         
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         resized = cv2.resize(img, (width, height))
-        cv2.imwrite(output_path, resized)
+        ProcessingService._imwrite(output_path, resized)
         return True
     
     @staticmethod
@@ -509,13 +611,13 @@ class ProcessingService:
         """Rotation"""
         angle = params.get('angle', 90) if params else 90
         
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         height, width = img.shape[:2]
         center = (width // 2, height // 2)
         
         rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
         rotated = cv2.warpAffine(img, rotation_matrix, (width, height))
-        cv2.imwrite(output_path, rotated)
+        ProcessingService._imwrite(output_path, rotated)
         return True
     
     @staticmethod
@@ -523,7 +625,7 @@ class ProcessingService:
         """Retournement"""
         direction = params.get('direction', 'horizontal') if params else 'horizontal'
         
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         if direction == 'horizontal':
             flipped = cv2.flip(img, 1)
         elif direction == 'vertical':
@@ -531,34 +633,34 @@ class ProcessingService:
         else:  # both
             flipped = cv2.flip(img, -1)
         
-        cv2.imwrite(output_path, flipped)
+        ProcessingService._imwrite(output_path, flipped)
         return True
     
     @staticmethod
     def _normalize(input_path, output_path):
         """Normalisation des pixels [0,1] -> [0,255]"""
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         normalized = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX)
-        cv2.imwrite(output_path, normalized)
+        ProcessingService._imwrite(output_path, normalized)
         return True
     
     @staticmethod
     def _histogram_equalization(input_path, output_path):
         """Égalisation d'histogramme"""
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         
         # Convertir en YUV et égaliser le canal Y
         yuv = cv2.cvtColor(img, cv2.COLOR_BGR2YUV)
         yuv[:,:,0] = cv2.equalizeHist(yuv[:,:,0])
         result = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR)
         
-        cv2.imwrite(output_path, result)
+        ProcessingService._imwrite(output_path, result)
         return True
     
     @staticmethod
     def _histogram_stretch(input_path, output_path):
         """Étirement d'histogramme (contrast stretching)"""
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         
         # Étirer chaque canal séparément
         result = np.zeros_like(img)
@@ -578,7 +680,7 @@ class ProcessingService:
             else:
                 result[:,:,i] = channel
         
-        cv2.imwrite(output_path, result)
+        ProcessingService._imwrite(output_path, result)
         return True
     
     @staticmethod
@@ -586,7 +688,7 @@ class ProcessingService:
         """Extraction de canal RGB"""
         channel = params.get('channel', 'red') if params else 'red'
         
-        img = cv2.imread(input_path)
+        img = ProcessingService._imread(input_path)
         b, g, r = cv2.split(img)
         
         if channel == 'red':
@@ -596,5 +698,5 @@ class ProcessingService:
         else:  # blue
             result = cv2.merge([b, np.zeros_like(g), np.zeros_like(r)])
         
-        cv2.imwrite(output_path, result)
+        ProcessingService._imwrite(output_path, result)
         return True
\ No newline at end of file
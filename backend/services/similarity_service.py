@@ -0,0 +1,188 @@
+from itertools import combinations
+import cv2
+import numpy as np
+from services.index_service import IndexService
+from services.storage_service import StorageService
+
+
+class SimilarityService:
+    """Recherche de doublons et de quasi-doublons par empreinte perceptuelle (pHash 64 bits).
+
+    L'empreinte vient de la DCT de l'image réduite à 32x32 en niveaux de gris :
+    les 8x8 basses fréquences comparées à leur médiane. Deux images proches
+    (recompression, redimensionnement, légère retouche) ont des empreintes à
+    faible distance de Hamming.
+
+    Recherche par hachage multi-index : l'empreinte est découpée en quatre blocs
+    de 16 bits indexés dans SQLite. Deux empreintes à distance <= r ont au moins
+    un bloc à distance <= r // 4 (principe des tiroirs) : on ne lit que les
+    contenus dont un bloc vaut une des valeurs voisines, puis on vérifie la
+    distance exacte. Pour r = 6, 17 valeurs par bloc sur 65536.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+    DEFAULT_DISTANCE = 6
+    MAX_DISTANCE = 16  # au-delà, des images sans rapport (distance moyenne : 32)
+    # Côté minimal de l'image décodée en réduction avant le passage à 32x32
+    MIN_REDUCED_SIDE = 64
+    _REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                      (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+
+    @staticmethod
+    def compute(img):
+        """Empreinte 64 bits d'une image décodée (BGR, BGRA ou niveaux de gris)"""
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].ravel()
+        bits = low > np.median(low[1:])  # médiane sans la composante continue
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    @staticmethod
+    def chunks(value):
+        """Blocs de 16 bits, du poids fort au poids faible"""
+        mask = (1 << SimilarityService.CHUNK_BITS) - 1
+        return [value >> (SimilarityService.CHUNK_BITS * i) & mask
+                for i in reversed(range(SimilarityService.CHUNKS))]
+
+    @staticmethod
+    def distance(a, b):
+        return bin(a ^ b).count('1')
+
+    @staticmethod
+    def record(conn, content_hash, value):
+        """Enregistre l'empreinte d'un nouveau contenu (calculée par compute() avant la transaction)"""
+        IndexService.add_perceptual_hash(conn, content_hash, SimilarityService.chunks(value))
+
+    @staticmethod
+    def reduced_flags(metadata):
+        """Décodage réduit d'OpenCV (JPEG : mise à l'échelle dans la DCT) gardant assez de pixels"""
+        side = min(metadata.get('width') or 0, metadata.get('height') or 0)
+        for factor, flags in SimilarityService._REDUCED_FLAGS:
+            if side // factor >= SimilarityService.MIN_REDUCED_SIDE:
+                return flags
+        return cv2.IMREAD_GRAYSCALE
+
+    @staticmethod
+    def similar(filename, distance=DEFAULT_DISTANCE):
+        """Autres uploads à distance <= distance d'une image, du plus proche au plus éloigné
+
+        None si l'image est inconnue ou n'a pas encore d'empreinte.
+        """
+        content_hash = IndexService.get_upload_hash(filename)
+        value = IndexService.get_perceptual_hash(content_hash) if content_hash else None
+        if value is None:
+            return None
+        probes = [SimilarityService._neighbours(chunk, distance // SimilarityService.CHUNKS)
+                  for chunk in SimilarityService.chunks(value)]
+        distances = {}
+        for candidate, other in IndexService.find_perceptual_hashes(probes).items():
+            d = SimilarityService.distance(value, other)
+            if d <= distance:
+                distances[candidate] = d
+        matches = [{'filename': upload['filename'], 'original_filename': upload['original_filename'],
+                    'distance': distances[upload['hash']], 'identical': upload['hash'] == content_hash}
+                   for upload in IndexService.uploads_of(distances) if upload['filename'] != filename]
+        return sorted(matches, key=lambda match: match['distance'])
+
+    @staticmethod
+    def report(distance=DEFAULT_DISTANCE):
+        """Groupes de doublons de toute la galerie, avec l'image à garder dans chacun
+
+        Les contenus à distance <= distance sont reliés de proche en proche
+        (composantes connexes) ; les alias d'un même contenu sont des doublons
+        exacts. Dans chaque groupe, on garde l'image la plus grande (puis la plus
+        ancienne) ; les autres sont proposées à la suppression.
+        """
+        entries = IndexService.all_perceptual_hashes()
+        parent = list(range(len(entries)))
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # Même découpage en blocs qu'en base, tables de hachage en mémoire
+        buckets = [{} for _ in range(SimilarityService.CHUNKS)]
+        for i, (_, value) in enumerate(entries):
+            for column, chunk in enumerate(SimilarityService.chunks(value)):
+                buckets[column].setdefault(chunk, []).append(i)
+        radius = distance // SimilarityService.CHUNKS
+        for i, (_, value) in enumerate(entries):
+            for column, chunk in enumerate(SimilarityService.chunks(value)):
+                for probe in SimilarityService._neighbours(chunk, radius):
+                    for j in buckets[column].get(probe, ()):
+                        if j > i and SimilarityService.distance(value, entries[j][1]) <= distance:
+                            parent[root(j)] = root(i)
+
+        members = {}
+        for i in range(len(entries)):
+            members.setdefault(root(i), []).append(i)
+        uploads = {}
+        for upload in IndexService.list_uploads():
+            uploads.setdefault(upload['hash'], []).append(upload)
+
+        groups = []
+        for indices in members.values():
+            images = [(upload, entries[i][1]) for i in indices for upload in uploads.get(entries[i][0], [])]
+            if len(images) > 1:
+                groups.append(SimilarityService._group(images))
+        groups.sort(key=lambda group: -len(group['duplicates']))
+        return {
+            'distance': distance,
+            'groups': groups,
+            'total_groups': len(groups),
+            'removable': sum(len(group['duplicates']) for group in groups),
+            'reclaimable_bytes': sum(group['reclaimable_bytes'] for group in groups),
+            'unhashed': len(IndexService.uploads_without_perceptual_hash())
+        }
+
+    @staticmethod
+    def backfill():
+        """Calcule l'empreinte des contenus antérieurs à l'index, par décodage réduit"""
+        hashed, failed = 0, 0
+        for upload in IndexService.uploads_without_perceptual_hash():
+            backend, key = StorageService.resolve_upload(upload['filename'])
+            if backend is None:
+                continue
+            try:
+                img = StorageService.read_image(backend, key, SimilarityService.reduced_flags(upload['metadata']))
+            except ValueError:
+                failed += 1
+                continue
+            value = SimilarityService.compute(img)
+            with IndexService.transaction() as conn:
+                SimilarityService.record(conn, upload['hash'], value)
+            hashed += 1
+        return {'hashed': hashed, 'failed': failed}
+
+    @staticmethod
+    def _neighbours(chunk, radius):
+        """Valeurs de 16 bits à distance <= radius d'un bloc"""
+        values = [chunk]
+        for flipped in range(1, radius + 1):
+            for bits in combinations(range(SimilarityService.CHUNK_BITS), flipped):
+                value = chunk
+                for bit in bits:
+                    value ^= 1 << bit
+                values.append(value)
+        return values
+
+    @staticmethod
+    def _group(images):
+        def rank(image):
+            upload = image[0]
+            metadata = upload['metadata']
+            return -(metadata.get('width') or 0) * (metadata.get('height') or 0), upload['upload_time'] or ''
+        images = sorted(images, key=rank)
+        keep, kept_value = images[0]
+        duplicates = [{'filename': upload['filename'], 'original_filename': upload['original_filename'],
+                       'distance': SimilarityService.distance(kept_value, value),
+                       'identical': upload['hash'] == keep['hash']}
+                      for upload, value in images[1:]]
+        # Tous les alias des autres contenus partent : leurs blobs sont libérés
+        freed = {upload['hash'] for upload, _ in images} - {keep['hash']}
+        reclaimable = sum((IndexService.get_blob(content_hash) or {}).get('size_bytes', 0) for content_hash in freed)
+        return {'keep': keep['filename'], 'duplicates': duplicates, 'reclaimable_bytes': reclaimable}
@@ -0,0 +1,185 @@
+import cv2
+import numpy as np
+from services.index_service import IndexService
+from services.storage_service import StorageService
+
+CHANNELS = ('r', 'g', 'b')
+_VALUES = np.arange(256, dtype=np.float64)
+
+
+class StatsService:
+    """Statistiques de pixels de la galerie (moyenne, écart-type, min/max, histogrammes par canal).
+
+    Chaque contenu (blob) est mesuré une fois, à partir de l'image décodée à
+    l'upload ; ses moments (nombre de pixels, moyenne, M2 de Welford) et ses
+    histogrammes sont fusionnés dans des agrégats ('all', 'format:PNG',
+    'mode:RGB') et en sont retirés quand le contenu est supprimé. Lire un
+    agrégat est une seule ligne de l'index ; les autres sous-ensembles
+    fusionnent les statistiques des contenus concernés, sans décodage.
+    Les doublons dédupliqués ne comptent qu'une fois.
+    """
+
+    @staticmethod
+    def compute(img):
+        """Statistiques d'une image BGR 8 bits (canaux rendus dans l'ordre R, G, B)"""
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        pixels = img.shape[0] * img.shape[1]
+        if pixels < 2 ** 24:
+            # calcHist compte en float32 : exact tant qu'aucune case ne dépasse 2^24
+            histogram = np.stack([cv2.calcHist([img], [c], None, [256], [0, 256]).ravel() for c in (2, 1, 0)])
+        else:
+            histogram = np.stack([np.bincount(img[:, :, c].ravel(), minlength=256) for c in (2, 1, 0)])
+        histogram = histogram.astype(np.int64)
+        mean = histogram @ _VALUES / pixels
+        m2 = (histogram * (_VALUES[None, :] - mean[:, None]) ** 2).sum(axis=1)
+        return {'images': 1, 'pixels': pixels, 'mean': mean, 'm2': m2, 'histogram': histogram}
+
+    @staticmethod
+    def merge(total, part, sign=1):
+        """Fusion (sign=1) ou retrait (sign=-1) de deux ensembles de moments (Chan et al.)"""
+        if total is None:
+            return part if sign > 0 else None
+        pixels = total['pixels'] + sign * part['pixels']
+        images = total['images'] + sign * part['images']
+        if pixels <= 0 or images <= 0:
+            return None
+        if sign > 0:
+            delta = part['mean'] - total['mean']
+            mean = total['mean'] + delta * part['pixels'] / pixels
+            m2 = total['m2'] + part['m2'] + delta ** 2 * total['pixels'] * part['pixels'] / pixels
+        else:
+            mean = (total['mean'] * total['pixels'] - part['mean'] * part['pixels']) / pixels
+            delta = part['mean'] - mean
+            m2 = total['m2'] - part['m2'] - delta ** 2 * pixels * part['pixels'] / total['pixels']
+            m2 = np.maximum(m2, 0.0)  # arrondis flottants
+        return {'images': images, 'pixels': pixels, 'mean': mean, 'm2': m2,
+                'histogram': total['histogram'] + sign * part['histogram']}
+
+    @staticmethod
+    def groups(metadata):
+        """Agrégats maintenus pour un contenu (lecture directe)"""
+        keys = ['all']
+        if metadata.get('format'):
+            keys.append(f"format:{metadata['format']}")
+        if metadata.get('mode'):
+            keys.append(f"mode:{metadata['mode']}")
+        return keys
+
+    @staticmethod
+    def record(conn, content_hash, stats, metadata):
+        """Ajoute un nouveau contenu aux agrégats (dans la transaction de l'upload)
+
+        stats vient de compute(), appelé avant la transaction : le verrou
+        d'écriture de l'index n'est tenu que pour l'insertion et la fusion.
+        """
+        groups = StatsService.groups(metadata)
+        if not IndexService.add_blob_stats(conn, content_hash, metadata.get('format'), metadata.get('mode'),
+                                           groups, StatsService._to_row(stats)):
+            return  # déjà compté
+        for key in groups:
+            StatsService._update(conn, key, stats, 1)
+
+    @staticmethod
+    def forget(conn, content_hash):
+        """Retire un contenu supprimé des agrégats"""
+        row = IndexService.pop_blob_stats(conn, content_hash)
+        if row is None:
+            return
+        stats = StatsService._from_row(dict(row, images=1))
+        for key in row['groups']:
+            StatsService._update(conn, key, stats, -1)
+
+    @staticmethod
+    def summary(filenames=None, image_format=None, mode=None, since=None, until=None, histogram=True):
+        """Statistiques d'un sous-ensemble (None si vide), lues dans un agrégat quand il existe"""
+        if filenames is None and not since and not until and not (image_format and mode):
+            key = f"format:{image_format}" if image_format else f"mode:{mode}" if mode else 'all'
+            row = IndexService.get_stats_aggregate(key)
+            stats, source = (StatsService._from_row(row) if row else None), 'aggregate'
+        else:
+            stats, source = None, 'images'
+            for row in IndexService.find_blob_stats(filenames, image_format, mode, since, until):
+                stats = StatsService.merge(stats, StatsService._from_row(dict(row, images=1)))
+        if stats is None:
+            return None
+        return StatsService._describe(stats, source, histogram)
+
+    @staticmethod
+    def rebuild(decode_missing=True):
+        """Recalcule les agrégats depuis les statistiques par contenu (et mesure les contenus absents)
+
+        Sert à reprendre une galerie antérieure à ces statistiques, ou à
+        remettre à zéro les arrondis accumulés par les retraits successifs.
+        """
+        measured = 0
+        if decode_missing:
+            known = IndexService.blob_stats_hashes()
+            for upload in IndexService.list_uploads():
+                if upload['hash'] in known:
+                    continue
+                known.add(upload['hash'])
+                backend, key = StorageService.resolve_upload(upload['filename'])
+                if backend is None:
+                    continue
+                try:
+                    img = StorageService.read_image(backend, key)
+                except ValueError:
+                    continue
+                stats = StatsService.compute(img)
+                metadata = upload['metadata']
+                with IndexService.transaction() as conn:
+                    IndexService.add_blob_stats(conn, upload['hash'], metadata.get('format'), metadata.get('mode'),
+                                                StatsService.groups(metadata), StatsService._to_row(stats))
+                measured += 1
+
+        with IndexService.transaction() as conn:
+            totals = {}
+            for row in IndexService.all_blob_stats(conn):
+                stats = StatsService._from_row(dict(row, images=1))
+                for key in row['groups']:
+                    totals[key] = StatsService.merge(totals.get(key), stats)
+            IndexService.clear_stats_aggregates(conn)
+            for key, stats in totals.items():
+                IndexService.put_stats_aggregate(conn, key, StatsService._to_row(stats))
+        return {'measured': measured, 'aggregates': len(totals)}
+
+    @staticmethod
+    def _update(conn, key, stats, sign):
+        row = IndexService.get_stats_aggregate(key, conn)
+        total = StatsService.merge(StatsService._from_row(row) if row else None, stats, sign)
+        IndexService.put_stats_aggregate(conn, key, StatsService._to_row(total) if total else {'images': 0})
+
+    @staticmethod
+    def _describe(stats, source, histogram):
+        std = np.sqrt(stats['m2'] / stats['pixels'])
+        # Min/max déduits de l'histogramme : restent exacts après les suppressions
+        present = stats['histogram'] > 0
+        minimum = present.argmax(axis=1)
+        maximum = 255 - present[:, ::-1].argmax(axis=1)
+        result = {
+            'images': stats['images'],
+            'pixels': stats['pixels'],
+            'channels': list(CHANNELS),
+            'mean': [round(float(v), 4) for v in stats['mean']],
+            'std': [round(float(v), 4) for v in std],
+            'min': [int(v) for v in minimum],
+            'max': [int(v) for v in maximum],
+            'source': source
+        }
+        if histogram:
+            result['histogram'] = {name: stats['histogram'][i].tolist() for i, name in enumerate(CHANNELS)}
+        return result
+
+    @staticmethod
+    def _to_row(stats):
+        return {'images': stats['images'], 'pixels': stats['pixels'],
+                'mean': stats['mean'].astype(np.float64).tobytes(), 'm2': stats['m2'].astype(np.float64).tobytes(),
+                'histogram': stats['histogram'].astype(np.int64).tobytes()}
+
+    @staticmethod
+    def _from_row(row):
+        return {'images': row['images'], 'pixels': row['pixels'],
+                'mean': np.frombuffer(row['mean'], dtype=np.float64).copy(),
+                'm2': np.frombuffer(row['m2'], dtype=np.float64).copy(),
+                'histogram': np.frombuffer(row['histogram'], dtype=np.int64).reshape(len(CHANNELS), 256).copy()}
@@ -0,0 +1,137 @@
+import os
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+from config.settings import Config
+from services.index_service import IndexService
+from storage.local_storage import LocalStorage
+from storage.memory_storage import MemoryStorage
+from utils import metrics
+
+# Grands scans (uploads par morceaux, tuiles) : même limite que le décodage OpenCV
+Image.MAX_IMAGE_PIXELS = Config.MAX_IMAGE_PIXELS
+
+
+class StorageService:
+    """Point d'accès unique aux fichiers (uploads, blobs, images traitées).
+
+    Le backend est choisi par ``Config.STORAGE_BACKEND`` : 'local' (disque
+    shardé, éventuellement partagé entre plusieurs nœuds), 'memory' (tests)
+    ou 's3'. Les services et les routes ne manipulent jamais de chemin
+    construit à partir de ``UPLOAD_FOLDER`` / ``PROCESSED_FOLDER``.
+    """
+
+    NAMESPACES = ('uploads', 'blobs', 'processed')
+
+    _backends = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(namespace):
+        key = (Config.STORAGE_BACKEND, namespace, StorageService._local_root(namespace))
+        with StorageService._lock:
+            backend = StorageService._backends.get(key)
+            if backend is None:
+                backend = StorageService._create(namespace)
+                backend.namespace = namespace
+                StorageService._backends[key] = backend
+            return backend
+
+    @staticmethod
+    def blobs():
+        return StorageService.get('blobs')
+
+    @staticmethod
+    def processed():
+        return StorageService.get('processed')
+
+    @staticmethod
+    def legacy_uploads():
+        """Uploads antérieurs au stockage dédupliqué, rangés sous leur nom visible"""
+        return StorageService.get('uploads')
+
+    @staticmethod
+    def blob_key(content_hash, ext):
+        return f"{content_hash}{ext}"
+
+    @staticmethod
+    def resolve_upload(filename):
+        """Nom visible -> (backend, clé), ou (None, None) si l'image n'existe pas.
+
+        L'alias est une ligne de l'index : plusieurs noms peuvent désigner le
+        même blob, quel que soit le backend.
+        """
+        try:
+            upload = IndexService.get_upload(filename)
+            if upload is not None:
+                blob = IndexService.get_blob(upload['hash'])
+                if blob is not None:
+                    return StorageService.blobs(), StorageService.blob_key(blob['hash'], blob['ext'])
+            legacy = StorageService.legacy_uploads()
+            if legacy.exists(filename):
+                return legacy, filename
+        except ValueError:
+            pass
+        return None, None
+
+    @staticmethod
+    def resolve_processed(filename):
+        try:
+            backend = StorageService.processed()
+            if backend.exists(filename):
+                return backend, filename
+        except ValueError:
+            pass
+        return None, None
+
+    @staticmethod
+    def read_image(backend, key, flags=cv2.IMREAD_COLOR):
+        """Décode une image stockée (lecture directe du fichier quand il est local)"""
+        path = backend.local_path(key)
+        with metrics.phase('decode'):
+            if path is not None:
+                img = cv2.imread(path, flags)
+                size_bytes = os.path.getsize(path)
+            else:
+                data = np.frombuffer(backend.read(key), dtype=np.uint8)
+                img = cv2.imdecode(data, flags)
+                size_bytes = data.size
+            if img is None:
+                with backend.open(key) as f:
+                    img = StorageService.decode_with_pil(f, flags)
+        if img is None:
+            raise ValueError("Failed to read image")
+        metrics.decoded(img, size_bytes, backend.namespace)
+        return img
+
+    @staticmethod
+    def decode_with_pil(fp, flags=cv2.IMREAD_COLOR):
+        """Première trame d'un format qu'OpenCV ne décode pas (GIF selon la compilation), ou None"""
+        try:
+            with Image.open(fp) as pil_img:
+                if flags == cv2.IMREAD_GRAYSCALE:
+                    return np.asarray(pil_img.convert('L')).copy()
+                return cv2.cvtColor(np.asarray(pil_img.convert('RGB')), cv2.COLOR_RGB2BGR)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _local_root(namespace):
+        return {
+            'uploads': Config.UPLOAD_FOLDER,
+            'blobs': Config.BLOB_FOLDER,
+            'processed': Config.PROCESSED_FOLDER
+        }[namespace]
+
+    @staticmethod
+    def _create(namespace):
+        if Config.STORAGE_BACKEND == 'local':
+            return LocalStorage(StorageService._local_root(namespace))
+        if Config.STORAGE_BACKEND == 'memory':
+            return MemoryStorage()
+        if Config.STORAGE_BACKEND == 's3':
+            from storage.s3_storage import S3Storage
+            return S3Storage(Config.S3_BUCKET, f"{Config.S3_PREFIX}{namespace}",
+                             endpoint_url=Config.S3_ENDPOINT_URL, region=Config.S3_REGION)
+        raise ValueError(f"Backend de stockage inconnu: {Config.STORAGE_BACKEND}")
@@ -0,0 +1,266 @@
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+import cv2
+import numpy as np
+from PIL import Image
+from config.settings import Config
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from utils import metrics
+
+
+class TileService:
+    """Pyramide multi-résolution (style DZI) générée à la demande.
+
+    Le niveau ``max_level`` correspond à la pleine résolution, chaque niveau
+    inférieur est obtenu par ``cv2.pyrDown`` du niveau supérieur, jusqu'au
+    niveau 0 (1x1 pixel). Les rasters de niveau sont mis en cache en ``.npy``
+    (lus ensuite en memmap) et seules les tuiles demandées sont encodées.
+
+    Le cache d'une image est supprimé avec elle (``purge``) ; au-delà de
+    ``TILE_CACHE_QUOTA_BYTES``, le ramasse-miettes supprime les caches les
+    moins récemment consultés (``collect``).
+    """
+
+    ACCESS_MARKER = '.access'
+
+    _locks = {}
+    _locks_guard = threading.Lock()
+
+    @staticmethod
+    def needs_tiling(width, height):
+        return width * height > Config.TILE_THRESHOLD_PIXELS
+
+    @staticmethod
+    def get_descriptor(backend, key, filename):
+        """Décrit la pyramide d'une image (dimensions, niveaux, grille de tuiles)"""
+        width, height = TileService._read_size(backend, key)
+        max_level = TileService._max_level(width, height)
+        tile_size = Config.TILE_SIZE
+
+        levels = []
+        for level in range(max_level + 1):
+            level_width, level_height = TileService._level_size(width, height, max_level, level)
+            levels.append({
+                'level': level,
+                'width': level_width,
+                'height': level_height,
+                'columns': math.ceil(level_width / tile_size),
+                'rows': math.ceil(level_height / tile_size)
+            })
+
+        return {
+            'filename': filename,
+            'width': width,
+            'height': height,
+            'tiled': TileService.needs_tiling(width, height),
+            'tile_size': tile_size,
+            'overlap': 0,
+            'format': Config.TILE_FORMAT,
+            'max_level': max_level,
+            'levels': levels
+        }
+
+    @staticmethod
+    def get_tile(backend, key, level, x, y):
+        """Retourne (chemin de la tuile, erreur), en la générant si besoin"""
+        width, height = TileService._read_size(backend, key)
+        if not TileService.needs_tiling(width, height):
+            return None, "Image trop petite pour le tuilage"
+
+        max_level = TileService._max_level(width, height)
+        if level < 0 or level > max_level:
+            return None, f"Niveau invalide (0-{max_level})"
+
+        level_width, level_height = TileService._level_size(width, height, max_level, level)
+        tile_size = Config.TILE_SIZE
+        if x < 0 or y < 0 or x * tile_size >= level_width or y * tile_size >= level_height:
+            return None, "Tuile hors limites"
+
+        cache_dir = TileService._cache_dir(backend, key)
+        tile_path = os.path.join(cache_dir, str(level), f"{x}_{y}.{Config.TILE_FORMAT}")
+        TileService._touch(cache_dir)
+        if os.path.exists(tile_path):
+            metrics.cache_hit('tiles', True)
+            return tile_path, None
+        metrics.cache_hit('tiles', False)
+
+        with metrics.operation('tile'):
+            with metrics.phase('decode'):
+                raster = TileService._level_raster(backend, key, cache_dir, max_level, level)
+                tile = raster[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size]
+
+            params = []
+            if Config.TILE_FORMAT in ('jpg', 'jpeg'):
+                params = [cv2.IMWRITE_JPEG_QUALITY, Config.TILE_JPEG_QUALITY]
+            with metrics.phase('encode'):
+                ok, buffer = cv2.imencode(f".{Config.TILE_FORMAT}", np.ascontiguousarray(tile), params)
+            if not ok:
+                return None, "Erreur lors de l'encodage de la tuile"
+
+            with metrics.phase('write'):
+                os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+                TileService._atomic_write(tile_path, buffer.tobytes())
+            metrics.encoded(len(buffer), 'tiles')
+        return tile_path, None
+
+    @staticmethod
+    def _level_raster(backend, key, cache_dir, max_level, level):
+        """Raster d'un niveau, lu en memmap depuis le cache ou construit par pyrDown"""
+        raster_path = os.path.join(cache_dir, f"level_{level}.npy")
+        if os.path.exists(raster_path):
+            return np.load(raster_path, mmap_mode='r')
+
+        with TileService._lock_for(raster_path):
+            if os.path.exists(raster_path):
+                return np.load(raster_path, mmap_mode='r')
+
+            if level == max_level:
+                raster = StorageService.read_image(backend, key, cv2.IMREAD_COLOR)
+            else:
+                upper = TileService._level_raster(backend, key, cache_dir, max_level, level + 1)
+                raster = cv2.pyrDown(np.asarray(upper))
+
+            os.makedirs(cache_dir, exist_ok=True)
+            if level == max_level:
+                TileService._purge_stale(cache_dir)
+            tmp_path = f"{raster_path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, raster)
+            os.replace(tmp_path, raster_path)
+        # Raster écrit : les requêtes suivantes le lisent sans verrou
+        with TileService._locks_guard:
+            TileService._locks.pop(raster_path, None)
+
+        return np.load(raster_path, mmap_mode='r')
+
+    @staticmethod
+    def purge(backend, key):
+        """Supprime le cache de tuiles d'une image (toutes versions)"""
+        if backend.namespace == 'blobs':
+            shutil.rmtree(os.path.join(Config.TILE_CACHE_FOLDER, 'blobs', key), ignore_errors=True)
+            return
+        folder = os.path.join(Config.TILE_CACHE_FOLDER, backend.namespace)
+        if not os.path.isdir(folder):
+            return
+        for entry in os.scandir(folder):
+            if entry.name.rsplit('_', 1)[0] == key:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    @staticmethod
+    def collect(quota_bytes=None):
+        """Supprime les caches d'images les moins récemment consultés au-delà du quota.
+
+        Comme pour les images traitées, on descend jusqu'à ``GC_LOW_WATERMARK``
+        du quota. Retourne (caches, octets) supprimés.
+        """
+        quota = Config.TILE_CACHE_QUOTA_BYTES if quota_bytes is None else quota_bytes
+        entries = []
+        if os.path.isdir(Config.TILE_CACHE_FOLDER):
+            for namespace in os.scandir(Config.TILE_CACHE_FOLDER):
+                if namespace.is_dir():
+                    entries += [TileService._usage(entry.path) for entry in os.scandir(namespace.path)
+                                if entry.is_dir()]
+        total = sum(size for _, size, _ in entries)
+        if total <= quota:
+            return 0, 0
+        target = quota * Config.GC_LOW_WATERMARK
+        removed = freed = 0
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= target:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            freed += size
+            removed += 1
+        return removed, freed
+
+    @staticmethod
+    def _read_size(backend, key):
+        # Blobs : dimensions déjà relevées à l'upload, aucun accès au stockage
+        if backend.namespace == 'blobs':
+            upload = IndexService.find_upload_by_hash(os.path.splitext(key)[0])
+            metadata = upload['metadata'] if upload else {}
+            if metadata.get('width') and metadata.get('height'):
+                return metadata['width'], metadata['height']
+        # Sinon l'en-tête seulement, sans décoder les pixels (limite Config.MAX_IMAGE_PIXELS)
+        with backend.open(key) as f, Image.open(f) as img:
+            return img.width, img.height
+
+    @staticmethod
+    def _max_level(width, height):
+        return max(0, math.ceil(math.log2(max(width, height))))
+
+    @staticmethod
+    def _level_size(width, height, max_level, level):
+        scale = 2 ** (max_level - level)
+        return max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale))
+
+    @staticmethod
+    def _cache_dir(backend, key):
+        # Blobs : la clé est le hash du contenu, cache partagé entre doublons
+        if backend.namespace == 'blobs':
+            return os.path.join(Config.TILE_CACHE_FOLDER, 'blobs', key)
+
+        # mtime + taille dans le nom : un fichier remplacé invalide son cache
+        stamp = f"{int(backend.mtime(key) * 1e6):x}{backend.size(key):x}"
+        return os.path.join(Config.TILE_CACHE_FOLDER, backend.namespace, f"{key}_{stamp}")
+
+    @staticmethod
+    def _touch(cache_dir):
+        """Date de dernière consultation du cache, au plus une écriture par ACCESS_TOUCH_INTERVAL"""
+        marker = os.path.join(cache_dir, TileService.ACCESS_MARKER)
+        try:
+            if time.time() - os.stat(marker).st_mtime < Config.ACCESS_TOUCH_INTERVAL:
+                return
+        except OSError:
+            pass
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(marker, 'a'):
+                os.utime(marker)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _usage(path):
+        """(dossier, octets, dernière consultation) d'un cache d'image"""
+        size = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    size += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass  # supprimé entre-temps (tmp renommé)
+        try:
+            last = os.stat(os.path.join(path, TileService.ACCESS_MARKER)).st_mtime
+        except OSError:
+            last = os.stat(path).st_mtime if os.path.exists(path) else 0
+        return path, size, last
+
+    @staticmethod
+    def _purge_stale(cache_dir):
+        # Fichier remplacé (autre mtime/taille) : les caches des versions précédentes sont obsolètes
+        folder, name = os.path.split(cache_dir)
+        if os.path.basename(folder) == 'blobs':
+            return
+        key = name.rsplit('_', 1)[0]
+        for entry in os.scandir(folder):
+            if entry.path != cache_dir and entry.name.rsplit('_', 1)[0] == key:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    @staticmethod
+    def _lock_for(key):
+        with TileService._locks_guard:
+            return TileService._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _atomic_write(path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
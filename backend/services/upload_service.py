@@ -1,34 +1,88 @@
+import hashlib
 import os
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import cv2
 from PIL import Image
 from werkzeug.utils import secure_filename
 from config.settings import Config
 from services.validation_service import ValidationService
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from services.stats_service import StatsService
+from services.similarity_service import SimilarityService
+from utils.lifecycle import on_shutdown
+from utils import metrics
 
 class UploadService:
+    _executor = None
+    _executor_lock = threading.Lock()
+
     @staticmethod
     def upload_files(files):
-        """Upload multiple files avec validation"""
+        """Upload multiple files avec validation (en parallèle, ordre conservé)"""
         if len(files) > Config.MAX_FILES_PER_UPLOAD:
             return False, f"Trop de fichiers (max {Config.MAX_FILES_PER_UPLOAD})"
         
-        results = []
-        for file in files:
-            if file and file.filename:
-                is_valid, errors = ValidationService.validate_file(file)
-                
-                if is_valid:
-                    result = UploadService._save_file(file)
-                    results.append(result)
-                else:
-                    results.append({
-                        'filename': file.filename,
-                        'success': False,
-                        'errors': errors
-                    })
+        files = [file for file in files if file and file.filename]
+        metrics.queue_depth.labels('upload').inc(len(files))
+        if len(files) <= 1:
+            return True, [UploadService._ingest_file(file) for file in files]
+        
+        # map() rend les résultats dans l'ordre des fichiers envoyés
+        return True, list(UploadService._get_executor().map(UploadService._ingest_file, files))
+    
+    @staticmethod
+    def _ingest_file(file):
+        """Valide puis sauvegarde un fichier, avec le temps passé dans chaque étape"""
+        metrics.queue_depth.labels('upload').dec()
+        metrics.jobs_in_flight.labels('upload').inc()
+        try:
+            return UploadService._timed_ingest(file)
+        finally:
+            metrics.jobs_in_flight.labels('upload').dec()
+    
+    @staticmethod
+    def _timed_ingest(file):
+        start = time.perf_counter()
+        is_valid, errors = ValidationService.validate_file(file)
+        validated = time.perf_counter()
+        
+        if is_valid:
+            result = UploadService._save_file(file)
+        else:
+            result = {
+                'filename': file.filename,
+                'success': False,
+                'errors': errors
+            }
         
-        return True, results
+        timings = result.pop('_timings', {})
+        timings['validate_ms'] = round((validated - start) * 1000, 2)
+        timings['total_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        result['timings'] = timings
+        return result
+    
+    @staticmethod
+    def _get_executor():
+        # Pool partagé entre les requêtes : borne le nombre total d'ingestions simultanées
+        with UploadService._executor_lock:
+            if UploadService._executor is None:
+                UploadService._executor = ThreadPoolExecutor(
+                    max_workers=Config.UPLOAD_WORKERS, thread_name_prefix='upload')
+                on_shutdown(UploadService._shutdown_executor)
+            return UploadService._executor
+    
+    @staticmethod
+    def _shutdown_executor():
+        """Attend la fin des ingestions en cours (arrêt du worker)"""
+        with UploadService._executor_lock:
+            executor, UploadService._executor = UploadService._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
     
     @staticmethod
     def _save_file(file):
@@ -36,22 +90,19 @@ class UploadService:
         try:
             # Générer nom unique
             original_filename = secure_filename(file.filename)
-            name, ext = os.path.splitext(original_filename)
-            unique_filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
-            
-            filepath = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
-            file.save(filepath)
+            unique_filename = UploadService._unique_filename(original_filename)
             
-            # Extraire métadonnées
-            metadata = UploadService._extract_metadata(filepath)
+            # Écriture en flux avec calcul du hash du contenu
+            start = time.perf_counter()
+            tmp_path, content_hash = UploadService._write_temp(file.stream)
+            written = time.perf_counter()
             
-            return {
-                'filename': unique_filename,
-                'original_filename': original_filename,
-                'success': True,
-                'metadata': metadata,
-                'upload_time': datetime.now().isoformat()
+            result = UploadService._store_upload(tmp_path, content_hash, unique_filename, original_filename)
+            result['_timings'] = {
+                'write_ms': round((written - start) * 1000, 2),
+                'index_ms': round((time.perf_counter() - written) * 1000, 2)
             }
+            return result
         except Exception as e:
             return {
                 'filename': file.filename,
@@ -59,17 +110,118 @@ class UploadService:
                 'errors': [str(e)]
             }
     
+    @staticmethod
+    def _store_upload(tmp_path, content_hash, unique_filename, original_filename, metadata=None, image=None):
+        """Range un fichier reçu dans le stockage dédupliqué.
+
+        Le contenu est stocké une seule fois sous son hash (backend 'blobs') et
+        le nom visible n'est qu'une ligne de l'index pointant vers ce blob. Si le
+        contenu existe déjà, le fichier reçu est simplement jeté. Un nouveau
+        contenu est décodé une fois (sauf image déjà décodée fournie) pour les
+        statistiques de la galerie et son empreinte perceptuelle.
+        """
+        ext = os.path.splitext(unique_filename)[1].lower()
+        upload_time = datetime.now().isoformat()
+        if metadata is None:
+            metadata = UploadService._extract_metadata(tmp_path)
+
+        # Écriture du blob hors transaction : un envoi vers S3 ne bloque pas l'index
+        blobs = StorageService.blobs()
+        blob = IndexService.get_blob(content_hash)
+        if blob is not None:
+            ext = blob['ext']
+        blob_key = StorageService.blob_key(content_hash, ext)
+        deduplicated = blob is not None and blobs.exists(blob_key)
+        size_bytes = os.path.getsize(tmp_path)
+        metrics.cache_hit('blobs', deduplicated)
+        if deduplicated:
+            os.remove(tmp_path)
+        else:
+            if image is None:
+                image = UploadService._decode(tmp_path)
+            blobs.save_file(blob_key, tmp_path, move=True)
+            metrics.encoded(size_bytes, 'blobs')
+        # Calculs hors transaction : le verrou d'écriture de l'index est commun à tous les workers
+        stats = perceptual_hash = None
+        if not deduplicated and image is not None:
+            stats = StatsService.compute(image)
+            perceptual_hash = SimilarityService.compute(image)
+
+        with IndexService.transaction() as conn:
+            # Le dernier alias a pu être supprimé (avec son blob) entre-temps
+            if not blobs.exists(blob_key):
+                raise RuntimeError("Upload concurrent d'une suppression, veuillez réessayer")
+            IndexService.add_blob(conn, content_hash, ext, size_bytes)
+            IndexService.add_upload(conn, unique_filename, content_hash, original_filename,
+                                    metadata, upload_time)
+            if stats is not None:
+                StatsService.record(conn, content_hash, stats, metadata)
+                SimilarityService.record(conn, content_hash, perceptual_hash)
+
+        return {
+            'filename': unique_filename,
+            'original_filename': original_filename,
+            'success': True,
+            'metadata': metadata,
+            'content_hash': content_hash,
+            'deduplicated': deduplicated,
+            'upload_time': upload_time
+        }
+    
+    @staticmethod
+    def _write_temp(stream):
+        """Écrit un flux dans un fichier temporaire, retourne (chemin, sha256)"""
+        tmp_folder = os.path.join(Config.BLOB_FOLDER, 'tmp')
+        os.makedirs(tmp_folder, exist_ok=True)
+        tmp_path = os.path.join(tmp_folder, uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        stream.seek(0)
+        with open(tmp_path, 'wb') as f:
+            for block in iter(lambda: stream.read(1024 * 1024), b''):
+                hasher.update(block)
+                f.write(block)
+        return tmp_path, hasher.hexdigest()
+    
+    @staticmethod
+    def _decode(path):
+        """Pixels d'un nouveau contenu (None si illisible : ni statistiques ni empreinte)"""
+        with metrics.phase('decode'):
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is None:
+                img = StorageService.decode_with_pil(path)
+        return img
+
+    @staticmethod
+    def _unique_filename(original_filename):
+        name, ext = os.path.splitext(original_filename)
+        return f"{name}_{uuid.uuid4().hex[:8]}{ext}"
+
     @staticmethod
     def _extract_metadata(filepath):
         """Extraire métadonnées de l'image"""
         try:
             with Image.open(filepath) as img:
-                return {
-                    'width': img.width,
-                    'height': img.height,
-                    'format': img.format,
-                    'mode': img.mode,
-                    'size_bytes': os.path.getsize(filepath)
-                }
+                return UploadService._metadata_from_image(img, os.path.getsize(filepath))
+        except Exception:
+            return {}
+
+    @staticmethod
+    def _extract_stored_metadata(backend, key):
+        """Métadonnées d'une image lue depuis le stockage (en-tête seulement)"""
+        try:
+            with backend.open(key) as f, Image.open(f) as img:
+                return UploadService._metadata_from_image(img, backend.size(key))
         except Exception:
-            return {}
\ No newline at end of file
+            return {}
+
+    @staticmethod
+    def _metadata_from_image(img, size_bytes):
+        """Métadonnées à partir d'une image PIL déjà ouverte"""
+        return {
+            'width': img.width,
+            'height': img.height,
+            'format': img.format,
+            'mode': img.mode,
+            'frames': getattr(img, 'n_frames', 1),  # GIF animés, TIFF multipages
+            'size_bytes': size_bytes
+        }
\ No newline at end of file
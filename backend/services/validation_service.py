@@ -3,6 +3,17 @@ from PIL import Image
 from config.settings import Config
 
 class ValidationService:
+    # Signatures des formats supportés (premiers octets du fichier)
+    MAGIC_NUMBERS = (
+        (b'\x89PNG\r\n\x1a\n', 'png'),
+        (b'\xff\xd8\xff', 'jpeg'),
+        (b'GIF87a', 'gif'),
+        (b'GIF89a', 'gif'),
+        (b'BM', 'bmp'),
+        (b'II*\x00', 'tiff'),
+        (b'MM\x00*', 'tiff'),
+    )
+
     @staticmethod
     def validate_file(file):
         """Valide un fichier uploadé"""
@@ -40,4 +51,29 @@ class ValidationService:
             file.seek(0)
             return True
         except Exception:
-            return False
\ No newline at end of file
+            return False
+
+    @staticmethod
+    def validate_header(filename, size, head):
+        """Valide un upload par morceaux à partir de sa taille annoncée et de ses premiers octets"""
+        errors = []
+
+        if not ValidationService._is_allowed_extension(filename):
+            errors.append("Format de fichier non supporté")
+
+        if size > Config.MAX_CHUNKED_FILE_SIZE:
+            errors.append(f"Fichier trop volumineux (max {Config.MAX_CHUNKED_FILE_SIZE // (1024*1024)}MB)")
+
+        if head is not None and ValidationService._sniff_format(head) is None:
+            errors.append("Le fichier n'est pas une image valide")
+
+        return len(errors) == 0, errors
+
+    @staticmethod
+    def _sniff_format(head):
+        for magic, image_format in ValidationService.MAGIC_NUMBERS:
+            if head.startswith(magic):
+                return image_format
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'webp'
+        return None
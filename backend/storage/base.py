@@ -0,0 +1,121 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+
+def shard_prefix(key):
+    """Deux niveaux de répertoires dérivés du hash de la clé (ex: 'a3/f0')"""
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}"
+
+
+def check_key(key):
+    # Une clé est un simple nom de fichier : pas de séparateur ni de remontée
+    if not key or key in ('.', '..') or '/' in key or '\\' in key or '\x00' in key:
+        raise ValueError(f"Clé de stockage invalide: {key!r}")
+    return key
+
+
+class StorageBackend:
+    """Interface commune des backends de stockage.
+
+    Un backend représente un espace de noms (uploads, blobs, processed...) où
+    chaque objet est identifié par une clé plate (le nom de fichier). Les
+    sous-classes implémentent les primitives ; ``fetch`` et ``staging``
+    fournissent un chemin local aux traitements qui ne savent lire ou écrire
+    que des fichiers (cv2.imread / cv2.imwrite).
+    """
+
+    name = 'base'
+    namespace = None
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def size(self, key):
+        raise NotImplementedError
+
+    def mtime(self, key):
+        raise NotImplementedError
+
+    def stat(self, key):
+        """(taille, date de modification) en un seul accès si le backend le permet"""
+        return self.size(key), self.mtime(key)
+
+    def open(self, key):
+        """Ouvre l'objet en lecture binaire (objet fichier)"""
+        raise NotImplementedError
+
+    def save_file(self, key, path, move=False):
+        """Stocke un fichier local sous ``key``"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Supprime l'objet, retourne True s'il existait"""
+        raise NotImplementedError
+
+    def iter_keys(self):
+        """Parcourt toutes les clés (coûteux : réservé à la maintenance)"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Chemin sur le disque local si le backend en a un, sinon None"""
+        return None
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def write(self, key, data):
+        with self.staging(key) as path:
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def save_stream(self, key, stream, block_size=1024 * 1024):
+        with self.staging(key) as path:
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(stream, f, block_size)
+
+    def copy(self, src_key, dst_key):
+        with self.fetch(src_key) as path:
+            self.save_file(dst_key, path)
+
+    @contextmanager
+    def fetch(self, key):
+        """Chemin local lisible pour ``key`` (copie temporaire si nécessaire)"""
+        path = self.local_path(key)
+        if path is not None:
+            yield path
+            return
+
+        tmp_path = self._temp_path(key)
+        try:
+            with self.open(key) as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            yield tmp_path
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @contextmanager
+    def staging(self, key):
+        """Chemin local où écrire ``key`` ; publié à la sortie du bloc s'il a été créé.
+
+        Le fichier temporaire garde l'extension de la clé, car cv2.imwrite
+        choisit l'encodeur d'après l'extension.
+        """
+        tmp_path = self._temp_path(key)
+        try:
+            yield tmp_path
+            if os.path.exists(tmp_path):
+                self.save_file(key, tmp_path, move=True)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _temp_path(self, key):
+        check_key(key)
+        return os.path.join(tempfile.gettempdir(), f"{uuid.uuid4().hex}_{key}")
@@ -0,0 +1,125 @@
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from storage.base import StorageBackend, check_key, shard_prefix
+
+
+class LocalStorage(StorageBackend):
+    """Système de fichiers local (ou partagé, type NFS) avec répertoires shardés.
+
+    ``cat.png`` est rangé sous ``<root>/a3/f0/cat.png`` : aucun répertoire ne
+    dépasse quelques milliers d'entrées. Les fichiers de l'ancienne
+    disposition à plat (``<root>/cat.png``) restent lisibles.
+    """
+
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, shard_prefix(check_key(key)), key)
+
+    def local_path(self, key):
+        path = self._path(key)
+        if os.path.isfile(path):
+            return path
+        legacy_path = os.path.join(self.root, key)
+        if os.path.isfile(legacy_path):
+            return legacy_path
+        return None
+
+    def exists(self, key):
+        return self.local_path(key) is not None
+
+    def size(self, key):
+        return os.path.getsize(self._require(key))
+
+    def mtime(self, key):
+        return os.path.getmtime(self._require(key))
+
+    def stat(self, key):
+        st = os.stat(self._require(key))
+        return st.st_size, st.st_mtime
+
+    def open(self, key):
+        return open(self._require(key), 'rb')
+
+    def save_file(self, key, path, move=False):
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp_dest = f"{dest}.{uuid.uuid4().hex[:8]}.tmp"
+        if move:
+            shutil.move(path, tmp_dest)
+        else:
+            shutil.copyfile(path, tmp_dest)
+        os.replace(tmp_dest, dest)
+        self._remove_legacy(key)
+
+    def delete(self, key):
+        path = self.local_path(key)
+        if path is None:
+            return False
+        os.remove(path)
+        return True
+
+    def copy(self, src_key, dst_key):
+        # Lien physique quand c'est possible : le contenu n'est pas dupliqué
+        dest = self._path(dst_key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp_dest = f"{dest}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.link(self._require(src_key), tmp_dest)
+        except OSError:
+            shutil.copyfile(self._require(src_key), tmp_dest)
+        os.replace(tmp_dest, dest)
+
+    def iter_keys(self):
+        if not os.path.isdir(self.root):
+            return
+        for entry in os.scandir(self.root):
+            if entry.is_file():
+                if self._is_key(entry.name):
+                    yield entry.name
+            elif entry.is_dir() and self._is_shard(entry.name):
+                for shard in os.scandir(entry.path):
+                    if shard.is_dir() and self._is_shard(shard.name):
+                        for item in os.scandir(shard.path):
+                            if item.is_file() and self._is_key(item.name):
+                                yield item.name
+
+    @contextmanager
+    def staging(self, key):
+        # Écriture à côté de la destination puis renommage atomique
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        name, ext = os.path.splitext(dest)
+        tmp_path = f"{name}.{uuid.uuid4().hex[:8]}.tmp{ext}"
+        try:
+            yield tmp_path
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, dest)
+                self._remove_legacy(key)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _require(self, key):
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return path
+
+    def _remove_legacy(self, key):
+        legacy_path = os.path.join(self.root, key)
+        if os.path.isfile(legacy_path):
+            os.remove(legacy_path)
+
+    @staticmethod
+    def _is_shard(name):
+        return len(name) == 2 and all(c in '0123456789abcdef' for c in name)
+
+    @staticmethod
+    def _is_key(name):
+        return not name.startswith('.') and not name.endswith('.tmp') and '.tmp.' not in name
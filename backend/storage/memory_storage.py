@@ -0,0 +1,62 @@
+import io
+import threading
+import time
+from storage.base import StorageBackend, check_key
+
+
+class MemoryStorage(StorageBackend):
+    """Stockage en mémoire, pour les tests et les benchmarks"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def exists(self, key):
+        return check_key(key) in self._objects
+
+    def size(self, key):
+        return len(self._get(key)[0])
+
+    def mtime(self, key):
+        return self._get(key)[1]
+
+    def stat(self, key):
+        data, mtime = self._get(key)
+        return len(data), mtime
+
+    def open(self, key):
+        return io.BytesIO(self._get(key)[0])
+
+    def read(self, key):
+        return self._get(key)[0]
+
+    def write(self, key, data):
+        with self._lock:
+            self._objects[check_key(key)] = (bytes(data), time.time())
+
+    def save_file(self, key, path, move=False):
+        with open(path, 'rb') as f:
+            self.write(key, f.read())
+
+    def delete(self, key):
+        with self._lock:
+            return self._objects.pop(check_key(key), None) is not None
+
+    def copy(self, src_key, dst_key):
+        # Les bytes sont immuables : la copie partage le même objet
+        data = self._get(src_key)[0]
+        with self._lock:
+            self._objects[check_key(dst_key)] = (data, time.time())
+
+    def iter_keys(self):
+        with self._lock:
+            keys = list(self._objects)
+        return iter(keys)
+
+    def _get(self, key):
+        try:
+            return self._objects[check_key(key)]
+        except KeyError:
+            raise FileNotFoundError(key) from None
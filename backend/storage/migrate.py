@@ -0,0 +1,81 @@
+"""Migration des dossiers à plat vers le stockage shardé / dédupliqué.
+
+Usage (depuis backend/) : python -m storage.migrate
+
+- uploads/<nom> : haché, rangé comme blob et enregistré dans l'index
+- uploads/.blobs/<xx>/<hash><ext> (ancienne disposition) : déplacé dans les shards
+- processed/<nom> : déplacé dans les shards du backend 'processed'
+
+Le backend cible est celui de Config.STORAGE_BACKEND : la même commande
+sert à pousser un stockage local vers S3.
+"""
+import hashlib
+import os
+from datetime import datetime
+from config.settings import Config
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from services.upload_service import UploadService
+from utils.file_utils import FileUtils
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _flat_files(folder):
+    if not os.path.isdir(folder):
+        return []
+    return [entry for entry in os.scandir(folder)
+            if entry.is_file() and FileUtils._is_image_file(entry.name)]
+
+
+def migrate_blobs():
+    moved = 0
+    if not os.path.isdir(Config.BLOB_FOLDER):
+        return moved
+    blobs = StorageService.blobs()
+    for shard in os.scandir(Config.BLOB_FOLDER):
+        if not (shard.is_dir() and len(shard.name) == 2):
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.is_file() and FileUtils._is_image_file(entry.name):
+                blobs.save_file(entry.name, entry.path, move=True)
+                moved += 1
+    return moved
+
+
+def migrate_uploads():
+    indexed = 0
+    for entry in _flat_files(Config.UPLOAD_FOLDER):
+        if IndexService.get_upload(entry.name) is not None:
+            # Ancien lien physique vers un blob déjà indexé
+            os.remove(entry.path)
+            continue
+        # Conserver la date d'upload d'origine
+        upload_time = datetime.fromtimestamp(entry.stat().st_mtime).isoformat()
+        UploadService._store_upload(entry.path, _hash_file(entry.path), entry.name, entry.name)
+        with IndexService.transaction() as conn:
+            conn.execute('UPDATE uploads SET upload_time = ? WHERE filename = ?', (upload_time, entry.name))
+        indexed += 1
+    return indexed
+
+
+def migrate_processed():
+    moved = 0
+    processed = StorageService.processed()
+    for entry in _flat_files(Config.PROCESSED_FOLDER):
+        processed.save_file(entry.name, entry.path, move=True)
+        moved += 1
+    return moved
+
+
+if __name__ == '__main__':
+    print(f"Backend cible : {Config.STORAGE_BACKEND}")
+    print(f"Blobs déplacés : {migrate_blobs()}")
+    print(f"Uploads indexés : {migrate_uploads()}")
+    print(f"Images traitées déplacées : {migrate_processed()}")
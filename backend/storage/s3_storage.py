@@ -0,0 +1,88 @@
+from storage.base import StorageBackend, check_key, shard_prefix
+
+
+class S3Storage(StorageBackend):
+    """Stockage objet compatible S3 (AWS S3, MinIO, Ceph...).
+
+    ``endpoint_url`` permet de viser un service local pour les tests, par
+    exemple MinIO (``http://localhost:9000``) ou ``moto_server``. Les clés sont
+    préfixées par l'espace de noms puis shardées comme sur disque pour
+    répartir la charge entre partitions.
+    """
+
+    name = 's3'
+
+    def __init__(self, bucket, prefix, endpoint_url=None, region=None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("Le backend S3 nécessite boto3 (pip install boto3)") from None
+            client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{shard_prefix(check_key(key))}/{key}"
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        return self._require_head(key)['ContentLength']
+
+    def mtime(self, key):
+        return self._require_head(key)['LastModified'].timestamp()
+
+    def stat(self, key):
+        head = self._require_head(key)
+        return head['ContentLength'], head['LastModified'].timestamp()
+
+    def open(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key) from None
+        return response['Body']
+
+    def write(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def save_file(self, key, path, move=False):
+        self.client.upload_file(path, self.bucket, self._object_key(key))
+
+    def save_stream(self, key, stream, block_size=1024 * 1024):
+        self.client.upload_fileobj(stream, self.bucket, self._object_key(key))
+
+    def delete(self, key):
+        if not self.exists(key):
+            return False
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    def copy(self, src_key, dst_key):
+        # Copie côté serveur : les octets ne transitent pas par l'API
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self._object_key(dst_key),
+            CopySource={'Bucket': self.bucket, 'Key': self._object_key(src_key)})
+
+    def iter_keys(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/"):
+            for item in page.get('Contents', []):
+                yield item['Key'].rsplit('/', 1)[-1]
+
+    def _require_head(self, key):
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head
@@ -20,6 +20,15 @@ def handle_validation_error(errors):
         'details': errors
     }), 400
 
+def handle_overloaded(retry_after):
+    """Délestage : le serveur est saturé, le client doit réessayer plus tard"""
+    response = jsonify({
+        'error': 'Serveur surchargé, réessayez plus tard',
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 503
+
 def handle_file_not_found():
     """Gestionnaire pour fichier non trouvé"""
     return jsonify({
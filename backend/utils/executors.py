@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import anyio
+from config.settings import Config
+from utils.lifecycle import on_shutdown
+from utils import metrics, shared_arrays
+
+_cpu_executor = None
+_lock = threading.Lock()
+
+
+def cpu_executor():
+    """Pool partagé pour le calcul OpenCV de la couche asynchrone.
+
+    'thread' par défaut : OpenCV et numpy libèrent le GIL et l'index SQLite
+    reste partagé. 'process' isole les traitements qui ne le libèrent pas
+    (PIL, boucles Python) au prix de la sérialisation des arguments
+    (run_cpu_image fait passer les images par la mémoire partagée).
+    """
+    global _cpu_executor
+    with _lock:
+        if _cpu_executor is None:
+            if Config.ASYNC_CPU_EXECUTOR == 'process':
+                _cpu_executor = ProcessPoolExecutor(max_workers=Config.ASYNC_CPU_WORKERS)
+            else:
+                _cpu_executor = ThreadPoolExecutor(
+                    max_workers=Config.ASYNC_CPU_WORKERS, thread_name_prefix='cpu')
+            on_shutdown(shutdown_cpu_executor)
+        return _cpu_executor
+
+
+def shutdown_cpu_executor():
+    global _cpu_executor
+    with _lock:
+        executor, _cpu_executor = _cpu_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Exécute un traitement coûteux hors de la boucle d'événements"""
+    loop = asyncio.get_running_loop()
+    metrics.jobs_in_flight.labels('cpu_executor').inc()
+    try:
+        return await loop.run_in_executor(cpu_executor(), partial(func, *args, **kwargs))
+    finally:
+        metrics.jobs_in_flight.labels('cpu_executor').dec()
+
+
+async def run_cpu_image(func, img, *args, result_nbytes=0):
+    """run_cpu pour func(img, *args) : en mode 'process', l'image passe par la mémoire partagée.
+
+    result_nbytes réserve un segment pour un résultat ndarray (retourné comme
+    vue sur ce segment) ; sinon, ou s'il n'y tient pas, le résultat est sérialisé.
+    """
+    if Config.ASYNC_CPU_EXECUTOR != 'process':
+        return await run_cpu(func, img, *args)
+    slabs = shared_arrays.pool()
+    source, source_ref = slabs.put(img)
+    target = slabs.lease(result_nbytes) if result_nbytes else None
+    # Le worker écrit dans les segments jusqu'à la fin du calcul, même si le client part
+    with anyio.CancelScope(shield=True):
+        try:
+            result = await run_cpu(shared_arrays.call, func, source_ref,
+                                   target and target.name, target.size if target else 0, *args)
+        except BaseException:
+            if target is not None:
+                slabs.release(target)
+            raise
+        finally:
+            slabs.release(source)
+    if isinstance(result, shared_arrays.SharedRef):
+        return slabs.wrap(target, result)
+    if target is not None:
+        slabs.release(target)
+    return result
+
+
+async def run_io(func, *args, **kwargs):
+    """Exécute un appel bloquant court (index, stockage) dans le pool de threads d'anyio"""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs))
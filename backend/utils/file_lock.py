@@ -0,0 +1,46 @@
+"""Verrou exclusif nommé par un fichier, entre threads et processus.
+
+Sous Unix, ``fcntl.flock`` sur le fichier (workers gunicorn / uvicorn). Sous
+Windows, seul start_server.py est disponible (un processus) : verrous de
+threads répartis par chemin, sans toucher au fichier, qui peut donc être
+supprimé pendant que le verrou est tenu.
+"""
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_STRIPES = [threading.Lock() for _ in range(64)]
+
+
+@contextmanager
+def locked(path, blocking=True, create=True):
+    """Fournit True une fois le verrou obtenu, False s'il est déjà pris (blocking=False)
+
+    Sans create, le fichier doit exister (FileNotFoundError sinon).
+    """
+    if fcntl is None:
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError(path)
+        lock = _STRIPES[zlib.crc32(os.path.abspath(path).encode()) % len(_STRIPES)]
+        if not lock.acquire(blocking):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            lock.release()
+        return
+
+    with open(path, 'a' if create else 'rb') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
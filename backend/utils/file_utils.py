@@ -1,7 +1,19 @@
+import mimetypes
 import os
-from datetime import datetime
+from flask import Response, request, send_file
+from urllib.parse import quote
+from werkzeug.http import parse_date, parse_etags
 from config.settings import Config
 from services.upload_service import UploadService
+from services.index_service import IndexService
+from services.storage_service import StorageService
+from services.lineage_service import LineageService
+from services.stats_service import StatsService
+from services.tile_service import TileService
+
+# Une URL versionnée (?v=<etag>) désigne un contenu qui ne changera jamais
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
 
 class FileUtils:
     @staticmethod
@@ -9,38 +21,128 @@ class FileUtils:
         """Récupère la liste des images uploadées avec métadonnées"""
         images = []
         
-        if not os.path.exists(Config.UPLOAD_FOLDER):
-            return images
-        
-        for filename in os.listdir(Config.UPLOAD_FOLDER):
-            if FileUtils._is_image_file(filename):
-                filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-                # Réutiliser la méthode existante (DRY)
-                metadata = UploadService._extract_metadata(filepath)
-                if metadata:
-                    # Ajouter le timestamp
-                    metadata['upload_time'] = datetime.fromtimestamp(
-                        os.path.getmtime(filepath)
-                    ).isoformat()
-                    
-                    images.append({
-                        'filename': filename,
-                        'metadata': metadata
-                    })
+        # Lecture de l'index : aucun parcours de répertoire ni ouverture de fichier
+        for upload in IndexService.list_uploads():
+            metadata = dict(upload['metadata'])
+            metadata['upload_time'] = upload['upload_time']
+            images.append({
+                'filename': upload['filename'],
+                'version': upload['hash'],  # ?v=version : réponse cachée sans revalidation
+                'metadata': metadata
+            })
         
-        return sorted(images, key=lambda x: x['metadata']['upload_time'], reverse=True)
+        return images
     
     @staticmethod
     def delete_image(filename):
-        """Supprime une image uploadée"""
-        filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            return True
+        """Supprime une image uploadée (le contenu n'est effacé qu'à la dernière référence)"""
+        backend, key = StorageService.resolve_upload(filename)
+        if backend is None:
+            return False
+        
+        if backend is StorageService.legacy_uploads():
+            TileService.purge(backend, key)
+            return backend.delete(key)
+        
+        with IndexService.transaction() as conn:
+            blob = IndexService.remove_upload(conn, filename)
+            purge = blob is not None and blob['refcount'] <= 0
+            if purge:
+                backend.delete(key)
+                IndexService.delete_blob(conn, blob['hash'])
+                StatsService.forget(conn, blob['hash'])
+        if purge:
+            TileService.purge(backend, key)
+        
+        # Les images traitées issues de ce nom disparaissent avec lui
+        LineageService.delete_derived_from(filename)
+        return True
+    
+    @staticmethod
+    def stored_validators(backend, key):
+        """(ETag, date de modification, taille) d'un fichier stocké.
+
+        Les blobs sont nommés par le hash de leur contenu : c'est leur ETag.
+        Ailleurs (images traitées, anciens uploads), taille + date suffisent.
+        """
+        size, mtime = backend.stat(key)
+        if backend.namespace == 'blobs':
+            etag = os.path.splitext(key)[0]
+        else:
+            etag = f"{size:x}-{int(mtime * 1e6):x}"
+        return etag, mtime, size
+
+    @staticmethod
+    def cache_control(etag, version):
+        return IMMUTABLE_CACHE_CONTROL if version and version == etag else REVALIDATE_CACHE_CONTROL
+
+    @staticmethod
+    def not_modified(etag, mtime, if_none_match, if_modified_since):
+        """Le client a déjà cette version (If-None-Match prime sur If-Modified-Since)"""
+        if if_none_match:
+            return parse_etags(if_none_match).contains_weak(etag)
+        if if_modified_since:
+            since = parse_date(if_modified_since)
+            return since is not None and int(mtime) <= since.timestamp()
         return False
+
+    @staticmethod
+    def offload_target(path):
+        """(en-tête, valeur) qui confie l'envoi de path au proxy inverse, ou None"""
+        if Config.FILE_OFFLOAD == 'x-sendfile':
+            return 'X-Sendfile', os.path.abspath(path)
+        if Config.FILE_OFFLOAD == 'x-accel-redirect':
+            relative = os.path.relpath(os.path.abspath(path), os.path.abspath(Config.ACCEL_REDIRECT_ROOT))
+            if relative.startswith('..'):
+                return None  # hors de la location interne : envoyé par le worker
+            uri = Config.ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative.replace(os.sep, '/')
+            return 'X-Accel-Redirect', quote(uri)
+        return None
+
+    @staticmethod
+    def send_stored(backend, key, as_attachment=False, download_name=None):
+        """Envoie un fichier stocké avec ETag, 304 et requêtes Range"""
+        download_name = download_name or key
+        etag, mtime, size = FileUtils.stored_validators(backend, key)
+        cache_control = FileUtils.cache_control(etag, request.args.get('v'))
+
+        # Revalidation : rien n'est ouvert ni lu
+        if FileUtils.not_modified(etag, mtime, request.headers.get('If-None-Match'),
+                                  request.headers.get('If-Modified-Since')):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.last_modified = mtime
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        path = backend.local_path(key)
+        target = FileUtils.offload_target(path) if path is not None else None
+        if target is not None:
+            # Le proxy envoie le fichier (et gère Range) : le worker est libéré aussitôt
+            response = Response(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+            response.headers[target[0]] = target[1]
+            response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                                 filename=download_name)
+            response.set_etag(etag)
+            response.last_modified = mtime
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        # Directement depuis le disque quand c'est possible
+        response = send_file(
+            path if path is not None else backend.open(key),
+            mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+            as_attachment=as_attachment,
+            download_name=download_name,
+            last_modified=mtime,
+            etag=etag,
+            conditional=False
+        )
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response.make_conditional(request, accept_ranges=True, complete_length=size)
     
     @staticmethod
     def _is_image_file(filename):
         return ('.' in filename and 
-                filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS)
-    
+                filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS)
\ No newline at end of file
@@ -0,0 +1,24 @@
+import threading
+
+_callbacks = []
+_lock = threading.Lock()
+
+
+def on_shutdown(callback):
+    """Enregistre une fonction à appeler à l'arrêt du processus (pools, threads de fond)"""
+    with _lock:
+        if callback not in _callbacks:
+            _callbacks.append(callback)
+    return callback
+
+
+def shutdown():
+    """Arrêt propre : attend la fin des travaux en cours, dans l'ordre inverse d'enregistrement"""
+    with _lock:
+        callbacks = list(reversed(_callbacks))
+        _callbacks.clear()
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"[SHUTDOWN] Erreur dans {getattr(callback, '__qualname__', callback)}: {e}")
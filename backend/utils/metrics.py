@@ -0,0 +1,179 @@
+"""Métriques Prometheus du service (exposées par GET /api/metrics).
+
+Sous gunicorn (serve.py), PROMETHEUS_MULTIPROC_DIR est défini avant l'import
+de prometheus_client : chaque worker écrit ses valeurs dans ce dossier et
+l'endpoint agrège tous les workers. Sinon le registre du processus est servi.
+
+Les phases d'un traitement sont mesurées par ``operation()`` (contexte
+englobant) et ``phase()`` (decode / encode / write à l'intérieur) ; le temps
+restant est compté comme 'compute'.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess, REGISTRY)
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+http_requests = Counter(
+    'http_requests_total', 'Requêtes HTTP traitées', ['route', 'method', 'status'])
+http_latency = Histogram(
+    'http_request_duration_seconds', 'Durée des requêtes HTTP (jusqu\'au premier octet)',
+    ['route', 'method'], buckets=LATENCY_BUCKETS)
+http_in_flight = Gauge(
+    'http_requests_in_flight', 'Requêtes en cours', multiprocess_mode='livesum')
+worker_busy = Counter(
+    'worker_busy_seconds_total', 'Temps passé à servir des requêtes (utilisation = rate / threads)')
+worker_threads = Gauge(
+    'worker_threads', 'Threads de service par worker', multiprocess_mode='livesum')
+
+operation_latency = Histogram(
+    'processing_phase_duration_seconds', 'Durée des traitements par opération et par phase',
+    ['operation', 'phase'], buckets=LATENCY_BUCKETS)
+megapixels_processed = Counter(
+    'processing_megapixels_total', 'Mégapixels décodés pour traitement', ['operation'])
+bytes_read = Counter(
+    'image_bytes_read_total', 'Octets d\'images lus', ['source'])
+bytes_written = Counter(
+    'image_bytes_written_total', 'Octets d\'images écrits', ['target'])
+cache_requests = Counter(
+    'cache_requests_total', 'Accès aux caches (ratio = hit / total)', ['cache', 'result'])
+
+queue_depth = Gauge(
+    'job_queue_depth', 'Travaux en attente', ['queue'], multiprocess_mode='livesum')
+jobs_in_flight = Gauge(
+    'jobs_in_flight', 'Travaux en cours', ['queue'], multiprocess_mode='livesum')
+admission_rejected = Counter(
+    'admission_rejected_total', 'Requêtes refusées par le contrôle d\'admission (503)', ['priority'])
+shm_bytes = Gauge(
+    'shared_memory_bytes', 'Segments de mémoire partagée du pool de calcul', ['state'],
+    multiprocess_mode='livesum')
+shm_reclaimed = Counter(
+    'shared_memory_reclaimed_total', 'Segments partagés récupérés (non rendus ou orphelins)')
+
+_local = threading.local()
+
+
+def cache_hit(cache, hit):
+    cache_requests.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+class _Operation:
+    def __init__(self, name):
+        self.name = name
+        self.phases = {}
+        self.active = set()
+        self.megapixels = 0.0
+
+
+@contextmanager
+def operation(name):
+    """Mesure un traitement complet ; les phases imbriquées sont décomptées du calcul.
+
+    Rien n'est enregistré si le traitement échoue ou n'a rien décodé (opération
+    inconnue) : les noms venant des clients ne créent pas de séries.
+    """
+    outer = getattr(_local, 'operation', None)
+    current = _local.operation = _Operation(name)
+    start = time.perf_counter()
+    succeeded = False
+    try:
+        yield
+        succeeded = True
+    finally:
+        total = time.perf_counter() - start
+        _local.operation = outer
+        if succeeded and 'decode' in current.phases:
+            for phase_name, duration in current.phases.items():
+                operation_latency.labels(name, phase_name).observe(duration)
+            compute = max(0.0, total - sum(current.phases.values()))
+            operation_latency.labels(name, 'compute').observe(compute)
+            operation_latency.labels(name, 'total').observe(total)
+            megapixels_processed.labels(name).inc(current.megapixels)
+
+            trace = getattr(_local, 'trace', None)
+            if trace is not None and outer is None:
+                for phase_name, duration in current.phases.items():
+                    trace[phase_name] = trace.get(phase_name, 0.0) + duration
+                trace['compute'] = trace.get('compute', 0.0) + compute
+
+
+@contextmanager
+def phase(name):
+    """Phase d'un traitement (decode, encode, write...).
+
+    Hors de operation(), la durée ne va que dans la trace de la requête
+    (Server-Timing) si elle est active.
+    """
+    current = getattr(_local, 'operation', None)
+    if current is None:
+        trace = getattr(_local, 'trace', None)
+        if trace is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace[name] = trace.get(name, 0.0) + time.perf_counter() - start
+        return
+
+    if name in current.active:
+        yield  # phase déjà mesurée par un bloc englobant
+        return
+    current.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.active.discard(name)
+        current.phases[name] = current.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def start_trace():
+    """Collecte les durées par phase des traitements du thread courant"""
+    _local.trace = {}
+
+
+def stop_trace():
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    return trace or {}
+
+
+def decoded(img, size_bytes, source):
+    """Image source décodée : octets lus et mégapixels du traitement en cours"""
+    bytes_read.labels(source).inc(size_bytes)
+    current = getattr(_local, 'operation', None)
+    if img is not None and current is not None:
+        current.megapixels += img.shape[0] * img.shape[1] / 1e6
+
+
+def encoded(size_bytes, target):
+    bytes_written.labels(target).inc(size_bytes)
+
+
+def request_started():
+    http_in_flight.inc()
+    return time.perf_counter()
+
+
+def request_finished(start, route, method, status):
+    """Latence et utilisation d'un worker pour une requête"""
+    duration = time.perf_counter() - start
+    http_in_flight.dec()
+    worker_busy.inc(duration)
+    http_latency.labels(route, method).observe(duration)
+    http_requests.labels(route, method, str(status)).inc()
+
+
+def export():
+    """Texte au format d'exposition Prometheus, agrégé sur les workers si besoin"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,150 @@
+"""Profilage des requêtes à la demande et échantillonné.
+
+- ``?profile=1`` (administrateur) : en-tête ``Server-Timing`` avec la durée
+  de chaque phase (decode, compute, encode, serialize, json...) et profil
+  cProfile enregistré, référencé par l'en-tête ``X-Profile-Id``
+- ``?profile=memory`` : en plus, pic mémoire mesuré par tracemalloc
+- hors de toute demande, une fraction ``PROFILE_SAMPLE_RATE`` des requêtes est
+  profilée ; celles qui dépassent ``SLOW_REQUEST_SECONDS`` sont écrites dans
+  ``PROFILE_FOLDER`` (consultables via /api/admin/profiles)
+
+Un seul profil cProfile à la fois par processus : une requête profilée
+pendant qu'une autre l'est déjà n'a que ``Server-Timing``, sans profil.
+
+L'accès administrateur se fait par l'en-tête ``X-Admin-Token`` égal à
+``Config.ADMIN_TOKEN`` ; sans jeton configuré, seul le mode debug l'autorise.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from config.settings import Config
+from utils import metrics
+
+_tracemalloc_lock = threading.Lock()
+# Python 3.12+ : un seul profileur actif par processus (ValueError sinon)
+_cprofile_lock = threading.Lock()
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}_[0-9a-f]{8}$')
+
+
+def is_admin(request, debug=False):
+    if not Config.ADMIN_TOKEN:
+        return debug
+    token = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode())
+
+
+class RequestProfile:
+    """Profilage d'une requête (créé au début, terminé avant l'envoi de la réponse)"""
+
+    def __init__(self, requested, memory=False):
+        self.requested = requested
+        self.start = time.perf_counter()
+        # Une autre requête est déjà profilée : phases (Server-Timing) seulement
+        self.profiler = cProfile.Profile() if _cprofile_lock.acquire(blocking=False) else None
+        self.memory = memory and _tracemalloc_lock.acquire(blocking=False)
+        if self.memory:
+            tracemalloc.start()
+        metrics.start_trace()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def finish(self, route, method):
+        """Arrête les mesures, retourne les en-têtes à ajouter à la réponse"""
+        if self.profiler is not None:
+            self.profiler.disable()
+            _cprofile_lock.release()
+        duration = time.perf_counter() - self.start
+        phases = metrics.stop_trace()
+        peak = None
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            _tracemalloc_lock.release()
+
+        headers = {}
+        slow = duration >= Config.SLOW_REQUEST_SECONDS
+        if self.profiler is not None and (self.requested or slow):
+            profile_id = save_profile(self.profiler, route, method, duration, phases, peak)
+            if self.requested:
+                headers['X-Profile-Id'] = profile_id
+        if self.requested:
+            headers['Server-Timing'] = server_timing(phases, duration, peak)
+        return headers
+
+
+def begin(request, debug=False):
+    """RequestProfile si la requête doit être profilée, sinon None"""
+    mode = request.args.get('profile')
+    if mode and is_admin(request, debug):
+        return RequestProfile(True, memory=(mode == 'memory'))
+    if Config.PROFILE_SAMPLE_RATE and random.random() < Config.PROFILE_SAMPLE_RATE:
+        return RequestProfile(False)
+    return None
+
+
+def server_timing(phases, duration, peak=None):
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items()]
+    entries.append(f"total;dur={duration * 1000:.2f}")
+    if peak is not None:
+        entries.append(f'mem;desc="peak {peak / (1024 * 1024):.1f}MB"')
+    return ', '.join(entries)
+
+
+def save_profile(profiler, route, method, duration, phases, peak=None):
+    """Écrit le profil (.prof pour pstats/snakeviz, .txt lisible), retourne son identifiant"""
+    os.makedirs(Config.PROFILE_FOLDER, exist_ok=True)
+    profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    base = os.path.join(Config.PROFILE_FOLDER, profile_id)
+    profiler.dump_stats(f"{base}.prof")
+
+    summary = io.StringIO()
+    summary.write(f"{method} {route}  {duration * 1000:.1f} ms\n")
+    if phases:
+        summary.write('phases: ' + ', '.join(f"{k}={v * 1000:.1f}ms" for k, v in phases.items()) + '\n')
+    if peak is not None:
+        summary.write(f"tracemalloc peak: {peak / (1024 * 1024):.1f} MB\n")
+    summary.write('\n')
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(Config.PROFILE_TOP_FUNCTIONS)
+    with open(f"{base}.txt", 'w') as f:
+        f.write(summary.getvalue())
+
+    _prune()
+    return profile_id
+
+
+def list_profiles():
+    if not os.path.isdir(Config.PROFILE_FOLDER):
+        return []
+    ids = sorted((name[:-4] for name in os.listdir(Config.PROFILE_FOLDER) if name.endswith('.txt')),
+                 reverse=True)
+    return ids
+
+
+def read_profile(profile_id):
+    """Résumé texte d'un profil, None si l'identifiant est inconnu"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(Config.PROFILE_FOLDER, f"{profile_id}.txt")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def _prune():
+    # Garder les PROFILE_MAX_FILES profils les plus récents
+    for profile_id in list_profiles()[Config.PROFILE_MAX_FILES:]:
+        for ext in ('.txt', '.prof'):
+            try:
+                os.remove(os.path.join(Config.PROFILE_FOLDER, profile_id + ext))
+            except FileNotFoundError:
+                pass
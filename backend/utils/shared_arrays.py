@@ -0,0 +1,274 @@
+"""Transport des tableaux numpy entre le processus de service et le pool de calcul.
+
+Au lieu d'être sérialisés (pickle) à chaque appel, l'image d'entrée et le
+résultat passent par des segments ``multiprocessing.shared_memory`` : seule une
+référence (nom, forme, type) traverse le pipe du pool. Les segments sont
+alloués par classes de taille (puissances de deux) et réutilisés d'une requête
+à l'autre ; un worker n'ouvre donc chaque segment qu'une fois.
+
+Un worker garde ses segments ouverts, au plus ``SHM_POOL_BYTES`` octets ; les
+références portent la génération du pool (nombre de segments supprimés) :
+quand elle change, le worker ferme ses segments supprimés, dont la mémoire
+resterait sinon retenue dans /dev/shm.
+
+Fuites : un segment prêté depuis plus de ``SHM_LEASE_TIMEOUT`` secondes est
+retiré du pool et supprimé, et au démarrage les segments laissés par un
+processus disparu (même préfixe, pid mort) sont supprimés de /dev/shm.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from multiprocessing import shared_memory
+import numpy as np
+from config.settings import Config
+from utils.lifecycle import on_shutdown
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'ipp_'
+MIN_SLAB_SIZE = 1024 * 1024
+SHM_DIR = '/dev/shm'
+
+SharedRef = namedtuple('SharedRef', ['name', 'shape', 'dtype', 'generation'], defaults=(0,))
+
+
+class SlabPool:
+    """Segments de mémoire partagée réutilisables, par classe de taille"""
+
+    def __init__(self, max_idle_bytes, lease_timeout):
+        self.max_idle_bytes = max_idle_bytes
+        self.lease_timeout = lease_timeout
+        self._lock = threading.Lock()
+        self._free = {}  # taille -> [segments]
+        self._leases = {}  # nom -> (segment, échéance)
+        self._abandoned = []  # segments récupérés encore référencés (fermés plus tard)
+        self._idle_bytes = 0
+        self._counter = 0
+        self.generation = 0  # incrémentée à chaque segment supprimé
+
+    @staticmethod
+    def size_class(nbytes):
+        return max(MIN_SLAB_SIZE, 1 << (max(1, nbytes) - 1).bit_length())
+
+    def lease(self, nbytes):
+        """Segment d'au moins nbytes octets, à rendre avec release()"""
+        self.reclaim()
+        size = self.size_class(nbytes)
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                block = free.pop()
+                self._idle_bytes -= size
+            else:
+                self._counter += 1
+                block = None
+            name = f"{PREFIX}{os.getpid()}_{self._counter}"
+        if block is None:
+            block = shared_memory.SharedMemory(name=name, create=True, size=size)
+        with self._lock:
+            self._leases[block.name] = (block, time.monotonic() + self.lease_timeout)
+        self._update_metrics()
+        return block
+
+    def release(self, block):
+        """Rend un segment au pool (supprimé si le pool inactif est plein ou s'il a été récupéré)"""
+        with self._lock:
+            if self._leases.pop(block.name, None) is None:
+                return  # déjà récupéré comme fuite
+            size = block.size
+            keep = self._idle_bytes + size <= self.max_idle_bytes
+            if keep:
+                self._free.setdefault(size, []).append(block)
+                self._idle_bytes += size
+        if not keep:
+            self._destroy(block)
+        self._update_metrics()
+
+    def put(self, array):
+        """Copie un tableau dans un segment prêté, retourne (segment, référence)"""
+        array = np.asarray(array)
+        block = self.lease(array.nbytes)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        return block, SharedRef(block.name, array.shape, array.dtype.str, self.generation)
+
+    def wrap(self, block, ref):
+        """Tableau lu directement dans le segment, rendu au pool quand le tableau est libéré"""
+        array = np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=block.buf)
+        weakref.finalize(array, self.release, block)
+        return array
+
+    def reclaim(self):
+        """Supprime les segments prêtés depuis plus de lease_timeout, retourne leur nombre"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [name for name, (_, deadline) in self._leases.items() if deadline < now]
+            blocks = [self._leases.pop(name)[0] for name in expired]
+            abandoned, self._abandoned = self._abandoned, []
+        for block in blocks:
+            logger.warning(f"Segment partagé {block.name} non rendu après {self.lease_timeout}s, supprimé")
+            metrics.shm_reclaimed.inc()
+            self._destroy(block)
+        for block in abandoned:
+            self._close(block)
+        if blocks:
+            self._update_metrics()
+        return len(blocks)
+
+    def close(self):
+        """Supprime tous les segments (arrêt du processus)"""
+        with self._lock:
+            blocks = [block for free in self._free.values() for block in free]
+            blocks += [block for block, _ in self._leases.values()]
+            self._free, self._leases, self._idle_bytes = {}, {}, 0
+        for block in blocks:
+            self._destroy(block)
+        self._update_metrics()
+
+    def stats(self):
+        with self._lock:
+            leased = sum(block.size for block, _ in self._leases.values())
+            return {'leased_segments': len(self._leases), 'leased_bytes': leased,
+                    'idle_segments': sum(len(free) for free in self._free.values()),
+                    'idle_bytes': self._idle_bytes}
+
+    def _destroy(self, block):
+        # unlink libère le nom ; la mémoire reste valide pour les vues encore ouvertes
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.generation += 1
+        self._close(block)
+
+    def _close(self, block):
+        try:
+            block.close()
+        except BufferError:
+            with self._lock:
+                self._abandoned.append(block)  # un tableau le référence encore
+
+    def _update_metrics(self):
+        stats = self.stats()
+        metrics.shm_bytes.labels('leased').set(stats['leased_bytes'])
+        metrics.shm_bytes.labels('idle').set(stats['idle_bytes'])
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    """Pool de segments du processus, créé au premier usage"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            sweep_orphans()
+            _pool = SlabPool(Config.SHM_POOL_BYTES, Config.SHM_LEASE_TIMEOUT)
+            on_shutdown(close_pool)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        current, _pool = _pool, None
+    if current is not None:
+        current.close()
+
+
+def sweep_orphans():
+    """Supprime les segments dont le processus propriétaire n'existe plus, retourne leur nombre"""
+    if not os.path.isdir(SHM_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(SHM_DIR):
+        if not name.startswith(PREFIX):
+            continue
+        try:
+            pid = int(name[len(PREFIX):].split('_')[0])
+        except ValueError:
+            continue
+        if _alive(pid):
+            continue
+        try:
+            os.remove(os.path.join(SHM_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.warning(f"{removed} segment(s) partagé(s) orphelin(s) supprimé(s)")
+        metrics.shm_reclaimed.inc(removed)
+    return removed
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Côté worker : segments ouverts une fois, gardés tant qu'ils servent (LRU borné en octets)
+_attached = OrderedDict()
+_attached_bytes = 0
+_generation = 0
+
+
+def _attach(name):
+    global _attached_bytes
+    block = _attached.get(name)
+    if block is None:
+        # Le suivi des ressources est partagé avec le processus principal, qui supprime le segment
+        block = _attached[name] = shared_memory.SharedMemory(name=name)
+        _attached_bytes += block.size
+        while _attached_bytes > Config.SHM_POOL_BYTES and len(_attached) > 1:
+            _detach(next(iter(_attached)))
+    else:
+        _attached.move_to_end(name)
+    return block
+
+
+def _detach(name):
+    global _attached_bytes
+    block = _attached.pop(name)
+    _attached_bytes -= block.size
+    try:
+        block.close()
+    except BufferError:
+        pass
+
+
+def _detach_destroyed(generation):
+    """Ferme les segments supprimés par le processus principal depuis la dernière génération vue"""
+    global _generation
+    if generation == _generation:
+        return
+    _generation = generation
+    if not os.path.isdir(SHM_DIR):
+        return  # pas de /dev/shm : seule la borne en octets s'applique
+    for name in [name for name in _attached if not os.path.exists(os.path.join(SHM_DIR, name))]:
+        _detach(name)
+
+
+def attach(ref):
+    """Tableau décrit par une référence, lu directement dans le segment"""
+    _detach_destroyed(ref.generation)
+    return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=_attach(ref.name).buf)
+
+
+def call(func, source, target, capacity, *args):
+    """Exécuté dans le worker : func(image, *args), résultat écrit dans target s'il y tient"""
+    result = func(attach(source), *args)
+    if target is not None and isinstance(result, np.ndarray) and result.nbytes <= capacity:
+        ref = SharedRef(target, result.shape, result.dtype.str)
+        attach(ref)[...] = result
+        return ref
+    return result